@@ -1,9 +1,37 @@
 import os
 import csv
-import time
-import google.genai as genai
+import json
+import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-client = genai.Client(api_key="Your Api Key")
+import metadata_store
+import paper_index
+from pdf_text import read_texts as read_pdf_texts
+from local_classifier import (LocalClassifier, paper_text, train_with_report, format_report, format_routing,
+                              DEFAULT_MARGIN)
+from annotation_cache import AnnotationCache, CACHE_FILENAME, format_stats as format_cache_stats
+from annotation_engine import (AnnotationEngine, GeminiClient, HttpLLMClient, RateLimitError, format_stats,
+                               estimate_tokens, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, MAX_IN_FLIGHT)
+from crawl_metrics import get_metrics, write_snapshot, format_summary
+
+# google.genai is imported and its client created on first use, so runs against --llm-url do not need it.
+genai = None
+client = None
+
+
+def gemini_client():
+    global genai, client
+    if client is None:
+        if genai is None:
+            try:
+                import google.genai as module
+            except ImportError:
+                raise RuntimeError("Annotating with Gemini requires google-genai (pip install google-genai)")
+            genai = module
+        client = genai.Client(api_key="Your Api Key")
+    return client
 
 ANNOTATION_LABELS = [
     "Deep Learning",
@@ -13,8 +41,20 @@ ANNOTATION_LABELS = [
     "Optimization"
 ]
 
-def call_gemini_api(title, abstract):
-    prompt = (
+# Bump whenever the prompt wording changes, so cached labels from the old prompt are not reused.
+PROMPT_VERSION = 1
+
+CHUNK_ROWS = 100          # Rows annotated, written and checkpointed together
+CHUNKS_IN_FLIGHT = 2
+
+NO_ABSTRACT = "No abstract available"   # What the page parsers put in rows without an abstract
+PDF_TEXT_CHARS = 1500     # Opening PDF text that stands in for a missing abstract
+
+BATCH_REPLY_TOKENS = 12   # Budgeted per paper for its entry in a batched reply
+MAX_BATCH_SIZE = 25
+
+def build_prompt(title, abstract):
+    return (
         "Classify the following research paper into EXACTLY ONE of these categories:\n"
         "1. Deep Learning\n"
         "2. Computer Vision\n"
@@ -27,56 +67,326 @@ def call_gemini_api(title, abstract):
         "Do NOT include numbers, explanations, or any other text. "
         "Your response must be ONLY ONE of these five options."
     )
-    
-    # Added retry mechanism with timeout
-    max_retries = 3  
-    for attempt in range(max_retries):
-        try:
-            response = client.models.generate_content(contents=prompt, model='gemini-2.0-flash-001')
-            label = response.text.strip()
-            return label
-        except Exception as e:
-            if "quota" in str(e).lower() or "exhausted" in str(e).lower():
-                print(f"\nExhausted: Pausing for 20 seconds before retrying (attempt {attempt + 1}/{max_retries})")
-                time.sleep(20)  # 20-second timeout
+
+def build_batch_prompt(papers):
+    """One prompt classifying several (title, abstract) pairs; the reply is a JSON array of labels."""
+    categories = "".join(f"{i}. {label}\n" for i, label in enumerate(ANNOTATION_LABELS, 1))
+    blocks = "".join(f"Paper {i}:\nTitle: {title}\nAbstract: {abstract}\n\n"
+                     for i, (title, abstract) in enumerate(papers, 1))
+    return (
+        "Classify each of the following research papers into EXACTLY ONE of these categories:\n"
+        f"{categories}\n"
+        f"{blocks}"
+        "Respond ONLY with a JSON array holding one object per paper, in order, like "
+        '[{"id": 1, "label": "Deep Learning"}, {"id": 2, "label": "Optimization"}]. '
+        "Each label must be the exact category name from the list above. "
+        "Do NOT include explanations or any other text."
+    )
+
+def parse_batch_reply(text, count):
+    """Returns the labels of a batched reply in paper order; raises ValueError unless every paper got a valid label."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").strip()
+        if text.startswith("json"):
+            text = text[4:]
+    try:
+        entries = json.loads(text)
+        if not isinstance(entries, list) or len(entries) != count:
+            raise ValueError(f"expected {count} entries")
+        labels = [None] * count
+        for entry in entries:
+            index = int(entry["id"]) - 1
+            label = str(entry["label"]).strip()
+            if not 0 <= index < count or labels[index] is not None:
+                raise ValueError(f"unexpected paper id {entry['id']}")
+            if label not in ANNOTATION_LABELS:
+                raise ValueError(f"invalid label {label!r}")
+            labels[index] = label
+        return labels
+    except (KeyError, TypeError, json.JSONDecodeError) as e:
+        raise ValueError(str(e))
+
+def plan_batches(papers, batch_tokens, max_batch_size=MAX_BATCH_SIZE):
+    """Groups consecutive paper indices so each batch prompt stays within batch_tokens."""
+    overhead = estimate_tokens(build_batch_prompt([]), 0)
+    batches, current, used = [], [], overhead
+    for i, (title, abstract) in enumerate(papers):
+        cost = estimate_tokens(f"Paper {i}:\nTitle: {title}\nAbstract: {abstract}\n\n", BATCH_REPLY_TOKENS)
+        if current and (used + cost > batch_tokens or len(current) >= max_batch_size):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def reply_error_label(reply, title):
+    if isinstance(reply, RateLimitError):
+        return "Unknown(API Exhausted)"
+    print(f"Error calling Gemini API for paper '{title}': {reply}")
+    return "Unknown(Gemini API Error)"
+
+def classify_batched(papers, engine, batch_tokens, max_batch_size=MAX_BATCH_SIZE):
+    """Classifies papers in token-budgeted batches; a batch whose reply doesn't validate is split and retried."""
+    labels = [None] * len(papers)
+    pending = {}
+
+    def submit(indices):
+        if len(indices) == 1:
+            future = engine.submit(build_prompt(*papers[indices[0]]))
+        else:
+            future = engine.submit(build_batch_prompt([papers[i] for i in indices]),
+                                   BATCH_REPLY_TOKENS * len(indices))
+        pending[future] = indices
+
+    for indices in plan_batches(papers, batch_tokens, max_batch_size):
+        submit(indices)
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            indices = pending.pop(future)
+            try:
+                reply = future.result()
+            except Exception as e:
+                for i in indices:
+                    labels[i] = reply_error_label(e, papers[i][0])
+                continue
+            if len(indices) == 1:
+                labels[indices[0]] = reply.strip()
                 continue
-            print(f"Error calling Gemini API for paper '{title}': {e}")
-            return "Unknown(Gemini API Error)"
-    return "Unknown(API Exhausted)"
+            try:
+                batch_labels = parse_batch_reply(reply, len(indices))
+            except ValueError as e:
+                print(f"Batch of {len(indices)} papers returned an invalid reply ({e}); splitting and retrying")
+                half = len(indices) // 2
+                submit(indices[:half])
+                submit(indices[half:])
+                continue
+            for i, label in zip(indices, batch_labels):
+                labels[i] = label
+    return labels
+
+def classify_papers(papers, engine, batch_tokens=0):
+    if batch_tokens:
+        return classify_batched(papers, engine, batch_tokens)
+    replies = engine.map([build_prompt(title, abstract) for title, abstract in papers])
+    return [reply_error_label(reply, title) if isinstance(reply, Exception) else reply.strip()
+            for (title, _), reply in zip(papers, replies)]
 
-def annotate_metadata_csv(csv_path):
-    updated_rows = []
-    with open(csv_path, "r", newline="", encoding="utf-8") as csvfile:
+def paper_abstract(row, texts=None):
+    """The row's abstract, or the start of its PDF's text (from pdf_text.py) when the page had none."""
+    abstract = (row.get("abstract") or "").strip()
+    if texts and (not abstract or abstract == NO_ABSTRACT) and texts.get(row.get("paper_url")):
+        return " ".join(texts[row["paper_url"]][:PDF_TEXT_CHARS].split())
+    return abstract
+
+def paper_fields(row, texts=None):
+    """The (title, abstract) a row is classified and cached by."""
+    return (row.get("title") or "").strip(), paper_abstract(row, texts)
+
+def annotate_rows(rows, engine, batch_tokens=0, cache=None, local_model=None, texts=None):
+    """Labels rows in place, running the model calls concurrently through the engine.
+
+    With batch_tokens set, several papers share each request (see classify_batched).
+    Papers found in the cache, or that the local model is confident about, are
+    not sent to the LLM at all. Local labels are not cached. texts maps
+    paper_url to extracted PDF text, used for papers without an abstract.
+    """
+    papers = [paper_fields(row, texts) for row in rows]
+    labels = cache.lookup(papers) if cache else {}
+    missing = [i for i in range(len(papers)) if i not in labels]
+    if local_model and missing:
+        confident = local_model.route([papers[i] for i in missing])
+        labels.update((missing[j], label) for j, label in confident.items())
+        missing = [i for i in missing if i not in labels]
+    fresh = classify_papers([papers[i] for i in missing], engine, batch_tokens) if missing else []
+    labels.update(zip(missing, fresh))
+    if cache:
+        cache.store([papers[i] for i in missing], fresh)
+    for i, row in enumerate(rows):
+        row["annotation"] = labels[i]
+        print(f"Annotated paper '{row.get('title')}' as '{labels[i]}'.")
+
+def read_annotated_rows(base_dir, year):
+    """Returns a year's rows (title, abstract, paper_url, annotation) from its Parquet partition or metadata.csv."""
+    if os.path.exists(metadata_store.year_path(base_dir, year)):
+        columns = ["title", "abstract", "paper_url", "annotation"]
+        return metadata_store.load_year(base_dir, year, columns=columns).to_pylist()
+    csv_path = os.path.join(base_dir, str(year), "metadata.csv")
+    return metadata_store.read_csv_rows(csv_path) if os.path.exists(csv_path) else []
+
+def import_annotations(base_dir, year, cache, texts=None):
+    """Seeds the cache with the labels already present in a year's metadata file, keyed like annotate_rows."""
+    return cache.import_rows(read_annotated_rows(base_dir, year), lambda row: paper_fields(row, texts))
+
+def train_local_model(base_dir, years, path):
+    """Trains the local classifier on every row already carrying a valid LLM label and saves it to path."""
+    texts, labels = [], []
+    for year in years:
+        for row in read_annotated_rows(base_dir, year):
+            label = (row.get("annotation") or "").strip()
+            if label in ANNOTATION_LABELS:
+                texts.append(paper_text((row.get("title") or "").strip(), (row.get("abstract") or "").strip()))
+                labels.append(label)
+    if not texts:
+        print("No annotated rows to train on.")
+        return
+    model, report = train_with_report(texts, labels, ANNOTATION_LABELS)
+    model.save(path)
+    print(f"Trained local classifier on {len(texts)} rows; saved to {path}")
+    print("Held-out coverage vs. agreement with the LLM labels:")
+    print(format_report(report))
+
+def default_engine():
+    return AnnotationEngine(GeminiClient(gemini_client()))
+
+def read_checkpoint(checkpoint_path, source_stat):
+    """Returns the saved checkpoint if it belongs to this version of the source file."""
+    try:
+        with open(checkpoint_path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get("source_size") != source_stat.st_size or checkpoint.get("source_mtime") != source_stat.st_mtime:
+        return None
+    return checkpoint
+
+def write_checkpoint(checkpoint_path, checkpoint):
+    with open(checkpoint_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+def annotate_metadata_csv(csv_path, engine=None, batch_tokens=0, cache=None, local_model=None, chunk_rows=CHUNK_ROWS,
+                          texts=None):
+    """Annotates a metadata.csv chunk by chunk without holding the year in memory.
+
+    Finished chunks are appended, in input order, to <csv>.annotating and
+    checkpointed, so an interrupted run resumes after the last checkpoint. The
+    original is replaced atomically once every row is done.
+    """
+    engine = engine or default_engine()
+    side_path = csv_path + ".annotating"
+    checkpoint_path = side_path + ".ckpt"
+    source_stat = os.stat(csv_path)
+    checkpoint = read_checkpoint(checkpoint_path, source_stat) if os.path.exists(side_path) else None
+    done_rows = checkpoint["rows"] if checkpoint else 0
+
+    with open(csv_path, "r", newline="", encoding="utf-8") as csvfile, \
+            open(side_path, "r+" if checkpoint else "w", newline="", encoding="utf-8") as side:
         reader = csv.DictReader(csvfile)
         fieldnames = reader.fieldnames if reader.fieldnames else []
         if "annotation" not in fieldnames:
             fieldnames.append("annotation")
-        for row in reader:
-            title = row.get("title", "").strip()
-            abstract = row.get("abstract", "").strip()
-            label = call_gemini_api(title, abstract)
-            row["annotation"] = label
-            updated_rows.append(row)
-            print(f"Annotated paper '{title}' as '{label}'.")
-            # time.sleep(1)  # Maintain original rate limit
-
-    with open(csv_path, "w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(updated_rows)
+        writer = csv.DictWriter(side, fieldnames=fieldnames, extrasaction="ignore")
+        if checkpoint:
+            print(f"Resuming {csv_path} after {done_rows} annotated rows")
+            side.seek(checkpoint["bytes"])
+            side.truncate()
+            for _ in itertools.islice(reader, done_rows):
+                pass
+        else:
+            writer.writeheader()
+
+        # The next chunk is annotated while the current one finishes, so the engine never drains at a boundary.
+        chunks = iter(lambda: list(itertools.islice(reader, chunk_rows)), [])
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=CHUNKS_IN_FLIGHT) as pool:
+            for chunk in itertools.chain(chunks, [None] * CHUNKS_IN_FLIGHT):
+                if chunk:
+                    in_flight.append((chunk, pool.submit(annotate_rows, chunk, engine, batch_tokens, cache, local_model, texts)))
+                if in_flight and (len(in_flight) >= CHUNKS_IN_FLIGHT or chunk is None):
+                    finished, future = in_flight.popleft()
+                    future.result()
+                    writer.writerows(finished)
+                    side.flush()
+                    os.fsync(side.fileno())
+                    done_rows += len(finished)
+                    write_checkpoint(checkpoint_path, {"source_size": source_stat.st_size,
+                                                       "source_mtime": source_stat.st_mtime,
+                                                       "rows": done_rows, "bytes": side.tell()})
+
+    os.replace(side_path, csv_path)
+    os.remove(checkpoint_path)
     print(f"Updated CSV saved to {csv_path}.")
 
+def annotate_metadata_parquet(base_dir, year, engine=None, batch_tokens=0, cache=None, local_model=None, texts=None):
+    """Annotates the Parquet partition of one year in the metadata store."""
+    engine = engine or default_engine()
+    rows = metadata_store.load_year(base_dir, year, memory_map=False).to_pylist()
+    annotate_rows(rows, engine, batch_tokens, cache, local_model, texts)
+
+    metadata_store.write_year(base_dir, year, metadata_store.rows_to_table(rows))
+    print(f"Updated Parquet saved to {metadata_store.year_path(base_dir, year)}.")
+
 if __name__ == "__main__":
-    base_dir = r"E:\programing\Data Science\scrapping python\OUTPUTS"
-    start_year = 2021
-    end_year = 2024
+    parser = argparse.ArgumentParser(description="Label scraped papers with an LLM.")
+    parser.add_argument("--base-dir", default=r"E:\programing\Data Science\scrapping python\OUTPUTS")
+    parser.add_argument("--start-year", type=int, default=2021)
+    parser.add_argument("--end-year", type=int, default=2024)
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE, help="Requests per minute allowed by the quota")
+    parser.add_argument("--tpm", type=int, default=TOKENS_PER_MINUTE, help="Tokens per minute allowed by the quota")
+    parser.add_argument("--in-flight", type=int, default=MAX_IN_FLIGHT, help="Most requests outstanding at once")
+    parser.add_argument("--batch-tokens", type=int, default=0,
+                        help="Pack several papers into each request, up to this many tokens (0 = one paper per request)")
+    parser.add_argument("--cache", help=f"Annotation cache database (default: <base-dir>/{CACHE_FILENAME})")
+    parser.add_argument("--no-cache", action="store_true", help="Classify every paper, ignoring the cache")
+    parser.add_argument("--import-existing", action="store_true",
+                        help="Seed the cache with labels already in the metadata files before annotating")
+    parser.add_argument("--local-model", help="Label confident papers with this local classifier (.npz) first")
+    parser.add_argument("--local-margin", type=float, default=DEFAULT_MARGIN,
+                        help="Top-two probability margin the local classifier needs to skip the LLM")
+    parser.add_argument("--train-local", metavar="PATH",
+                        help="Train the local classifier from the already-annotated years, save it to PATH and exit")
+    parser.add_argument("--llm-url", help="Use a JSON HTTP endpoint (e.g. benchmarks/fake_llm_server.py) instead of Gemini")
+    parser.add_argument("--metrics-file",
+                        help="Write a metrics snapshot here at the end (Prometheus text for .prom, else JSON)")
+    args = parser.parse_args()
+
+    if args.train_local:
+        train_local_model(args.base_dir, range(args.start_year, args.end_year + 1), args.train_local)
+        raise SystemExit(0)
 
-    for year in range(start_year, end_year + 1):
+    local_model = None
+    if args.local_model:
+        local_model = LocalClassifier.load(args.local_model)
+        local_model.margin = args.local_margin
+    model_client = HttpLLMClient(args.llm_url) if args.llm_url else GeminiClient(gemini_client())
+    engine = AnnotationEngine(model_client, args.rpm, args.tpm, args.in_flight)
+    base_dir = args.base_dir
+    cache = None
+    if not args.no_cache:
+        cache = AnnotationCache(args.cache or os.path.join(base_dir, CACHE_FILENAME),
+                                ANNOTATION_LABELS, PROMPT_VERSION, model_client.model)
+    for year in range(args.start_year, args.end_year + 1):
+        texts = read_pdf_texts(base_dir, year)
+        if cache and args.import_existing:
+            print(f"Imported {import_annotations(base_dir, year, cache, texts)} existing labels for {year}")
         csv_path = os.path.join(base_dir, str(year), "metadata.csv")
-        if os.path.exists(csv_path):
+        if os.path.exists(metadata_store.year_path(base_dir, year)):
+            print(f"Processing file: {metadata_store.year_path(base_dir, year)}")
+            annotate_metadata_parquet(base_dir, year, engine, args.batch_tokens, cache, local_model, texts)
+        elif os.path.exists(csv_path):
             print(f"Processing file: {csv_path}")
-            annotate_metadata_csv(csv_path)
+            annotate_metadata_csv(csv_path, engine, args.batch_tokens, cache, local_model, texts=texts)
         else:
             print(f"File not found: {csv_path}")
+    if os.path.isdir(paper_index.index_path(base_dir)):
+        # New labels change the indexed rows; build re-indexes just those papers.
+        for year in range(args.start_year, args.end_year + 1):
+            fmt = "parquet" if os.path.exists(metadata_store.year_path(base_dir, year)) else "csv"
+            paper_index.build(base_dir, fmt, [year])
+    print(f"Model calls: {format_stats(engine.stats())}")
+    for line in format_summary(get_metrics().snapshot()):
+        print(line)
+    if args.metrics_file:
+        write_snapshot(args.metrics_file)
+    if local_model:
+        print(f"Local classifier: {format_routing(local_model.routed)}")
+    if cache:
+        print(f"Annotation cache: {format_cache_stats(cache.stats())}")
+        cache.close()
+    engine.close()
 
 # annotate_metadata_csv(r'E:\programing\Data Science\scrapping python\OUTPUTS\2020\Book1.csv')
\ No newline at end of file
@@ -0,0 +1,102 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+CACHE_FILENAME = "annotation_cache.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (
+    key TEXT PRIMARY KEY,
+    label TEXT NOT NULL,
+    model TEXT,
+    source TEXT,
+    created REAL
+);
+"""
+
+
+def annotation_key(title, abstract, labels, prompt_version, model):
+    """Hash of everything that determines a label: the paper text, the label set, the prompt and the model."""
+    material = json.dumps([title.strip(), abstract.strip(), list(labels), prompt_version, model], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class AnnotationCache:
+    """Persistent label cache consulted before any model call.
+
+    Only labels from the configured label set are stored, so errors and
+    malformed answers are retried on the next run instead of being cached.
+    """
+
+    def __init__(self, path, labels, prompt_version, model):
+        self.path = path
+        self.labels = list(labels)
+        self.prompt_version = prompt_version
+        self.model = model
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.imported = 0
+
+    def key(self, title, abstract):
+        return annotation_key(title, abstract, self.labels, self.prompt_version, self.model)
+
+    def lookup(self, papers):
+        """Returns {index: label} for the (title, abstract) pairs already in the cache."""
+        keys = [self.key(title, abstract) for title, abstract in papers]
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, label FROM annotations WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                found.update(rows)
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return {i: found[key] for i, key in enumerate(keys) if key in found}
+
+    def store(self, papers, labels, source="model"):
+        """Caches the valid labels among (title, abstract) -> label pairs; returns how many were stored."""
+        now = time.time()
+        rows = [(self.key(title, abstract), label, self.model, source, now)
+                for (title, abstract), label in zip(papers, labels) if label in self.labels]
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def import_rows(self, rows, paper=None, label_column="annotation"):
+        """Imports already-annotated metadata rows, e.g. from an earlier run's metadata.csv.
+
+        paper(row) -> (title, abstract) must be what the annotator looks the
+        row up by, or the imported labels are never hit; by default the
+        row's own title and abstract.
+        """
+        paper = paper or (lambda row: ((row.get("title") or "").strip(), (row.get("abstract") or "").strip()))
+        papers, labels = [], []
+        for row in rows:
+            label = (row.get(label_column) or "").strip()
+            if label:
+                papers.append(paper(row))
+                labels.append(label)
+        count = self.store(papers, labels, source="import")
+        self.imported += count
+        return count
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM annotations").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "imported": self.imported, "entries": entries}
+
+    def close(self):
+        self.conn.close()
+
+
+def format_stats(stats):
+    lookups = stats["hits"] + stats["misses"]
+    rate = stats["hits"] / lookups * 100 if lookups else 0.0
+    return (f"{stats['hits']} hits, {stats['misses']} misses ({rate:.1f}% hit rate), "
+            f"{stats['imported']} imported, {stats['entries']} entries")
@@ -0,0 +1,203 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from crawl_metrics import get_metrics
+
+REQUESTS_PER_MINUTE = 60
+TOKENS_PER_MINUTE = 1_000_000
+MAX_IN_FLIGHT = 8
+MAX_RETRIES = 5
+OUTPUT_TOKENS = 16           # Budgeted per request for the reply
+BACKOFF_START = 2.0          # Seconds paused after the first rate-limit answer
+BACKOFF_MAX = 60.0
+
+
+class RateLimitError(Exception):
+    """Raised by a client when the provider rejects a request for quota reasons."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(prompt, output_tokens=OUTPUT_TOKENS):
+    return len(prompt) // 4 + output_tokens
+
+
+class GeminiClient:
+    """Adapts a google.genai client to the generate(prompt) -> text interface."""
+
+    def __init__(self, client, model="gemini-2.0-flash-001"):
+        self.client = client
+        self.model = model
+
+    def generate(self, prompt):
+        try:
+            return self.client.models.generate_content(contents=prompt, model=self.model).text
+        except Exception as e:
+            message = str(e).lower()
+            if "quota" in message or "exhausted" in message or "429" in message:
+                raise RateLimitError(str(e))
+            raise
+
+
+class HttpLLMClient:
+    """Client for a plain JSON endpoint: POST {"prompt": ...} -> {"text": ...}, 429 when over quota.
+
+    benchmarks/fake_llm_server.py implements it for local testing.
+    """
+
+    def __init__(self, url, timeout=60, model="local"):
+        self.url = url
+        self.timeout = timeout
+        self.model = model
+        self.session = requests.Session()
+
+    def generate(self, prompt):
+        response = self.session.post(self.url, json={"prompt": prompt}, timeout=self.timeout)
+        if response.status_code == 429:
+            retry_after = response.headers.get("Retry-After")
+            raise RateLimitError(response.text, float(retry_after) if retry_after else None)
+        response.raise_for_status()
+        return response.json()["text"]
+
+
+class RateLimiter:
+    """Token buckets for requests/min and tokens/min, slowed down multiplicatively on rate-limit answers.
+
+    Each rate-limit answer also pauses every caller until the provider's
+    Retry-After (or an exponential backoff) has passed; successes creep the
+    rate back up to the configured ceiling.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.scale = 1.0
+        # Burst capacity is a couple of seconds' worth, so a full minute's quota can't be spent at once.
+        self.request_capacity = max(1.0, requests_per_minute / 30)
+        self.token_capacity = max(tokens_per_minute / 30, OUTPUT_TOKENS)
+        self.request_tokens = 1.0
+        self.token_tokens = self.token_capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.backoff = BACKOFF_START
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.request_tokens = min(self.request_capacity, self.request_tokens + elapsed * self.rpm * self.scale / 60)
+        self.token_tokens = min(self.token_capacity, self.token_tokens + elapsed * self.tpm * self.scale / 60)
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.token_capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.request_tokens >= 1 and self.token_tokens >= tokens:
+                    self.request_tokens -= 1
+                    self.token_tokens -= tokens
+                    return
+                wait = max(self.paused_until - now,
+                           (1 - self.request_tokens) * 60 / (self.rpm * self.scale),
+                           (tokens - self.token_tokens) * 60 / (self.tpm * self.scale))
+            time.sleep(min(max(wait, 0.01), 1.0))
+
+    def rate_limited(self, retry_after=None):
+        with self.lock:
+            self.scale = max(0.1, self.scale * 0.75)
+            delay = retry_after if retry_after is not None else self.backoff
+            self.backoff = min(BACKOFF_MAX, self.backoff * 2)
+            self.paused_until = max(self.paused_until, time.monotonic() + delay * random.uniform(1.0, 1.2))
+            self.request_tokens = min(self.request_tokens, 0.0)
+
+    def succeeded(self):
+        with self.lock:
+            self.scale = min(1.0, self.scale + 0.02)
+            self.backoff = BACKOFF_START
+
+
+class AnnotationEngine:
+    """Runs prompts through a client concurrently, at most max_in_flight at a time, within the rate limits."""
+
+    def __init__(self, client, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 max_in_flight=MAX_IN_FLIGHT, max_retries=MAX_RETRIES, log=print):
+        self.client = client
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.log = log
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.counts = {"requests": 0, "rate_limited": 0, "errors": 0, "tokens": 0}
+        self.counts_lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def _count(self, name, amount=1):
+        with self.counts_lock:
+            self.counts[name] += amount
+
+    def _run(self, prompt, output_tokens):
+        tokens = estimate_tokens(prompt, output_tokens)
+        metrics = get_metrics()
+        error = None
+        for attempt in range(self.max_retries):
+            if attempt:
+                metrics.count("retries", "annotate")
+            self.limiter.acquire(tokens)
+            self._count("requests")
+            self._count("tokens", tokens)
+            try:
+                with metrics.timer("annotate"):
+                    text = self.client.generate(prompt)
+                self.limiter.succeeded()
+                return text
+            except RateLimitError as e:
+                error = e
+                self._count("rate_limited")
+                metrics.count("errors", "annotate")
+                self.limiter.rate_limited(e.retry_after)
+            except Exception as e:
+                error = e
+                self._count("errors")
+                metrics.count("errors", "annotate")
+                self.log(f"Error calling the model (attempt {attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(min(BACKOFF_MAX, BACKOFF_START * 2 ** attempt) * random.uniform(0.5, 1.0))
+        raise error
+
+    def submit(self, prompt, output_tokens=OUTPUT_TOKENS):
+        """Returns a Future for the model's reply to prompt; output_tokens is budgeted for the reply."""
+        return self.executor.submit(self._run, prompt, output_tokens)
+
+    def map(self, prompts):
+        """Returns the replies in prompt order; a prompt that fails every attempt yields its exception."""
+        futures = [self.submit(prompt) for prompt in prompts]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def stats(self):
+        with self.counts_lock:
+            stats = dict(self.counts)
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        stats["requests_per_minute"] = stats["requests"] * 60 / elapsed
+        stats["tokens_per_minute"] = stats["tokens"] * 60 / elapsed
+        stats["rate_scale"] = self.limiter.scale
+        return stats
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def format_stats(stats):
+    return (f"{stats['requests']} requests ({stats['requests_per_minute']:.0f}/min, "
+            f"{stats['tokens_per_minute']:.0f} tokens/min), {stats['rate_limited']} rate-limited, "
+            f"{stats['errors']} errors")
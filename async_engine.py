@@ -0,0 +1,415 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import aiohttp
+
+from parsers import parse_year_links, parse_paper_links, parse_paper, sanitize_filename
+from transport import ConnectionStats, format_stats, POOL_SIZE
+from http_cache import get_cache
+from pdf_download import (resume_offset, range_headers, plan_write, chunk_size_for, finalize, part_path,
+                          record_failure, read_retry_queue, remove_from_retry_queue, DownloadError, DownloadStopped,
+                          DOWNLOAD_ATTEMPTS)
+from parse_pool import AsyncParseBatcher, REPORT_INTERVAL
+from pdf_store import open_store
+from pdf_text import get_text_extractor
+from host_scheduler import (get_scheduler, outcome_for, error_outcome, retry_after_seconds, backoff_delay,
+                            OK, NEUTRAL, ERROR)
+from crawl_metrics import get_metrics
+
+PAGE_CONCURRENCY = 200   # Paper/year pages fetched at once
+PDF_CONCURRENCY = 20     # PDFs downloaded at once
+YEARS_IN_FLIGHT = 2      # Years whose pages are being crawled at once
+STOP_POLL = 0.1          # Seconds between stop_event checks while a backoff waits
+
+
+def run_async_crawl(base_url, output_dir, page_concurrency, pdf_concurrency, max_retries, timeout,
+                    start_year, end_year, scrape_type, stop_event, log, metadata_queue,
+                    update_count, update_table, years_in_flight=YEARS_IN_FLIGHT, pool_size=POOL_SIZE,
+                    crawl_state=None, parse_pool=None):
+    """Runs the whole crawl on a single asyncio event loop and blocks until it finishes."""
+    asyncio.run(crawl(base_url, output_dir, page_concurrency, pdf_concurrency, max_retries, timeout,
+                      start_year, end_year, scrape_type, stop_event, log, metadata_queue,
+                      update_count, update_table, years_in_flight, pool_size, crawl_state, parse_pool))
+
+
+def counting_trace_config(stats):
+    """Feeds aiohttp request/connection events into the shared ConnectionStats counters."""
+    async def on_request_start(session, context, params):
+        stats.add_request()
+
+    async def on_connection_create_end(session, context, params):
+        stats.add_connection()
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+async def crawl(base_url, output_dir, page_concurrency, pdf_concurrency, max_retries, timeout,
+                start_year, end_year, scrape_type, stop_event, log, metadata_queue,
+                update_count, update_table, years_in_flight=YEARS_IN_FLIGHT, pool_size=POOL_SIZE,
+                crawl_state=None, parse_pool=None):
+    """Crawls every selected year, pipelining years so the next index is ready early."""
+    page_semaphore = asyncio.Semaphore(page_concurrency)
+    pdf_semaphore = asyncio.Semaphore(pdf_concurrency)
+    year_semaphore = asyncio.Semaphore(years_in_flight)
+    connector = aiohttp.TCPConnector(limit=page_concurrency + pdf_concurrency, limit_per_host=pool_size)
+    stats = ConnectionStats()
+    batcher = AsyncParseBatcher(parse_pool, base_url) if parse_pool else None
+    if batcher:
+        get_metrics().register_gauge("waiting_to_parse", lambda: len(batcher.pending))
+        get_metrics().register_gauge("parsing", lambda: batcher.in_flight)
+
+    async with aiohttp.ClientSession(connector=connector, trace_configs=[counting_trace_config(stats)]) as session:
+        if scrape_type in ["PDFs", "Both"]:
+            await retry_failed_pdfs_async(session, pdf_semaphore, output_dir, timeout, stop_event, log,
+                                          update_count, update_table, crawl_state)
+        log("Fetching main page...")
+        main_page_html = await fetch_page_async(session, page_semaphore, base_url,
+                                                max_retries, timeout, stop_event, log)
+        if not main_page_html:
+            return
+
+        year_tasks = []
+        reporter = asyncio.create_task(report_depths(batcher, log)) if batcher else None
+        for year_url in parse_year_links(main_page_html, base_url):
+            if stop_event.is_set():
+                log("Process stopped by user")
+                break
+            year = year_url.split("/")[-1]
+            if not year.isdigit():
+                continue
+            year_int = int(year)
+            if (start_year and year_int < start_year) or (end_year and year_int > end_year):
+                log(f"Skipping year {year}")
+                continue
+            year_tasks.append(asyncio.create_task(guarded(process_year_async(
+                session, page_semaphore, pdf_semaphore, year_semaphore, year_url, year, base_url,
+                output_dir, max_retries, timeout, scrape_type, stop_event, log, metadata_queue,
+                update_count, update_table, crawl_state, batcher
+            ), year_url, year, log)))
+        await asyncio.gather(*year_tasks)
+        if reporter:
+            reporter.cancel()
+
+    snapshot = stats.snapshot()
+    snapshot["http_version"] = "HTTP/1.1"
+    log(f"Connections: {format_stats(snapshot)}")
+
+
+async def report_depths(batcher, log):
+    """Logs the parse stage backlog every REPORT_INTERVAL seconds until cancelled."""
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        log(batcher.depths())
+
+
+async def process_year_async(session, page_semaphore, pdf_semaphore, year_semaphore, year_url, year,
+                             base_url, output_dir, max_retries, timeout, scrape_type, stop_event, log,
+                             metadata_queue, update_count, update_table, crawl_state=None, batcher=None):
+    """Fetches a year index and processes all of its papers concurrently."""
+    async with year_semaphore:
+        if stop_event.is_set():
+            return
+        log(f"\nProcessing year: {year}")
+        with get_metrics().year_timer(year):
+            log(f"Fetching year page: {year_url}")
+            # Crawl state and cache calls touch SQLite and the disk; they run in threads to keep the loop free.
+            headers = await asyncio.to_thread(crawl_state.conditional_headers, year_url) if crawl_state else None
+            page = await fetch_page_info_async(session, page_semaphore, year_url,
+                                               max_retries, timeout, stop_event, log, headers)
+            if page is None:
+                return
+            status, year_page_html, etag, last_modified = page
+            if status == 304:
+                log(f"Year page unchanged: {year_url}")
+                paper_links = await asyncio.to_thread(crawl_state.incomplete_papers, year, scrape_type)
+            else:
+                paper_links = await asyncio.to_thread(parse_paper_links, year_page_html, base_url)
+                if crawl_state:
+                    await asyncio.to_thread(crawl_state.add_papers, year, paper_links)
+                    await asyncio.to_thread(crawl_state.record_page, year_url, etag, last_modified)
+                    total = len(paper_links)
+                    paper_links = await asyncio.to_thread(crawl_state.incomplete_papers, year, scrape_type)
+                    log(f"Year {year}: {total - len(paper_links)} papers already complete, "
+                        f"{len(paper_links)} to process")
+            if crawl_state and not paper_links:
+                log(f"Year {year} is up to date")
+                return
+            await asyncio.gather(*(
+                guarded(process_paper_async(session, page_semaphore, pdf_semaphore, url, year, base_url, output_dir,
+                                            max_retries, timeout, scrape_type, stop_event, log, metadata_queue,
+                                            update_count, update_table, crawl_state, batcher),
+                        url, year, log, crawl_state)
+                for url in paper_links
+            ))
+
+
+async def guarded(work, url, year, log, crawl_state=None):
+    """Awaits one paper's (or year's) work; an unexpected error fails only that paper, not the gather it is in."""
+    try:
+        await work
+    except Exception as e:
+        log(f"Failed to process {url}: {type(e).__name__}: {str(e)}")
+        get_metrics().count("errors", "process_paper")
+        if crawl_state and not isinstance(e, sqlite3.Error):
+            await asyncio.to_thread(crawl_state.record_failure, url, year, str(e))
+
+
+async def process_paper_async(session, page_semaphore, pdf_semaphore, paper_url, year, base_url, output_dir,
+                              max_retries, timeout, scrape_type, stop_event, log, metadata_queue,
+                              update_count, update_table, crawl_state=None, batcher=None):
+    """Fetches and parses one paper page, then downloads its PDF and/or queues its metadata."""
+    if stop_event.is_set():
+        return
+
+    log(f"Processing paper: {paper_url}")
+    page = await fetch_page_info_async(session, page_semaphore, paper_url,
+                                       max_retries, timeout, stop_event, log)
+    if page is None:
+        if crawl_state and not stop_event.is_set():
+            await asyncio.to_thread(crawl_state.record_failure, paper_url, year, "paper page fetch failed")
+        return
+    paper_html = page[1]
+
+    # Parsing is CPU work; keep it off the event loop so sockets stay serviced.
+    # A parse error propagates to guarded(), which records the failure.
+    if batcher:
+        paper = await batcher.parse(paper_url, paper_html)
+    else:
+        started = time.monotonic()
+        paper = await asyncio.to_thread(parse_paper, paper_html, base_url)
+        get_metrics().observe("parse", time.monotonic() - started)
+    title = paper["title"]
+
+    previous = await asyncio.to_thread(crawl_state.paper, paper_url) if crawl_state else None
+    need_pdf = not (previous and previous["pdf_sha256"])
+    need_metadata = not (previous and previous["metadata_saved"])
+    if crawl_state:
+        await asyncio.to_thread(crawl_state.record_paper_page, paper_url, year, title, bool(paper["pdf_url"]))
+
+    if scrape_type in ["PDFs", "Both"] and paper["pdf_url"] and need_pdf:
+        result = await download_pdf_async(session, pdf_semaphore, paper["pdf_url"], sanitize_filename(title),
+                                          year, output_dir, timeout, stop_event, log, update_count, update_table,
+                                          paper_url)
+        if result and crawl_state:
+            await asyncio.to_thread(crawl_state.record_pdf, paper_url, *result)
+
+    if scrape_type in ["Metadata", "Both"] and need_metadata:
+        metadata = {
+            "title": title,
+            "authors": paper["authors"],
+            "abstract": paper["abstract"],
+            "pdf_url": paper["pdf_url"] or "",
+            "paper_url": paper_url,
+            "year": year
+        }
+        metadata_queue.put(metadata)
+        log(f"Collected metadata for: {title}")
+        update_table(year, "Metadata", title)
+    if not stop_event.is_set():
+        get_metrics().count("papers", year)
+
+
+async def download_pdf_async(session, semaphore, url, filename, year, output_dir, timeout, stop_event, log,
+                             update_count, update_table, paper_url=None):
+    """Streams a PDF into the PDF store while holding a PDF download slot; returns (path, size, sha256).
+
+    Same .part / Range resume / verification scheme as pdf_download.download_file.
+    """
+    if stop_event.is_set():
+        return None
+    store = open_store(output_dir)
+    known = await asyncio.to_thread(store.lookup, year, paper_url or url)
+    if known:
+        log(f"Already stored: {filename}")
+        return known
+    path = store.staging_path(url)
+    extractor = get_text_extractor()
+    data = bytearray() if extractor else None
+
+    try:
+        async with semaphore:
+            size, sha256 = await fetch_pdf_async(session, url, path, timeout, stop_event, log, data)
+            path = await asyncio.to_thread(store.add, year, paper_url or url, path, sha256, filename)
+            extraction = extractor.submit(year, paper_url or url, sha256, data, wait=False) if extractor else None
+            if extraction:
+                # Holding the download slot until the text is out bounds the PDFs kept in memory.
+                await asyncio.wrap_future(extraction)
+        log(f"Downloaded: {filename}")
+        update_count(year)
+        update_table(year, "PDF", filename)
+        return path, size, sha256
+    except DownloadStopped:
+        log(f"Stopped downloading: {filename}")
+        return None
+    except Exception as e:
+        log(f"Failed to download {url}: {str(e)}")
+        await asyncio.to_thread(record_failure, output_dir, url, filename, year, paper_url, e)
+        return None
+
+
+async def fetch_pdf_async(session, url, path, timeout, stop_event, log, keep=None):
+    """stream_pdf under the host's PDF limit; throttled, failed or cut-off downloads are retried with backoff."""
+    limiter = get_scheduler().limiter(url, "pdfs")
+    metrics = get_metrics()
+    for attempt in range(DOWNLOAD_ATTEMPTS):
+        if not await limiter.acquire_async(stop_event):
+            raise DownloadStopped()
+        started = time.monotonic()
+        outcome, retry_after, size = OK, None, 0
+        try:
+            size, digest, expected_total = await stream_pdf(session, url, path, timeout, stop_event, keep)
+            await asyncio.to_thread(finalize, path, size, expected_total)
+            return size, digest.hexdigest()
+        except DownloadStopped:
+            outcome = NEUTRAL
+            raise
+        except Exception as e:
+            outcome, retry_after = error_outcome(e)
+            metrics.count("errors", "download_pdf")
+            if outcome == NEUTRAL or attempt + 1 == DOWNLOAD_ATTEMPTS:
+                raise
+            log(f"Attempt {attempt+1} failed for {url}: {str(e)}")
+            metrics.count("retries", "download_pdf")
+        finally:
+            await limiter.release_async(outcome, retry_after=retry_after)
+            metrics.observe("download_pdf", time.monotonic() - started, size)
+        if await wait_stopped(stop_event, backoff_delay(attempt, retry_after)):
+            raise DownloadStopped()
+
+
+async def wait_stopped(stop_event, delay):
+    """The event-loop version of stop_event.wait(delay): True as soon as stop_event is set, False after delay."""
+    deadline = time.monotonic() + delay
+    while not stop_event.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(remaining, STOP_POLL))
+    return True
+
+
+async def stream_pdf(session, url, path, timeout, stop_event, keep=None):
+    """Streams url into path's .part file, resuming with a Range request; returns (size, sha256 digest, expected size).
+
+    keep, if a bytearray, ends up holding the file's bytes (see pdf_download.download_file).
+    """
+    # Hashing what an earlier attempt left can take a while for a large PDF.
+    offset, digest = await asyncio.to_thread(resume_offset, path, keep)
+    # Per-read timeouts, like requests, so large PDFs are not cut off by a total deadline.
+    client_timeout = aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+    async with session.get(url, timeout=client_timeout, headers=range_headers(offset)) as response:
+        if response.status == 416 and offset:
+            os.remove(part_path(path))
+            raise DownloadError("Range not satisfiable; discarded partial file")
+        response.raise_for_status()
+        append, expected_total = plan_write(response.status, response.headers, offset)
+        if not append:
+            offset, digest = 0, hashlib.sha256()
+            if keep is not None:
+                keep.clear()
+        size = offset
+        remaining = expected_total - offset if expected_total else None
+        with open(part_path(path), "ab" if append else "wb") as f:
+            async for chunk in response.content.iter_chunked(chunk_size_for(remaining)):
+                if stop_event.is_set():
+                    raise DownloadStopped()
+                f.write(chunk)
+                digest.update(chunk)
+                if keep is not None:
+                    keep += chunk
+                size += len(chunk)
+    return size, digest, expected_total
+
+
+async def retry_failed_pdfs_async(session, pdf_semaphore, output_dir, timeout, stop_event, log,
+                                  update_count, update_table, crawl_state=None):
+    """Retries the PDFs that failed in earlier runs; only the ones that succeed leave the queue."""
+    entries = await asyncio.to_thread(read_retry_queue, output_dir)
+    if not entries:
+        return
+    log(f"Retrying {len(entries)} previously failed PDFs")
+    succeeded = []
+
+    async def retry(entry):
+        result = await download_pdf_async(session, pdf_semaphore, entry["url"], entry["filename"], entry["year"],
+                                          output_dir, timeout, stop_event, log, update_count, update_table,
+                                          entry["paper_url"])
+        if result:
+            succeeded.append(entry["url"])
+            if crawl_state and entry["paper_url"]:
+                await asyncio.to_thread(crawl_state.record_pdf, entry["paper_url"], *result)
+
+    try:
+        await asyncio.gather(*(retry(entry) for entry in entries))
+    finally:
+        await asyncio.to_thread(remove_from_retry_queue, output_dir, succeeded)
+
+
+async def fetch_page_async(session, semaphore, url, max_retries, timeout, stop_event, log):
+    """Fetches a web page with retries while holding a page fetch slot."""
+    page = await fetch_page_info_async(session, semaphore, url, max_retries, timeout, stop_event, log)
+    return page[1] if page else None
+
+
+async def fetch_page_info_async(session, semaphore, url, max_retries, timeout, stop_event, log, headers=None):
+    """Like fetch_page_async, but returns (status, html, etag, last_modified); html is None on a 304."""
+    cache = get_cache()
+    if cache and cache.replay:
+        cached = await asyncio.to_thread(cache.replay_response, url)
+        if cached is None:
+            log(f"Failed: {url} is not in the HTTP cache (replay mode)")
+            return None
+        return 200, cached.text, cached.headers.get("ETag"), cached.headers.get("Last-Modified")
+    entry = await asyncio.to_thread(cache.lookup, url) if cache and not headers else None
+    if entry:
+        headers = cache.conditional_headers(entry)
+
+    limiter = get_scheduler().limiter(url, "pages")
+    metrics = get_metrics()
+    for attempt in range(max_retries):
+        if stop_event.is_set():
+            return None
+        retry_after = None
+        try:
+            async with semaphore:
+                if not await limiter.acquire_async(stop_event):
+                    return None
+                started = time.monotonic()
+                outcome, size = ERROR, 0
+                try:
+                    async with session.get(url, headers=headers,
+                                           timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                        outcome = outcome_for(response.status)
+                        retry_after = retry_after_seconds(response.headers)
+                        etag = response.headers.get("ETag")
+                        last_modified = response.headers.get("Last-Modified")
+                        if response.status == 304:
+                            if entry:
+                                cached = await asyncio.to_thread(cache.hit, entry, True)
+                                return 200, cached.text, etag, last_modified
+                            return 304, None, etag, last_modified
+                        response.raise_for_status()
+                        size = len(await response.read())
+                        text = await response.text()
+                        if cache:
+                            await asyncio.to_thread(cache.store, url, text, etag, last_modified,
+                                                    response.headers.get("Cache-Control"))
+                        return response.status, text, etag, last_modified
+                finally:
+                    latency = time.monotonic() - started
+                    await limiter.release_async(outcome, latency, retry_after)
+                    metrics.observe("fetch_page", latency, size)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log(f"Attempt {attempt+1} failed for {url}: {str(e)}")
+            metrics.count("errors", "fetch_page")
+            if await wait_stopped(stop_event, backoff_delay(attempt, retry_after)):
+                return None
+            if attempt + 1 < max_retries:
+                metrics.count("retries", "fetch_page")
+    log(f"Max retries reached for {url}")
+    return None
@@ -0,0 +1,181 @@
+"""End-to-end crawl benchmark against the local site simulator.
+
+Starts benchmarks/site_simulator.py in a subprocess and runs the crawl
+pipeline (crawler.py, the same code script4.py --headless runs) over it once
+per engine and concurrency level, each time into a fresh output directory.
+Reports papers/s, CPU seconds (user + sys, including parse workers) and peak
+RSS of the crawler process, plus the retries it needed and the 429s the
+site sent. --save writes the results as JSON; --baseline compares against a
+saved run, so a change can be judged by the numbers.
+
+    python benchmarks/crawl_benchmark.py --concurrency 8 32 128 --papers 300 --latency 0.05
+    python benchmarks/crawl_benchmark.py --save before.json ...      # then, after a change:
+    python benchmarks/crawl_benchmark.py --baseline before.json ...
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+import urllib.request
+
+try:
+    import resource
+except ImportError:    # Windows: no rusage, so CPU time and RSS are not reported.
+    resource = None
+
+from site_simulator import add_simulator_arguments
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CRAWLER = os.path.join(ROOT, "crawler.py")
+SIMULATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "site_simulator.py")
+
+
+def start_simulator(simulator_args):
+    """Runs the simulator on a free port; returns (process, base_url)."""
+    process = subprocess.Popen([sys.executable, SIMULATOR, "--port", "0", *simulator_args],
+                               stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("Site simulator on "):
+        process.kill()
+        raise RuntimeError(f"Site simulator did not start: {line!r}")
+    return process, line.split()[-1].rstrip("/")
+
+
+def simulator_stats(base_url):
+    with urllib.request.urlopen(base_url + "/stats", timeout=10) as response:
+        return json.load(response)
+
+
+def run_crawler(command):
+    """Runs the crawler to completion; returns (wall seconds, CPU seconds, peak RSS in MB, exit code)."""
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    if resource is None or not hasattr(os, "wait4"):
+        code = process.wait()
+        return time.perf_counter() - started, None, None, code
+    # wait4 reports the crawler's usage including the parse workers it reaped.
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in KB on Linux and in bytes on macOS.
+    rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return elapsed, usage.ru_utime + usage.ru_stime, rss_mb, process.returncode
+
+
+def bench(base_url, engine, concurrency, args):
+    output_dir = tempfile.mkdtemp(prefix="crawl_benchmark_")
+    metrics_file = os.path.join(output_dir, "metrics.json")
+    command = [sys.executable, CRAWLER, "--base-url", base_url, "--output-dir", output_dir,
+               "--scrape-type", args.scrape_type, "--engine", engine,
+               "--page-concurrency", str(concurrency), "--pdf-concurrency", str(min(concurrency, args.pdf_concurrency)),
+               "--cache", "off", "--progress", "jsonl", "--metrics-file", metrics_file,
+               "--metrics-interval", "3600", *args.crawler_args]
+    before = simulator_stats(base_url)
+    try:
+        wall, cpu, rss, code = run_crawler(command)
+        with open(metrics_file, encoding="utf-8") as f:
+            metrics = json.load(f)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    after = simulator_stats(base_url)
+    papers = sum(metrics["counters"].get("papers", {}).values())
+    return {
+        "engine": engine,
+        "concurrency": concurrency,
+        "exit_code": code,
+        "papers": papers,
+        "wall": wall,
+        "papers_per_second": papers / wall,
+        "cpu": cpu,
+        "peak_rss_mb": rss,
+        "retries": sum(metrics["counters"].get("retries", {}).values()),
+        "throttled": after["throttled"] - before["throttled"],
+    }
+
+
+def median_run(runs):
+    """The run with the median papers/s, so one noisy repeat does not decide the result."""
+    return sorted(runs, key=lambda run: run["papers_per_second"])[len(runs) // 2]
+
+
+def format_row(result, baseline=None):
+    cpu = f"{result['cpu']:8.1f}" if result["cpu"] is not None else "     n/a"
+    cpu_per_paper = f"{result['cpu'] * 1000 / max(result['papers'], 1):8.1f}" if result["cpu"] is not None else "     n/a"
+    rss = f"{result['peak_rss_mb']:8.0f}" if result["peak_rss_mb"] is not None else "     n/a"
+    row = (f"{result['engine']:<8} {result['concurrency']:>6} {result['papers']:>7} {result['wall']:>7.1f} "
+           f"{result['papers_per_second']:>9.1f} {cpu} {cpu_per_paper} {rss} {result['retries']:>7} "
+           f"{result['throttled']:>9}")
+    if baseline:
+        change = result["papers_per_second"] / baseline["papers_per_second"] - 1
+        row += f"   {change:+.0%} papers/s"
+        if result["cpu"] and baseline.get("cpu"):
+            row += f", {result['cpu'] / baseline['cpu'] - 1:+.0%} CPU"
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", choices=["threads", "asyncio"], default=["threads", "asyncio"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128],
+                        help="Page concurrency levels to run")
+    parser.add_argument("--pdf-concurrency", type=int, default=20, help="Capped at the page concurrency")
+    parser.add_argument("--scrape-type", choices=["PDFs", "Metadata", "Both"], default="Both")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per configuration; the median is reported")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved earlier with --save")
+    parser.add_argument("--crawler-args", nargs=argparse.REMAINDER, default=[],
+                        help="Extra crawler.py flags, e.g. --crawler-args --parse-workers 4 (must come last)")
+    add_simulator_arguments(parser)
+    args = parser.parse_args()
+
+    simulator_args = simulator_command(args)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {(run["engine"], run["concurrency"]): run for run in json.load(f)["results"]}
+
+    simulator, base_url = start_simulator(simulator_args)
+    results = []
+    try:
+        print(f"{'engine':<8} {'conc':>6} {'papers':>7} {'wall s':>7} {'papers/s':>9} {'CPU s':>8} "
+              f"{'CPU ms/p':>8} {'RSS MB':>8} {'retries':>7} {'throttled':>9}")
+        for engine in args.engines:
+            for concurrency in args.concurrency:
+                result = median_run([bench(base_url, engine, concurrency, args) for _ in range(args.repeat)])
+                results.append(result)
+                print(format_row(result, baseline.get((engine, concurrency))), flush=True)
+        stats = simulator_stats(base_url)
+    finally:
+        simulator.terminate()
+        simulator.wait()
+    failed = any(result["exit_code"] for result in results)
+    if failed:
+        print("Some crawls exited with an error; their numbers are not comparable.")
+    print(f"Simulator: {stats['requests']} requests, {stats['bytes'] / 1e6:.1f} MB, "
+          f"{stats['errors']} errors, {stats['throttled']} throttled, {stats['dropped']} dropped, "
+          f"peak {stats['peak_in_flight']} in flight")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"time": time.time(), "simulator": simulator_args, "results": results}, f, indent=2)
+    return 1 if failed else 0
+
+
+def simulator_command(args):
+    """The add_simulator_arguments flags, as a command line for the simulator process."""
+    command = ["--years", *map(str, args.years), "--papers", str(args.papers), "--seed", str(args.seed),
+               "--pdf-kb", str(args.pdf_kb), "--latency", str(args.latency), "--jitter", str(args.jitter),
+               "--capacity", str(args.capacity), "--bandwidth-kb", str(args.bandwidth_kb),
+               "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate),
+               "--max-in-flight", str(args.max_in_flight), "--drop-rate", str(args.drop_rate),
+               "--retry-after", str(args.retry_after)]
+    if args.cache_dir:
+        command += ["--cache-dir", args.cache_dir]
+    return command
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Local stand-in for an LLM API, for exercising the annotation engine without a real quota.
+
+Speaks the HttpLLMClient protocol (POST {"prompt"} -> {"text"}), answers with
+one of the numbered categories listed in the prompt (picked from a hash of the
+prompt, so answers are stable) or, for batched prompts, a JSON array of them,
+and enforces a requests/min and tokens/min quota over a sliding minute with
+429 + Retry-After like a real provider.
+
+    python benchmarks/fake_llm_server.py --port 8780 --rpm 600 --latency 0.3
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CATEGORY_RE = re.compile(r"^\d+\. (.+)$", re.MULTILINE)
+PAPER_RE = re.compile(r"^Paper (\d+):\n(.*?)(?=^Paper \d+:|\Z)", re.MULTILINE | re.DOTALL)
+
+
+class Quota:
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = deque()      # (time, tokens) of requests accepted in the last minute
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+
+    def admit(self, tokens):
+        """Returns 0 if the request fits in the quota, else the seconds until it would."""
+        with self.lock:
+            now = time.monotonic()
+            while self.window and now - self.window[0][0] >= 60:
+                self.window.popleft()
+            used = sum(t for _, t in self.window)
+            if len(self.window) < self.rpm and used + tokens <= self.tpm:
+                self.window.append((now, tokens))
+                self.accepted += 1
+                return 0
+            self.rejected += 1
+            return max(0.1, 60 - (now - self.window[0][0])) if self.window else 1
+
+
+def pick(categories, text):
+    return categories[int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16) % len(categories)]
+
+
+def answer(prompt, garble_rate=0.0):
+    """Single prompts get a bare category; batched prompts ("Paper N:" blocks) a JSON array."""
+    categories = CATEGORY_RE.findall(prompt) or ["Unknown"]
+    papers = PAPER_RE.findall(prompt)
+    if not papers:
+        return pick(categories, prompt)
+    if random.random() < garble_rate:
+        return "Sure! Here are the labels you asked for:"
+    return json.dumps([{"id": int(number), "label": pick(categories, block)} for number, block in papers])
+
+
+def make_handler(quota, latency, garble_rate):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            prompt = json.loads(body)["prompt"]
+            retry_after = quota.admit(len(prompt) // 4)
+            if retry_after:
+                self.send_response(429)
+                self.send_header("Retry-After", f"{retry_after:.1f}")
+                self.end_headers()
+                self.wfile.write(b"quota exhausted")
+                return
+            time.sleep(latency)
+            payload = json.dumps({"text": answer(prompt, garble_rate)}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--rpm", type=int, default=600)
+    parser.add_argument("--tpm", type=int, default=1_000_000)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds spent 'thinking' per request")
+    parser.add_argument("--garble-rate", type=float, default=0.0,
+                        help="Fraction of batched requests answered with unparseable text")
+    args = parser.parse_args()
+
+    quota = Quota(args.rpm, args.tpm)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(quota, args.latency, args.garble_rate))
+    print(f"Fake LLM on http://127.0.0.1:{args.port}/ ({args.rpm} rpm, {args.tpm} tpm)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Accepted {quota.accepted}, rejected {quota.rejected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Measures parse throughput of each extractor backend over the saved corpus."""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsers import EXTRACTORS
+from parse_parity import CORPUS_DIR, BASE_URL, corpus_pages
+
+
+def bench(function, pages, min_seconds):
+    """Returns pages/sec for parsing the pages repeatedly for at least min_seconds."""
+    parsed = 0
+    start = time.perf_counter()
+    while True:
+        for html in pages:
+            function(html, BASE_URL)
+        parsed += len(pages)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return parsed / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--seconds", type=float, default=2.0, help="Minimum time spent per measurement")
+    args = parser.parse_args()
+
+    by_kind = {}
+    for _, kind, html in corpus_pages(args.corpus):
+        by_kind.setdefault(kind, []).append(html)
+
+    for kind, pages in sorted(by_kind.items()):
+        size_kb = sum(len(html) for html in pages) / len(pages) / 1024
+        print(f"{kind} ({len(pages)} pages, {size_kb:.1f} KB avg)")
+        reference = None
+        for backend in ["bs4"] + [name for name in EXTRACTORS if name != "bs4"]:
+            rate = bench(EXTRACTORS[backend][kind], pages, args.seconds)
+            reference = reference or rate
+            print(f"  {backend:>6}: {rate:10.1f} pages/sec  ({rate / reference:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
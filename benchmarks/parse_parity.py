@@ -0,0 +1,76 @@
+"""Checks that every extractor backend produces the same records as the bs4 reference.
+
+Runs over the saved pages in benchmarks/corpus by default, or over every page
+in an HTTP cache directory (--cache-dir), e.g. a whole year crawled earlier.
+Exits non-zero on any mismatch.
+"""
+import os
+import sys
+import sqlite3
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsers import EXTRACTORS
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+BASE_URL = "https://papers.nips.cc"
+
+
+def page_kind(name):
+    """Maps a corpus file name or a cached URL to the parser that handles it."""
+    if "/hash/" in name or os.path.basename(name).startswith("paper_"):
+        return "paper"
+    if os.path.basename(name).startswith("year_") or name.rstrip("/").split("/")[-1].isdigit():
+        return "paper_links"
+    return "year_links"
+
+
+def corpus_pages(corpus_dir):
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith(".html"):
+            with open(os.path.join(corpus_dir, name), encoding="utf-8") as f:
+                yield name, page_kind(name), f.read()
+
+
+def cached_pages(cache_dir):
+    conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"))
+    for url, sha256 in conn.execute("SELECT url, sha256 FROM entries ORDER BY url"):
+        path = os.path.join(cache_dir, "objects", sha256[:2], sha256)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                yield url, page_kind(url), f.read().decode("utf-8")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--cache-dir", help="Check pages stored in this HTTP cache instead of the corpus")
+    args = parser.parse_args()
+
+    pages = cached_pages(args.cache_dir) if args.cache_dir else corpus_pages(args.corpus)
+    checked = mismatches = 0
+    for name, kind, html in pages:
+        expected = EXTRACTORS["bs4"][kind](html, BASE_URL)
+        for backend, functions in EXTRACTORS.items():
+            if backend == "bs4":
+                continue
+            actual = functions[kind](html, BASE_URL)
+            if actual != expected:
+                mismatches += 1
+                print(f"MISMATCH [{backend}] {name}")
+                if isinstance(expected, dict):
+                    for key in expected:
+                        if expected[key] != actual.get(key):
+                            print(f"  {key}: expected {expected[key]!r}")
+                            print(f"  {' ' * len(key)}  got      {actual.get(key)!r}")
+                else:
+                    print(f"  expected {len(expected)} links, got {len(actual)}")
+        checked += 1
+    print(f"Checked {checked} pages: {mismatches} mismatches")
+    return 1 if mismatches or not checked else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,421 @@
+"""Local stand-in for papers.nips.cc, for measuring the crawler without touching the real site.
+
+Serves the root page, /paper_files/paper/<year> indexes, paper pages and
+PDFs in the same markup as the real site (see benchmarks/corpus), either
+generated from a seed or replayed from an HTTP cache directory recorded by
+an earlier crawl (--cache-dir). PDFs are small valid one-page documents
+holding the paper's title and abstract, padded to --pdf-kb, and answer Range
+requests so resumed downloads can be exercised.
+
+Latency, bandwidth and failures are configurable: fixed latency plus
+jitter, latency that grows once more than --capacity requests are in
+flight, a per-response bandwidth cap, 500s, 429s with Retry-After, a hard
+in-flight limit answered with 429, and connections dropped halfway through
+a body. GET /stats returns the counters as JSON.
+
+    python benchmarks/site_simulator.py --port 8766 --years 2020 2021 --papers 200 --latency 0.05
+    python crawler.py --base-url http://127.0.0.1:8766 --output-dir /tmp/bench --start-year 2020
+"""
+import os
+import re
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import argparse
+import threading
+from html import escape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = ("learning neural network deep graph policy optimization stochastic gradient bayesian inference "
+         "representation adversarial robust convex kernel transformer attention generative model sparse "
+         "reinforcement agent reward variational latent diffusion efficient scalable theory bound sample "
+         "complexity online bandit federated privacy causal structure estimation matrix spectral").split()
+FIRST_NAMES = "Ada Alan Grace John Judea Yoshua Geoffrey Fei Daphne Michael Zoubin Leslie Sanjeev Shafi".split()
+LAST_NAMES = "Lovelace Turing Hopper McCarthy Pearl Bengio Hinton Li Koller Jordan Ghahramani Valiant Arora".split()
+
+YEAR_RE = re.compile(r"^/paper_files/paper/(\d{4})$")
+PAPER_RE = re.compile(r"^/paper_files/paper/(\d{4})/hash/([0-9a-f]{32})-Abstract\.html$")
+PDF_RE = re.compile(r"^/paper_files/paper/(\d{4})/file/([0-9a-f]{32})-Paper\.pdf$")
+RANGE_RE = re.compile(r"bytes=(\d+)-$")
+
+CHUNK = 16 * 1024
+
+HEADER = """<!doctype html>
+<html lang="en">
+
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1, shrink-to-fit=no">
+  <title>{title}</title>
+  <link rel="stylesheet" href="/static/css/bootstrap.min.css">
+  <script src="/static/js/jquery-3.3.1.slim.min.js"></script>
+  <script>
+    MathJax = {{ tex: {{ inlineMath: [['$', '$'], ['\\\\(', '\\\\)']] }} }};
+  </script>
+  <script id="MathJax-script" async src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-chtml.js"></script>
+</head>
+
+<body>
+<nav class="navbar navbar-expand-md navbar-dark bg-dark mb-4">
+  <a class="navbar-brand" href="/">NeurIPS Proceedings</a>
+  <button class="navbar-toggler" type="button" data-toggle="collapse" data-target="#navbarCollapse" aria-controls="navbarCollapse" aria-expanded="false" aria-label="Toggle navigation">
+    <span class="navbar-toggler-icon"></span>
+  </button>
+  <div class="collapse navbar-collapse" id="navbarCollapse">
+    <ul class="navbar-nav mr-auto">
+      <li class="nav-item"><a class="nav-link" href="/admin/login/?next=/admin/">Login</a></li>
+    </ul>
+    <form class="form-inline mt-2 mt-md-0" action="/papers/search">
+      <input class="form-control mr-sm-2" type="text" placeholder="Search" aria-label="Search" name="q">
+      <button class="btn btn-outline-success my-2 my-sm-0" type="submit">Search</button>
+    </form>
+  </div>
+</nav>
+
+"""
+
+FOOTER = """
+<footer class="footer">
+  <div class="container"><p class="text-muted">Do not remove: This comment is monitored to verify that the site is working properly</p></div>
+</footer>
+</body>
+</html>
+"""
+
+
+def volume(year):
+    return year - 1987
+
+
+class SyntheticSite:
+    """Deterministic papers for each year: the same seed always yields the same site."""
+
+    def __init__(self, years, papers_per_year, seed=0, pdf_kb=200):
+        self.years = sorted(years, reverse=True)
+        self.pdf_bytes = pdf_kb * 1024
+        self.papers = {}      # year -> [paper hash, ...] in index order
+        self.records = {}     # paper hash -> (year, title, authors, abstract)
+        for year in self.years:
+            rng = random.Random(f"{seed}-{year}")
+            hashes = []
+            for number in range(papers_per_year):
+                paper_hash = hashlib.md5(f"{seed}-{year}-{number}".encode()).hexdigest()
+                title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10))).capitalize()
+                authors = ", ".join(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+                                    for _ in range(rng.randint(1, 6)))
+                abstract = ". ".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize()
+                                     for _ in range(rng.randint(4, 9))) + "."
+                hashes.append(paper_hash)
+                self.records[paper_hash] = (year, f"{title} {number}", authors, abstract)
+            self.papers[year] = hashes
+
+    def root_page(self):
+        items = "".join(f'<li><a href="/paper_files/paper/{year}">Advances in Neural Information Processing '
+                        f'Systems {volume(year)} (NeurIPS {year})</a></li>\n' for year in self.years)
+        return (HEADER.format(title="NeurIPS Proceedings") + '<div class="container-fluid">\n  <div class="col-sm">\n'
+                f"    <ul>\n{items}    </ul>\n  </div>\n</div>\n" + FOOTER)
+
+    def year_page(self, year):
+        if year not in self.papers:
+            return None
+        items = []
+        for paper_hash in self.papers[year]:
+            _, title, authors, _ = self.records[paper_hash]
+            items.append(f'<li class="conference"><a title="paper title" href="/paper_files/paper/{year}/hash/'
+                         f'{paper_hash}-Abstract.html">{escape(title)}</a> <span class="paper-authors">'
+                         f'<i>{escape(authors)}</i></span></li>\n')
+        return (HEADER.format(title=f"NeurIPS {year}") + '<div class="container-fluid">\n  <div class="col">\n'
+                f"    <h4>Advances in Neural Information Processing Systems {volume(year)}  (NeurIPS {year})</h4>\n"
+                f'    <ul class="paper-list">\n{"".join(items)}    </ul>\n  </div>\n</div>\n' + FOOTER)
+
+    def paper_page(self, year, paper_hash):
+        record = self.records.get(paper_hash)
+        if not record or record[0] != year:
+            return None
+        _, title, authors, abstract = record
+        files = f"/paper_files/paper/{year}/file/{paper_hash}"
+        buttons = "".join(f'<a class="btn btn-light btn-spacer" href="{files}-{name}">{label}</a> '
+                          for name, label in [("Bibtex.bib", "Bibtex"), ("Paper.pdf", "Paper"),
+                                              ("Supplemental.pdf", "Supplemental")])
+        return (HEADER.format(title=escape(title)) + '<div class="container-fluid">\n  <div class="col p-3">\n\n'
+                f"    <h4>{escape(title)}</h4>\n    <p>\n      Part of\n"
+                f'      <a href="/paper_files/paper/{year}">Advances in Neural Information Processing Systems '
+                f"{volume(year)}  (NeurIPS {year})</a>\n    </p>\n\n    <div>{buttons}</div>\n\n"
+                f"    <h4>Authors</h4>\n    <p>\n      <i>{escape(authors)}</i>\n    </p>\n\n"
+                f"    <h4>Abstract</h4>\n    <p><p>{escape(abstract)}</p></p>\n\n  </div>\n</div>\n" + FOOTER)
+
+    def pdf(self, year, paper_hash):
+        record = self.records.get(paper_hash)
+        if not record or record[0] != year:
+            return None
+        return make_pdf([record[1], record[2]] + wrap(record[3], 90), self.pdf_bytes)
+
+    def page(self, path):
+        if path == "/":
+            return self.root_page()
+        match = YEAR_RE.match(path)
+        if match:
+            return self.year_page(int(match.group(1)))
+        match = PAPER_RE.match(path)
+        if match:
+            return self.paper_page(int(match.group(1)), match.group(2))
+        return None
+
+
+class RecordedSite:
+    """Pages replayed from an HTTP cache directory written by an earlier crawl, looked up by path."""
+
+    def __init__(self, cache_dir, pdf_kb=200):
+        self.cache_dir = cache_dir
+        self.pdf_bytes = pdf_kb * 1024
+        conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"))
+        self.index = {}
+        for url, sha256 in conn.execute("SELECT url, sha256 FROM entries"):
+            path = "/" + url.split("://", 1)[-1].partition("/")[2]
+            self.index[path] = sha256
+        conn.close()
+
+    def page(self, path):
+        sha256 = self.index.get(path)
+        if not sha256:
+            return None
+        with open(os.path.join(self.cache_dir, "objects", sha256[:2], sha256), "rb") as f:
+            return f.read().decode("utf-8")
+
+    def pdf(self, year, paper_hash):
+        if f"/paper_files/paper/{year}/hash/{paper_hash}-Abstract.html" not in self.index:
+            return None
+        return make_pdf([f"Recorded paper {paper_hash}"], self.pdf_bytes)
+
+
+def wrap(text, width):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    return lines + [line] if line else lines
+
+
+def make_pdf(lines, size):
+    """A valid one-page PDF showing lines of text, padded with an unused stream to about size bytes."""
+    def text(value):
+        return value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("latin-1", "replace")
+
+    content = b"BT /F1 10 Tf 50 780 Td 12 TL " + b" ".join(b"(" + text(line) + b") '" for line in lines) + b" ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    padding = max(0, size - 600 - len(content))
+    objects.append(b"<< /Length %d >>\nstream\n" % padding + b"0" * padding + b"\nendstream")
+    body = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(body))
+        body += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(body)
+    body += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    body += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    body += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(body)
+
+
+class Faults:
+    """Latency, bandwidth and failure settings, plus the counters behind /stats."""
+
+    def __init__(self, latency=0.0, jitter=0.0, capacity=0, bandwidth=0, error_rate=0.0, throttle_rate=0.0,
+                 max_in_flight=0, drop_rate=0.0, retry_after=1, seed=None, ignore_range=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.capacity = capacity
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_in_flight = max_in_flight
+        self.drop_rate = drop_rate
+        self.retry_after = retry_after
+        self.ignore_range = ignore_range
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.counts = {"requests": 0, "pages": 0, "pdfs": 0, "bytes": 0, "errors": 0, "throttled": 0,
+                       "dropped": 0, "not_found": 0, "peak_in_flight": 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+            self.counts["requests"] += 1
+            self.counts["peak_in_flight"] = max(self.counts["peak_in_flight"], self.in_flight)
+            return self.in_flight
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def delay(self, in_flight):
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if self.capacity and in_flight > self.capacity:
+            # Past capacity the server queues: latency grows with the square of the overload.
+            delay *= (in_flight / self.capacity) ** 2
+        return delay
+
+    def stats(self):
+        with self.lock:
+            return {**self.counts, "in_flight": self.in_flight}
+
+
+def make_handler(site, faults):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            in_flight = faults.enter()
+            try:
+                self.respond(in_flight)
+            finally:
+                faults.leave()
+
+        def respond(self, in_flight):
+            path = self.path.split("?", 1)[0]
+            if path == "/stats":
+                return self.send_body(json.dumps(faults.stats()).encode(), "application/json", throttle=False)
+            if (faults.max_in_flight and in_flight > faults.max_in_flight) or faults.roll(faults.throttle_rate):
+                faults.count("throttled")
+                return self.send_empty(429, {"Retry-After": str(faults.retry_after)})
+            time.sleep(faults.delay(in_flight))
+            if faults.roll(faults.error_rate):
+                faults.count("errors")
+                return self.send_empty(500)
+            match = PDF_RE.match(path)
+            if match:
+                body = site.pdf(int(match.group(1)), match.group(2))
+                if body is None:
+                    faults.count("not_found")
+                    return self.send_empty(404)
+                faults.count("pdfs")
+                return self.send_pdf(body)
+            page = site.page(path)
+            if page is None:
+                faults.count("not_found")
+                return self.send_empty(404)
+            faults.count("pages")
+            self.send_body(page.encode("utf-8"), "text/html; charset=utf-8")
+
+        def send_empty(self, status, headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def send_pdf(self, body):
+            match = None if faults.ignore_range else RANGE_RE.match(self.headers.get("Range", ""))
+            start = int(match.group(1)) if match else 0
+            if start >= len(body) and match:
+                return self.send_empty(416, {"Content-Range": f"bytes */{len(body)}"})
+            if match:
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(len(body) - start))
+            self.end_headers()
+            drop = faults.roll(faults.drop_rate)
+            self.write_throttled(body[start:len(body) // 2 if drop and len(body) // 2 > start else len(body)])
+            if drop:
+                faults.count("dropped")
+                self.close_connection = True
+
+        def send_body(self, body, content_type, throttle=True):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if throttle:
+                self.write_throttled(body)
+            else:
+                self.wfile.write(body)
+
+        def write_throttled(self, body):
+            started = time.monotonic()
+            for offset in range(0, len(body), CHUNK):
+                self.wfile.write(body[offset:offset + CHUNK])
+                if faults.bandwidth:
+                    ahead = (offset + CHUNK) / faults.bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+            faults.count("bytes", len(body))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def add_simulator_arguments(parser):
+    parser.add_argument("--years", type=int, nargs="+", default=[2020])
+    parser.add_argument("--papers", type=int, default=100, help="Papers per year")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache-dir", help="Replay the pages recorded in this HTTP cache instead of generating them")
+    parser.add_argument("--pdf-kb", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds, uniformly")
+    parser.add_argument("--capacity", type=int, default=0,
+                        help="Requests in flight beyond which latency grows (0 = never)")
+    parser.add_argument("--bandwidth-kb", type=int, default=0, help="Per-response bandwidth cap in KB/s (0 = none)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction answered with 429 + Retry-After")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="Answer 429 beyond this many in flight (0 = never)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of PDFs cut off halfway")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--ignore-range", action="store_true", help="Answer Range requests with the whole PDF")
+
+
+def build_server(args, port, host="127.0.0.1"):
+    """A ready-to-serve simulator from parsed add_simulator_arguments flags."""
+    site = RecordedSite(args.cache_dir, args.pdf_kb) if args.cache_dir else \
+        SyntheticSite(args.years, args.papers, args.seed, args.pdf_kb)
+    faults = Faults(args.latency, args.jitter, args.capacity, args.bandwidth_kb * 1024, args.error_rate,
+                    args.throttle_rate, args.max_in_flight, args.drop_rate, args.retry_after, args.seed,
+                    args.ignore_range)
+    server = ThreadingHTTPServer((host, port), make_handler(site, faults))
+    server.daemon_threads = True
+    return server, faults
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8766)
+    add_simulator_arguments(parser)
+    args = parser.parse_args()
+
+    server, faults = build_server(args, args.port)
+    print(f"Site simulator on http://127.0.0.1:{server.server_address[1]}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(faults.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Structured timings, counters and queue depths for a crawl.
+
+Each stage (fetch_page, parse, download_pdf, extract_text, metadata_write,
+annotate) feeds a latency histogram and a byte count; counters track
+retries, errors, papers finished and PDF pages read per year; gauges sample
+queue depths whenever a snapshot is taken. A snapshot is a plain dict that
+can be written as JSON or in the Prometheus text format, periodically during
+a run and once at the end, and format_summary turns it into the end-of-run
+report of where the time went.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds in seconds, Prometheus style; everything slower lands in +Inf.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.5, 5.0,
+           10.0, 30.0, 60.0, 120.0)
+STAGES = ("fetch_page", "parse", "download_pdf", "extract_text", "metadata_write", "annotate")
+COUNTER_LABELS = {"retries": "stage", "errors": "stage", "papers": "year", "rows": "stage", "pdf_pages": "year"}
+EXPORT_INTERVAL = 10.0
+SAMPLE_INTERVAL = 1.0        # Seconds between queue depth samples, for the peaks
+PROMETHEUS_SUFFIXES = (".prom", ".txt")
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum and maximum."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimates the q-quantile by interpolating inside the bucket it falls in."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+
+class Metrics:
+    """Thread-safe registry of stage histograms, byte totals, counters and sampled gauges."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.bytes = {}
+        self.counters = {}       # name -> {label: value}
+        self.gauges = {}         # name -> callable returning the current depth
+        self.peaks = {}
+        self.years = {}          # year -> [started, finished or None while it runs]
+
+    def observe(self, stage, seconds, size=0):
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram()
+            self.histograms[stage].observe(seconds)
+            if size:
+                self.bytes[stage] = self.bytes.get(stage, 0) + size
+
+    @contextmanager
+    def timer(self, stage):
+        """Times the block as one observation of stage; failed attempts count too."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - started)
+
+    @contextmanager
+    def year_timer(self, year):
+        """Times the block as the crawl of one year, which its papers_per_second is measured over."""
+        with self.lock:
+            span = self.years.setdefault(str(year), [time.monotonic(), None])
+            span[1] = None
+        try:
+            yield
+        finally:
+            with self.lock:
+                span[1] = time.monotonic()
+
+    def count(self, name, label="", amount=1):
+        with self.lock:
+            values = self.counters.setdefault(name, {})
+            values[str(label)] = values.get(str(label), 0) + amount
+
+    def register_gauge(self, name, depth):
+        """Samples depth() at every snapshot until unregister_gauge(name)."""
+        with self.lock:
+            self.gauges[name] = depth
+
+    def unregister_gauge(self, name):
+        with self.lock:
+            self.gauges.pop(name, None)
+
+    def sample(self):
+        """Reads every gauge, updates the peaks and returns the current depths."""
+        with self.lock:
+            gauges = dict(self.gauges)
+        depths = {}
+        for name, depth in gauges.items():
+            try:
+                depths[name] = depth()
+            except Exception:
+                continue   # The queue went away between registration and sampling.
+        with self.lock:
+            for name, value in depths.items():
+                self.peaks[name] = max(self.peaks.get(name, 0), value)
+        return depths
+
+    def snapshot(self):
+        depths = self.sample()
+        now = time.monotonic()
+        elapsed = max(now - self.started, 1e-9)
+        with self.lock:
+            stages = {}
+            for stage, histogram in self.histograms.items():
+                size = self.bytes.get(stage, 0)
+                stages[stage] = {
+                    "count": histogram.count,
+                    "seconds": histogram.sum,
+                    "max": histogram.max,
+                    "p50": histogram.quantile(0.5),
+                    "p90": histogram.quantile(0.9),
+                    "p99": histogram.quantile(0.99),
+                    "busy": histogram.sum / elapsed,   # Average number of calls in progress
+                    "bytes": size,
+                    "bytes_per_second": size / elapsed,
+                    "call_bytes_per_second": size / histogram.sum if histogram.sum else 0.0,
+                    "buckets": list(zip([*histogram.buckets, "+Inf"], histogram.counts)),
+                }
+            counters = {name: dict(values) for name, values in self.counters.items()}
+            peaks = dict(self.peaks)
+            # Years crawled outside a year_timer fall back to the whole run.
+            durations = {year: max((finished or now) - started, 1e-9)
+                         for year, (started, finished) in self.years.items()}
+        papers = counters.get("papers", {})
+        return {
+            "time": round(time.time(), 3),
+            "elapsed": elapsed,
+            "stages": stages,
+            "counters": counters,
+            "papers_per_second": {year: count / durations.get(year, elapsed) for year, count in papers.items()},
+            "queues": depths,
+            "queue_peaks": peaks,
+        }
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def configure_metrics():
+    """Starts a fresh registry, e.g. at the start of a run, and returns it."""
+    global _metrics
+    with _metrics_lock:
+        _metrics = Metrics()
+        return _metrics
+
+
+def get_metrics():
+    """Returns the process-wide registry, creating one on first use."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+def to_prometheus(snapshot, prefix="crawl"):
+    """Renders a snapshot in the Prometheus text exposition format."""
+    lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+    for stage, entry in snapshot["stages"].items():
+        cumulative = 0
+        for bound, count in entry["buckets"]:
+            cumulative += count
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {entry["seconds"]}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+    lines.append(f"# TYPE {prefix}_bytes_total counter")
+    for stage, entry in snapshot["stages"].items():
+        lines.append(f'{prefix}_bytes_total{{stage="{stage}"}} {entry["bytes"]}')
+    for name, values in snapshot["counters"].items():
+        label = COUNTER_LABELS.get(name, "label")
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        for value, count in values.items():
+            lines.append(f'{prefix}_{name}_total{{{label}="{value}"}} {count}')
+    lines.append(f"# TYPE {prefix}_queue_depth gauge")
+    for name, depth in snapshot["queues"].items():
+        lines.append(f'{prefix}_queue_depth{{queue="{name}"}} {depth}')
+    lines.append(f"# TYPE {prefix}_elapsed_seconds gauge")
+    lines.append(f"{prefix}_elapsed_seconds {snapshot['elapsed']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_snapshot(path, snapshot=None):
+    """Writes a snapshot to path atomically: Prometheus text for .prom/.txt, JSON otherwise."""
+    snapshot = snapshot or get_metrics().snapshot()
+    if path.endswith(PROMETHEUS_SUFFIXES):
+        text = to_prometheus(snapshot)
+    else:
+        text = json.dumps(snapshot, indent=2)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+
+def start_exporter(log, stop_event, path=None, interval=EXPORT_INTERVAL):
+    """Samples the queue depths every SAMPLE_INTERVAL on a daemon thread until stop_event is set.
+
+    With a path, a snapshot is also written there every interval seconds; a
+    failed write is logged and tried again at the next interval.
+    """
+    def export():
+        last_export = time.monotonic()
+        while not stop_event.wait(min(SAMPLE_INTERVAL, interval)):
+            get_metrics().sample()
+            if path and time.monotonic() - last_export >= interval:
+                last_export = time.monotonic()
+                try:
+                    write_snapshot(path)
+                except OSError as e:
+                    log(f"Error: could not write metrics to {path}: {e}")
+
+    thread = threading.Thread(target=export, daemon=True)
+    thread.start()
+    return thread
+
+
+def _seconds(value):
+    if value is None:
+        return "-"
+    return f"{value * 1000:.0f} ms" if value < 1 else f"{value:.1f} s"
+
+
+def _size(value):
+    return f"{value / 1e6:.1f} MB" if value >= 1e6 else f"{value / 1e3:.0f} KB"
+
+
+def format_summary(snapshot):
+    """The end-of-run report as log lines: per-stage latency and throughput, papers/s, retries, queue peaks."""
+    lines = []
+    stages = snapshot["stages"]
+    for stage in sorted(stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+        entry = stages[stage]
+        line = (f"Timing: {stage} {entry['count']} calls, p50 {_seconds(entry['p50'])}, "
+                f"p90 {_seconds(entry['p90'])}, p99 {_seconds(entry['p99'])}, max {_seconds(entry['max'])}, "
+                f"{entry['busy']:.1f} busy on average")
+        if entry["bytes"]:
+            line += (f", {_size(entry['bytes'])}, {_size(entry['bytes_per_second'])}/s overall, "
+                     f"{_size(entry['call_bytes_per_second'])}/s per call")
+        lines.append(line)
+    papers = snapshot["counters"].get("papers", {})
+    if papers:
+        total = sum(papers.values())
+        per_year = ", ".join(f"{year} {count} ({snapshot['papers_per_second'][year]:.1f}/s)"
+                             for year, count in sorted(papers.items()))
+        lines.append(f"Throughput: {total} papers in {snapshot['elapsed']:.1f} s "
+                     f"({total / snapshot['elapsed']:.1f}/s); {per_year}")
+    for name in ("retries", "errors"):
+        values = snapshot["counters"].get(name)
+        if values:
+            lines.append(f"{name.capitalize()}: " + ", ".join(f"{label} {count}" for label, count in values.items()))
+    if snapshot["queue_peaks"]:
+        lines.append("Queue peaks: " + ", ".join(f"{name} {peak}" for name, peak in snapshot["queue_peaks"].items()))
+    if stages:
+        # Stage time overlaps across threads, so "busy" shows where the run spent its concurrency.
+        busiest = max(stages, key=lambda name: stages[name]["seconds"])
+        share = stages[busiest]["seconds"] / max(sum(entry["seconds"] for entry in stages.values()), 1e-9)
+        lines.append(f"Most stage time: {busiest} ({share:.0%})")
+    return lines
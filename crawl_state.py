@@ -0,0 +1,152 @@
+import os
+import time
+import sqlite3
+import threading
+
+STATE_FILENAME = "crawl_state.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL
+);
+CREATE TABLE IF NOT EXISTS papers (
+    paper_url TEXT PRIMARY KEY,
+    year TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    title TEXT,
+    has_pdf INTEGER,
+    pdf_path TEXT,
+    pdf_size INTEGER,
+    pdf_sha256 TEXT,
+    metadata_saved INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS papers_year ON papers (year);
+"""
+
+# A paper is done for a scrape type once these columns say so.
+PDF_DONE = "(IFNULL(has_pdf, 1) = 0 OR pdf_sha256 IS NOT NULL)"
+METADATA_DONE = "(metadata_saved = 1)"
+
+
+def completion_clause(scrape_type):
+    if scrape_type == "PDFs":
+        return PDF_DONE
+    if scrape_type == "Metadata":
+        return METADATA_DONE
+    return f"({PDF_DONE} AND {METADATA_DONE})"
+
+
+def open_state(output_dir):
+    """Opens (or creates) the crawl state stored in the output directory."""
+    os.makedirs(output_dir, exist_ok=True)
+    return CrawlState(os.path.join(output_dir, STATE_FILENAME))
+
+
+class CrawlState:
+    """Persistent per-paper crawl progress keyed by paper_url, shared by all worker threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            self._conn.execute(sql, args)
+            self._conn.commit()
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def conditional_headers(self, url):
+        """Returns If-None-Match/If-Modified-Since headers for a page fetched before."""
+        rows = self._query("SELECT etag, last_modified FROM pages WHERE url = ?", (url,))
+        headers = {}
+        if rows:
+            if rows[0]["etag"]:
+                headers["If-None-Match"] = rows[0]["etag"]
+            if rows[0]["last_modified"]:
+                headers["If-Modified-Since"] = rows[0]["last_modified"]
+        return headers
+
+    def record_page(self, url, etag, last_modified):
+        self._execute(
+            "INSERT INTO pages (url, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, "
+            "fetched_at = excluded.fetched_at",
+            (url, etag, last_modified, time.time())
+        )
+
+    def add_papers(self, year, paper_urls):
+        """Registers the papers listed on a year page so an interrupted run can resume them."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO papers (paper_url, year, updated_at) VALUES (?, ?, ?)",
+                [(url, str(year), now) for url in paper_urls]
+            )
+            self._conn.commit()
+
+    def incomplete_papers(self, year, scrape_type):
+        """Returns the known papers of a year that still need work for this scrape type."""
+        rows = self._query(
+            f"SELECT paper_url FROM papers WHERE year = ? AND NOT {completion_clause(scrape_type)} "
+            "ORDER BY rowid",
+            (str(year),)
+        )
+        return [row["paper_url"] for row in rows]
+
+    def paper(self, paper_url):
+        rows = self._query("SELECT * FROM papers WHERE paper_url = ?", (paper_url,))
+        return dict(rows[0]) if rows else None
+
+    def record_paper_page(self, paper_url, year, title, has_pdf):
+        self._execute(
+            "INSERT INTO papers (paper_url, year, status, title, has_pdf, updated_at) "
+            "VALUES (?, ?, 'fetched', ?, ?, ?) "
+            "ON CONFLICT(paper_url) DO UPDATE SET status = 'fetched', title = excluded.title, "
+            "has_pdf = excluded.has_pdf, error = NULL, updated_at = excluded.updated_at",
+            (paper_url, str(year), title, int(has_pdf), time.time())
+        )
+
+    def record_pdf(self, paper_url, pdf_path, pdf_size, pdf_sha256):
+        self._execute(
+            "UPDATE papers SET pdf_path = ?, pdf_size = ?, pdf_sha256 = ?, updated_at = ? WHERE paper_url = ?",
+            (pdf_path, pdf_size, pdf_sha256, time.time(), paper_url)
+        )
+
+    def record_metadata(self, paper_url):
+        self._execute(
+            "UPDATE papers SET metadata_saved = 1, updated_at = ? WHERE paper_url = ?",
+            (time.time(), paper_url)
+        )
+
+    def record_failure(self, paper_url, year, error):
+        self._execute(
+            "INSERT INTO papers (paper_url, year, status, error, updated_at) VALUES (?, ?, 'failed', ?, ?) "
+            "ON CONFLICT(paper_url) DO UPDATE SET status = 'failed', error = excluded.error, "
+            "updated_at = excluded.updated_at",
+            (paper_url, str(year), error, time.time())
+        )
+
+    def summary(self, scrape_type):
+        rows = self._query(
+            f"SELECT year, COUNT(*) AS total, SUM({completion_clause(scrape_type)}) AS done, "
+            "SUM(status = 'failed') AS failed FROM papers GROUP BY year ORDER BY year"
+        )
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,758 @@
+"""The NeurIPS crawler as a library and a command line tool, without any GUI.
+
+    from crawler import run_crawl, default_options
+    run_crawl({**default_options(), "output_dir": "OUTPUTS", "start_year": 2020}, threading.Event(), print)
+
+    python crawler.py --output-dir OUTPUTS --start-year 2020 --end-year 2021 --scrape-type Both
+    python crawler.py --progress jsonl ...      # one JSON object per line, for orchestrators
+
+script4.py is the Tk front end over the same functions.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import sqlite3
+import argparse
+import requests
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import queue
+from contextlib import contextmanager
+
+from parsers import (parse_year_links, parse_paper_links, parse_paper, sanitize_filename,
+                     configure_extractor, EXTRACTORS, DEFAULT_EXTRACTOR)
+from transport import configure_transport, get_transport, format_stats, POOL_SIZE
+from crawl_state import open_state
+from http_cache import configure_cache, get_cache, format_stats as format_cache_stats, CACHE_DIRNAME, MAX_CACHE_MB
+from parse_pool import ParsePool, run_staged
+from pdf_download import (download_file, record_failure, read_retry_queue, remove_from_retry_queue, DownloadStopped,
+                          DOWNLOAD_ATTEMPTS)
+from metadata_sink import MetadataSink, SINK_FORMATS, DEFAULT_FORMAT
+from pdf_store import open_store, format_stats as format_store_stats
+from paper_index import open_index
+from paper_identity import open_identity
+from pdf_text import (configure_text_extractor, get_text_extractor, format_stats as format_text_stats,
+                      MAX_TEXT_CHARS)
+from host_scheduler import (configure_scheduler, get_scheduler, start_reporter, outcome_for, error_outcome,
+                            retry_after_seconds, backoff_delay, OK, NEUTRAL, ERROR)
+from crawl_metrics import configure_metrics, get_metrics, start_exporter, write_snapshot, format_summary, EXPORT_INTERVAL
+
+SCRAPE_TYPES = ["PDFs", "Metadata", "Both"]
+ENGINES = ["Threads", "Asyncio"]
+CACHE_MODES = ["off", "revalidate", "replay"]
+
+
+def default_options():
+    """The options run_crawl understands, with the defaults the GUI starts from."""
+    return {
+        "base_url": "https://papers.nips.cc",
+        "output_dir": os.getcwd(),
+        "start_year": None,
+        "end_year": None,
+        "scrape_type": "PDFs",
+        "engine": "Threads",
+        "thread_count": 50,
+        "adaptive": True,
+        "pdf_concurrency": 20,
+        "pool_size": POOL_SIZE,
+        "http2": False,
+        "extractor": DEFAULT_EXTRACTOR,
+        "metadata_format": DEFAULT_FORMAT,
+        "parse_workers": 0,
+        "cache_mode": "revalidate",
+        "cache_size": MAX_CACHE_MB,
+        "incremental": True,
+        "max_retries": 3,
+        "timeout": 60,
+        "metrics_file": None,
+        "metrics_interval": EXPORT_INTERVAL,
+        "search_index": True,
+        "identity_index": True,
+        "text_workers": 0,
+        "max_text_chars": MAX_TEXT_CHARS,
+    }
+
+
+def message_level(message):
+    """Classifies a log line the way the GUI colours it: "success", "error" or None."""
+    if any(x in message for x in ["Downloaded:", "Metadata saved:", "Collected metadata for:"]):
+        return "success"
+    if "Failed" in message or "Error:" in message:
+        return "error"
+    return None
+
+
+@contextmanager
+def crawl_session(options, log, crawl_state=None):
+    """Configures the process-wide services for one run and starts the metadata writer.
+
+    Yields (metadata_queue, parse_pool); on exit the writer is drained and
+    everything is torn down again, however the run ended.
+    """
+    output_dir = options["output_dir"]
+    metadata_queue = queue.Queue()
+    stop_writer = threading.Event()
+    stop_reporting = threading.Event()
+
+    configure_cache(os.path.join(output_dir, CACHE_DIRNAME), options["cache_size"], options["cache_mode"])
+    configure_extractor(options["extractor"])
+    parse_pool = ParsePool(options["parse_workers"], extractor=options["extractor"]) if options["parse_workers"] > 0 else None
+    configure_scheduler(options["thread_count"], options["pdf_concurrency"], options["adaptive"])
+    metrics = configure_metrics()
+    extract = options.get("text_workers", 0) > 0 and options["scrape_type"] in ["PDFs", "Both"]
+    configure_text_extractor(output_dir if extract else None, options.get("text_workers"),
+                             options.get("max_text_chars", MAX_TEXT_CHARS))
+    metrics.register_gauge("metadata", metadata_queue.qsize)
+    for kind in ["pages", "pdfs"]:
+        metrics.register_gauge(f"{kind}_in_flight", lambda kind=kind: sum(
+            entry["in_flight"] for entry in get_scheduler().snapshot() if entry["name"].endswith(" " + kind)))
+    if options["engine"].lower() != "asyncio":
+        configure_transport(pool_size=options["pool_size"], http2=options["http2"])
+    start_reporter(log, stop_reporting)
+    start_exporter(log, stop_reporting, options.get("metrics_file"), options.get("metrics_interval", EXPORT_INTERVAL))
+    writer_thread = threading.Thread(
+        target=metadata_writer,
+        args=(metadata_queue, stop_writer, output_dir, log, crawl_state, options["metadata_format"],
+              options.get("search_index", True), options.get("identity_index", True)),
+        daemon=True
+    )
+    if options["scrape_type"] in ["Metadata", "Both"]:
+        writer_thread.start()
+    try:
+        yield metadata_queue, parse_pool
+    finally:
+        stop_reporting.set()
+        stop_writer.set()
+        if writer_thread.is_alive():
+            writer_thread.join()
+        if parse_pool:
+            parse_pool.shutdown()
+        if get_text_extractor():
+            get_text_extractor().shutdown()   # Kept configured until the next run, for log_run_summary.
+        configure_cache(None, mode="off")
+        if options.get("metrics_file"):
+            write_snapshot(options["metrics_file"])
+
+
+def log_run_summary(options, log):
+    for line in format_summary(get_metrics().snapshot()):
+        log(line)
+    if get_cache():
+        log(f"HTTP cache: {format_cache_stats(get_cache().stats())}")
+    if options["scrape_type"] in ["PDFs", "Both"]:
+        log(f"PDF store: {format_store_stats(open_store(options['output_dir']).stats())}")
+    if get_text_extractor():
+        log(f"PDF text: {format_text_stats(get_text_extractor().stats())}")
+
+
+def run_crawl(options, stop_event, log, update_count=None, update_table=None):
+    """Runs one crawl and blocks until it finishes, is stopped through stop_event, or fails.
+
+    options is a dict shaped like default_options(). Sets up the per-run
+    state (crawl state, HTTP cache, parse pool, host scheduler, metadata
+    writer), runs the chosen engine and tears all of it down again.
+    """
+    update_count = update_count or (lambda year: None)
+    update_table = update_table or (lambda year, file_type, name: None)
+    output_dir = options["output_dir"]
+    crawl_state = open_state(output_dir) if options["incremental"] else None
+    try:
+        with crawl_session(options, log, crawl_state) as (metadata_queue, parse_pool):
+            if options["engine"].lower() == "asyncio":
+                from async_engine import run_async_crawl
+                run_async_crawl(
+                    base_url=options["base_url"],
+                    output_dir=output_dir,
+                    page_concurrency=options["thread_count"],
+                    pdf_concurrency=options["pdf_concurrency"],
+                    max_retries=options["max_retries"],
+                    timeout=options["timeout"],
+                    start_year=options["start_year"],
+                    end_year=options["end_year"],
+                    scrape_type=options["scrape_type"],
+                    stop_event=stop_event,
+                    log=log,
+                    metadata_queue=metadata_queue,
+                    update_count=update_count,
+                    update_table=update_table,
+                    pool_size=options["pool_size"],
+                    crawl_state=crawl_state,
+                    parse_pool=parse_pool
+                )
+            else:
+                process_year_links(
+                    base_url=options["base_url"],
+                    output_dir=output_dir,
+                    thread_count=options["thread_count"],
+                    max_retries=options["max_retries"],
+                    timeout=options["timeout"],
+                    start_year=options["start_year"],
+                    end_year=options["end_year"],
+                    scrape_type=options["scrape_type"],
+                    stop_event=stop_event,
+                    log=log,
+                    metadata_queue=metadata_queue,
+                    update_count=update_count,
+                    update_table=update_table,
+                    crawl_state=crawl_state,
+                    parse_pool=parse_pool
+                )
+                log(f"Connections: {format_stats(get_transport().snapshot())}")
+        # After the session, so the metadata writer's last checkpoint is in the summary.
+        log_run_summary(options, log)
+        if stop_event.is_set():
+            log("Process stopped by user")
+        else:
+            log("Scraping completed successfully!")
+    finally:
+        if crawl_state:
+            crawl_state.close()
+
+
+def metadata_writer(metadata_queue, stop_writer, output_dir, log, crawl_state=None, metadata_format=DEFAULT_FORMAT,
+                    search_index=True, identity_index=True):
+    index = open_index(output_dir) if search_index else None
+    identity = open_identity(output_dir) if identity_index else None
+
+    def update_index(name, update):
+        # The rows are published by now, so a failing index must not be reported as a failed metadata write.
+        try:
+            update()
+        except Exception as e:
+            log(f"Error: updating the {name} failed (the metadata itself is saved): {str(e)}")
+
+    def committed(rows):
+        if index is not None:
+            update_index("search index", lambda: index.add(rows))
+        if identity is not None:
+            update_index("identity index", lambda: identity.add(rows))
+        for metadata in rows:
+            if crawl_state:
+                crawl_state.record_metadata(metadata["paper_url"])
+            log(f"Metadata saved: {metadata['title']}")
+
+    def failed(rows, error):
+        failed_dir = os.path.join(output_dir, "failed_metadata")
+        os.makedirs(failed_dir, exist_ok=True)
+        with open(os.path.join(failed_dir, "failed_metadata.txt"), "a", encoding="utf-8") as f:
+            for metadata in rows:
+                error_msg = f"Failed to save metadata for {metadata['title']}: {str(error)}"
+                log(error_msg)
+                f.write(error_msg + "\n")
+
+    sink = MetadataSink(output_dir, metadata_format, on_commit=committed, on_error=failed)
+    try:
+        while not stop_writer.is_set() or not metadata_queue.empty():
+            try:
+                sink.write(metadata_queue.get(timeout=1))
+            except queue.Empty:
+                pass
+            sink.maybe_checkpoint()
+    finally:
+        sink.close()
+        if index is not None:
+            update_index("search index", index.flush)
+        if identity is not None:
+            identity.close()
+
+
+def process_year_links(base_url, output_dir, thread_count, max_retries, timeout, start_year, end_year,
+                         scrape_type, stop_event, log, metadata_queue, update_count, update_table,
+                         crawl_state=None, parse_pool=None):
+    if scrape_type in ["PDFs", "Both"]:
+        retry_failed_pdfs(output_dir, thread_count, timeout, stop_event, log, update_count, update_table,
+                          crawl_state)
+    log("Fetching main page...")
+    main_page_html = fetch_page(base_url, max_retries, timeout, stop_event, log)
+    if not main_page_html:
+        return
+
+    for year_url in parse_year_links(main_page_html, base_url):
+        if stop_event.is_set():
+            log("Process stopped by user")
+            return
+        year = year_url.split("/")[-1]
+        if not year.isdigit():
+            continue
+        year_int = int(year)
+        if (start_year and year_int < start_year) or (end_year and year_int > end_year):
+            log(f"Skipping year {year}")
+            continue
+
+        log(f"\nProcessing year: {year}")
+        with get_metrics().year_timer(year):
+            process_paper_links(year_url, year, base_url, output_dir, thread_count, max_retries,
+                                timeout, scrape_type, stop_event, log, metadata_queue, update_count, update_table,
+                                crawl_state, parse_pool)
+
+
+def process_paper_links(year_url, year, base_url, output_dir, thread_count, max_retries, timeout,
+                        scrape_type, stop_event, log, metadata_queue, update_count, update_table,
+                        crawl_state=None, parse_pool=None):
+    log(f"Fetching year page: {year_url}")
+    headers = crawl_state.conditional_headers(year_url) if crawl_state else None
+    response = fetch_response(year_url, max_retries, timeout, stop_event, log, headers)
+    if response is None:
+        return
+
+    if response.status_code == 304:
+        log(f"Year page unchanged: {year_url}")
+        paper_links = crawl_state.incomplete_papers(year, scrape_type)
+    else:
+        paper_links = parse_paper_links(response.text, base_url)
+        if crawl_state:
+            # Register every paper before working on any, so a crash resumes from the state alone.
+            crawl_state.add_papers(year, paper_links)
+            crawl_state.record_page(year_url, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            total = len(paper_links)
+            paper_links = crawl_state.incomplete_papers(year, scrape_type)
+            log(f"Year {year}: {total - len(paper_links)} papers already complete, {len(paper_links)} to process")
+    if crawl_state and not paper_links:
+        log(f"Year {year} is up to date")
+        return
+
+    if parse_pool:
+        process_papers_staged(paper_links, year, base_url, output_dir, thread_count, max_retries, timeout,
+                              scrape_type, stop_event, log, metadata_queue, update_count, update_table,
+                              parse_pool, crawl_state)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=thread_count)
+    try:
+        futures = []
+        for url in paper_links:
+            futures.append(executor.submit(
+                process_paper,
+                url, year, base_url, output_dir,
+                max_retries, timeout, scrape_type,
+                stop_event, log, metadata_queue, update_count, update_table,
+                crawl_state
+            ))
+        for url, future in zip(paper_links, futures):
+            if stop_event.is_set():
+                break
+            try:
+                future.result()
+            except Exception as e:
+                paper_failed(url, year, e, log, crawl_state)
+    finally:
+        # Once stopped (or failed), papers that have not started are dropped rather than waited for.
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def paper_failed(paper_url, year, error, log, crawl_state=None):
+    """Logs and records a paper lost to an unexpected error; like the asyncio engine, the rest of the year goes on."""
+    log(f"Failed to process {paper_url}: {type(error).__name__}: {str(error)}")
+    get_metrics().count("errors", "process_paper")
+    if crawl_state and not isinstance(error, sqlite3.Error):
+        crawl_state.record_failure(paper_url, year, str(error))
+
+
+def process_papers_staged(paper_links, year, base_url, output_dir, thread_count, max_retries, timeout,
+                          scrape_type, stop_event, log, metadata_queue, update_count, update_table,
+                          parse_pool, crawl_state=None):
+    """Like the thread pool in process_paper_links, but paper pages are parsed in worker processes."""
+    def fetch(paper_url):
+        log(f"Processing paper: {paper_url}")
+        response = fetch_response(paper_url, max_retries, timeout, stop_event, log)
+        if response is None:
+            if crawl_state and not stop_event.is_set():
+                crawl_state.record_failure(paper_url, year, "paper page fetch failed")
+            return None
+        return response.text, None
+
+    def finish(paper_url, paper, context):
+        if stop_event.is_set():
+            return
+        finish_paper(paper_url, year, paper, output_dir, timeout, scrape_type,
+                     stop_event, log, metadata_queue, update_count, update_table, crawl_state)
+
+    def fail(paper_url, error):
+        paper_failed(paper_url, year, error, log, crawl_state)
+
+    run_staged(paper_links, fetch, finish, fail, base_url, thread_count, parse_pool, stop_event, log)
+
+
+def process_paper(paper_url, year, base_url, output_dir, max_retries, timeout,
+                  scrape_type, stop_event, log, metadata_queue, update_count, update_table,
+                  crawl_state=None):
+    if stop_event.is_set():
+        return
+
+    log(f"Processing paper: {paper_url}")
+    response = fetch_response(paper_url, max_retries, timeout, stop_event, log)
+    if response is None:
+        if crawl_state and not stop_event.is_set():
+            crawl_state.record_failure(paper_url, year, "paper page fetch failed")
+        return
+
+    with get_metrics().timer("parse"):
+        paper = parse_paper(response.text, base_url)
+    finish_paper(paper_url, year, paper, output_dir, timeout, scrape_type, stop_event, log, metadata_queue,
+                 update_count, update_table, crawl_state)
+
+
+def finish_paper(paper_url, year, paper, output_dir, timeout, scrape_type,
+                 stop_event, log, metadata_queue, update_count, update_table, crawl_state=None):
+    """Downloads the PDF and/or queues the metadata of a parsed paper page."""
+    title = paper["title"]
+    authors = paper["authors"]
+    abstractText = paper["abstract"]
+    pdf_url = paper["pdf_url"]
+
+    # Only redo the parts a previous run has not finished.
+    previous = crawl_state.paper(paper_url) if crawl_state else None
+    need_pdf = not (previous and previous["pdf_sha256"])
+    need_metadata = not (previous and previous["metadata_saved"])
+    if crawl_state:
+        crawl_state.record_paper_page(paper_url, year, title, bool(pdf_url))
+
+    if scrape_type in ["PDFs", "Both"] and pdf_url and need_pdf:
+        sanitized_title = sanitize_filename(title)
+        result = download_pdf(pdf_url, sanitized_title, year, output_dir, timeout, stop_event, log,
+                              update_count, update_table, paper_url)
+        if result and crawl_state:
+            crawl_state.record_pdf(paper_url, *result)
+
+    if scrape_type in ["Metadata", "Both"] and need_metadata:
+        metadata = {
+            "title": title,
+            "authors": authors,
+            "abstract": abstractText,
+            "pdf_url": pdf_url or "",
+            "paper_url": paper_url,
+            "year": year
+        }
+        metadata_queue.put(metadata)
+        log(f"Collected metadata for: {title}")
+        update_table(year, "Metadata", title)
+    if not stop_event.is_set():
+        get_metrics().count("papers", year)
+
+
+def download_pdf(url, filename, year, output_dir, timeout, stop_event, log, update_count, update_table,
+                 paper_url=None):
+    """Downloads a PDF into the PDF store; returns (path, size, sha256) on success, None otherwise."""
+    if stop_event.is_set():
+        return None
+    store = open_store(output_dir)
+    known = store.lookup(year, paper_url or url)
+    if known:
+        log(f"Already stored: {filename}")
+        return known
+
+    try:
+        # Closing the response inside download_file hands its connection back to the shared pool.
+        staged = store.staging_path(url)
+        extractor = get_text_extractor()
+        data = bytearray() if extractor else None
+        size, sha256 = fetch_pdf(url, staged, timeout, stop_event, log, data)
+        path = store.add(year, paper_url or url, staged, sha256, filename)
+        if extractor:
+            extractor.submit(year, paper_url or url, sha256, data)
+        log(f"Downloaded: {filename}")
+        update_count(year)
+        update_table(year, "PDF", filename)
+        return path, size, sha256
+    except DownloadStopped:
+        log(f"Stopped downloading: {filename}")
+        return None
+    except Exception as e:
+        log(f"Failed to download {url}: {str(e)}")
+        record_failure(output_dir, url, filename, year, paper_url, e)
+        return None
+
+
+def fetch_pdf(url, path, timeout, stop_event, log, keep=None):
+    """download_file under the host's PDF limit; throttled, failed or cut-off downloads are retried with backoff."""
+    limiter = get_scheduler().limiter(url, "pdfs")
+    metrics = get_metrics()
+    for attempt in range(DOWNLOAD_ATTEMPTS):
+        if not limiter.acquire(stop_event):
+            raise DownloadStopped()
+        started = time.monotonic()
+        outcome, retry_after, size = OK, None, 0
+        try:
+            size, sha256 = download_file(get_transport(), url, path, timeout, stop_event, keep)
+            return size, sha256
+        except DownloadStopped:
+            outcome = NEUTRAL
+            raise
+        except Exception as e:
+            outcome, retry_after = error_outcome(e)
+            metrics.count("errors", "download_pdf")
+            if outcome == NEUTRAL or attempt + 1 == DOWNLOAD_ATTEMPTS:
+                raise
+            log(f"Attempt {attempt+1} failed for {url}: {str(e)}")
+            metrics.count("retries", "download_pdf")
+        finally:
+            limiter.release(outcome, retry_after=retry_after)
+            metrics.observe("download_pdf", time.monotonic() - started, size)
+        if stop_event.wait(backoff_delay(attempt, retry_after)):
+            raise DownloadStopped()
+
+
+def retry_failed_pdfs(output_dir, thread_count, timeout, stop_event, log, update_count, update_table,
+                      crawl_state=None):
+    """Retries the PDFs that failed in earlier runs; only the ones that succeed leave the queue."""
+    entries = read_retry_queue(output_dir)
+    if not entries:
+        return
+    log(f"Retrying {len(entries)} previously failed PDFs")
+    succeeded = []
+
+    def retry(entry):
+        result = download_pdf(entry["url"], entry["filename"], entry["year"], output_dir, timeout, stop_event,
+                              log, update_count, update_table, entry["paper_url"])
+        if result:
+            succeeded.append(entry["url"])
+            if crawl_state and entry["paper_url"]:
+                crawl_state.record_pdf(entry["paper_url"], *result)
+
+    try:
+        with ThreadPoolExecutor(max_workers=thread_count) as executor:
+            list(executor.map(retry, entries))
+    finally:
+        remove_from_retry_queue(output_dir, succeeded)
+
+
+def fetch_response(url, max_retries, timeout, stop_event, log, headers=None):
+    """Fetches a page with retries; a 304 answer to conditional headers is returned as-is.
+
+    When the HTTP cache is on, pages are revalidated against it (or, in replay
+    mode, served only from it) unless the caller sends its own validators.
+    """
+    cache = get_cache()
+    if cache and cache.replay:
+        response = cache.replay_response(url)
+        if response is None:
+            log(f"Failed: {url} is not in the HTTP cache (replay mode)")
+        return response
+    entry = cache.lookup(url) if cache and not headers else None
+    if entry:
+        headers = cache.conditional_headers(entry)
+
+    limiter = get_scheduler().limiter(url, "pages")
+    metrics = get_metrics()
+    for attempt in range(max_retries):
+        if not limiter.acquire(stop_event):
+            return None
+        started = time.monotonic()
+        outcome, retry_after, size = ERROR, None, 0
+        try:
+            response = get_transport().get(url, timeout, headers=headers)
+            outcome, retry_after = outcome_for(response.status_code), retry_after_seconds(response.headers)
+            size = len(response.content)
+            if response.status_code == 304:
+                return cache.hit(entry, revalidated=True) if entry else response
+            response.raise_for_status()
+            if cache:
+                cache.store(url, response.text, response.headers.get("ETag"),
+                            response.headers.get("Last-Modified"), response.headers.get("Cache-Control"))
+            return response
+        except requests.RequestException as e:
+            log(f"Attempt {attempt+1} failed for {url}: {str(e)}")
+            metrics.count("errors", "fetch_page")
+        finally:
+            latency = time.monotonic() - started
+            limiter.release(outcome, latency, retry_after)
+            metrics.observe("fetch_page", latency, size)
+        if stop_event.wait(backoff_delay(attempt, retry_after)):
+            return None
+        if attempt + 1 < max_retries:
+            metrics.count("retries", "fetch_page")
+    log(f"Max retries reached for {url}")
+    return None
+
+
+def fetch_page(url, max_retries, timeout, stop_event, log):
+    response = fetch_response(url, max_retries, timeout, stop_event, log)
+    return response.text if response is not None else None
+
+
+class JsonLinesProgress:
+    """Machine-readable progress on a stream, one JSON object per line.
+
+    Events: "start" (the options), "log" (every log line, with its level),
+    "item" (a PDF downloaded or a metadata row collected, with the running
+    PDF totals) and "finish" (status "completed", "stopped" or "failed").
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.total = 0
+        self.yearly = {}
+
+    def emit(self, event, **fields):
+        line = json.dumps({"event": event, "time": round(time.time(), 3), **fields}, ensure_ascii=False, default=str)
+        with self.lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def log(self, message):
+        self.emit("log", level=message_level(message), message=message.strip())
+
+    def update_count(self, year):
+        with self.lock:
+            self.total += 1
+            self.yearly[str(year)] = self.yearly.get(str(year), 0) + 1
+
+    def update_table(self, year, file_type, name):
+        with self.lock:
+            total, year_total = self.total, self.yearly.get(str(year), 0)
+        self.emit("item", year=str(year), type=file_type, name=name, total=total, year_total=year_total)
+
+    def finish(self, status, error=None):
+        with self.lock:
+            totals = {"total": self.total, "yearly": dict(self.yearly)}
+        self.emit("finish", status=status, error=error, elapsed=round(time.monotonic() - self.started, 3), **totals)
+
+
+def print_log(message):
+    # One write per message so lines from different worker threads don't interleave.
+    sys.stdout.write(message + "\n")
+    sys.stdout.flush()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Scrape NeurIPS papers without the GUI.")
+    parser.add_argument("--headless", action="store_true", help=argparse.SUPPRESS)   # Accepted from script4.py
+    add_crawl_arguments(parser)
+    parser.add_argument("--progress", choices=["text", "jsonl"], default="text",
+                        help="jsonl: write progress to stdout as one JSON object per line")
+    return parser
+
+
+def add_crawl_arguments(parser):
+    """The crawl options, as command line flags; options_from_args turns them back into an options dict."""
+    defaults = default_options()
+    parser.add_argument("--base-url", default=defaults["base_url"])
+    parser.add_argument("--output-dir", default=defaults["output_dir"])
+    parser.add_argument("--start-year", type=int)
+    parser.add_argument("--end-year", type=int)
+    parser.add_argument("--scrape-type", choices=SCRAPE_TYPES, default=defaults["scrape_type"])
+    parser.add_argument("--engine", choices=[engine.lower() for engine in ENGINES], default=defaults["engine"].lower())
+    parser.add_argument("--page-concurrency", "--threads", dest="page_concurrency", type=int,
+                        default=defaults["thread_count"],
+                        help="Pages in flight (the thread count with --engine threads)")
+    parser.add_argument("--pdf-concurrency", type=int, default=defaults["pdf_concurrency"])
+    parser.add_argument("--pool-size", type=int, default=defaults["pool_size"])
+    parser.add_argument("--http2", action="store_true", help="HTTP/2 for the threads engine (needs httpx and h2)")
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="Always use the full page/PDF concurrency instead of adapting it per host")
+    parser.add_argument("--full", action="store_true", help="Ignore the crawl state and redo every paper")
+    parser.add_argument("--cache", choices=CACHE_MODES, default=defaults["cache_mode"])
+    parser.add_argument("--cache-size-mb", type=int, default=defaults["cache_size"])
+    parser.add_argument("--extractor", choices=list(EXTRACTORS), default=defaults["extractor"])
+    parser.add_argument("--metadata-format", choices=list(SINK_FORMATS), default=defaults["metadata_format"])
+    parser.add_argument("--parse-workers", type=int, default=defaults["parse_workers"],
+                        help="Parse paper pages in this many worker processes (0 = on the I/O threads)")
+    parser.add_argument("--max-retries", type=int, default=defaults["max_retries"])
+    parser.add_argument("--timeout", type=int, default=defaults["timeout"])
+    parser.add_argument("--metrics-file",
+                        help="Write a metrics snapshot here during and after the run (Prometheus text for .prom, else JSON)")
+    parser.add_argument("--metrics-interval", type=float, default=defaults["metrics_interval"],
+                        help="Seconds between metrics snapshots")
+    parser.add_argument("--text-workers", type=int, default=defaults["text_workers"],
+                        help="Extract text from downloaded PDFs in this many worker processes (0 = off)")
+    parser.add_argument("--max-text-chars", type=int, default=defaults["max_text_chars"],
+                        help="Characters of text kept per PDF")
+    parser.add_argument("--no-index", action="store_true",
+                        help="Do not add the metadata rows to the search index (see paper_index.py)")
+    parser.add_argument("--no-identity", action="store_true",
+                        help="Do not match the metadata rows against known papers and authors (see paper_identity.py)")
+
+
+def options_from_args(args):
+    if args.start_year and args.end_year and args.start_year > args.end_year:
+        raise ValueError("Start year must be <= end year")
+    return {
+        "base_url": args.base_url,
+        "output_dir": args.output_dir,
+        "start_year": args.start_year,
+        "end_year": args.end_year,
+        "scrape_type": args.scrape_type,
+        "engine": args.engine,
+        "thread_count": args.page_concurrency,
+        "adaptive": not args.fixed_concurrency,
+        "pdf_concurrency": args.pdf_concurrency,
+        "pool_size": args.pool_size,
+        "http2": args.http2,
+        "extractor": args.extractor,
+        "metadata_format": args.metadata_format,
+        "parse_workers": args.parse_workers,
+        "cache_mode": args.cache,
+        "cache_size": args.cache_size_mb,
+        "incremental": not args.full,
+        "max_retries": args.max_retries,
+        "timeout": args.timeout,
+        "metrics_file": args.metrics_file,
+        "metrics_interval": args.metrics_interval,
+        "search_index": not args.no_index,
+        "identity_index": not args.no_identity,
+        "text_workers": args.text_workers,
+        "max_text_chars": args.max_text_chars,
+    }
+
+
+@contextmanager
+def stop_on_interrupt(stop_event, log):
+    """Turns Ctrl-C into stop_event while a headless run is in progress; a second Ctrl-C aborts at once.
+
+    Only the main thread can install signal handlers; elsewhere this does nothing.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def interrupt(signum, frame):
+        if stop_event.is_set():
+            raise KeyboardInterrupt
+        log("Stopping after the papers in progress (Ctrl-C again to abort)")
+        stop_event.set()
+
+    previous = signal.signal(signal.SIGINT, interrupt)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        options = options_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    stop_event = threading.Event()
+    if args.progress == "jsonl":
+        progress = JsonLinesProgress()
+        progress.emit("start", options=options)
+        log, update_count, update_table = progress.log, progress.update_count, progress.update_table
+    else:
+        progress = None
+        log, update_count, update_table = print_log, None, None
+    try:
+        with stop_on_interrupt(stop_event, log):
+            run_crawl(options, stop_event, log, update_count, update_table)
+    except KeyboardInterrupt:
+        stop_event.set()
+        log("Process stopped by user")
+    except Exception as e:
+        log(f"Error: {str(e)}")
+        if progress:
+            progress.finish("failed", str(e))
+        return 1
+    if progress:
+        progress.finish("stopped" if stop_event.is_set() else "completed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+from html.entities import html5
+from html.parser import HTMLParser
+
+# Elements BeautifulSoup's html.parser builder never keeps open.
+VOID_TAGS = frozenset([
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta",
+    "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex",
+    "nextid", "spacer",
+])
+
+# Elements whose strings BeautifulSoup gives their own type (Script, Stylesheet, TemplateString). get_text()
+# on any other element skips them; on one of these it returns only the strings of its own type.
+STRING_CONTAINERS = frozenset(["script", "style", "template"])
+
+
+class _Done(Exception):
+    """Raised from a handler once everything needed has been extracted."""
+
+
+class _Frame:
+    __slots__ = ("tag", "attrs", "children", "string", "texts", "seq", "container")
+
+    def __init__(self, tag, attrs):
+        self.tag = tag
+        self.attrs = attrs
+        self.children = 0
+        self.string = None
+        self.texts = None
+        self.seq = 0
+        self.container = None
+
+
+class _TreeParser(HTMLParser):
+    """Tokenizer that tracks the open-element stack exactly as BeautifulSoup's html.parser tree would.
+
+    Only the stack is kept, never the tree, so subclasses see each element's
+    parent chain, child count, `.string` and stripped text without the cost of
+    building and walking a full soup.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack = [_Frame(None, {})]
+        self.containers = []      # Open script/style/template elements; the innermost types the strings
+        self.open_counts = {}
+        self.collectors = []
+        self.closed_voids = []
+        self._data = []
+
+    def _flush(self):
+        if not self._data:
+            return
+        text = "".join(self._data)
+        self._data = []
+        self._add_string(text, self.containers[-1].tag if self.containers else None)
+
+    def _add_string(self, text, container=False):
+        """Adds a string child to the open element; its text counts for collectors in the same container.
+
+        container=False marks strings get_text() never returns (comments, doctypes, processing instructions).
+        BeautifulSoup drops empty strings entirely.
+        """
+        if not text:
+            return
+        parent = self.stack[-1]
+        parent.children += 1
+        parent.string = text
+        if container is not False and self.collectors:
+            stripped = text.strip()
+            if stripped:
+                for frame in self.collectors:
+                    if frame.container == container:
+                        frame.texts.append(stripped)
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    # Character references are decoded the way BeautifulSoup does it, which differs
+    # from html.unescape for unterminated entities and Windows-1252 code points.
+    def handle_charref(self, name):
+        try:
+            code = int(name[1:], 16) if name[:1] in ("x", "X") else int(name)
+        except ValueError:
+            code = -1
+        data = None
+        if 0 <= code < 256:
+            try:
+                data = bytes([code]).decode("windows-1252")
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(code)
+            except (ValueError, OverflowError):
+                pass
+        self._data.append(data or "\N{REPLACEMENT CHARACTER}")
+
+    def handle_entityref(self, name):
+        self._data.append(html5.get(name + ";", "&" + name))
+
+    def handle_comment(self, data):
+        self._flush()
+        self._add_string(data)
+
+    def handle_decl(self, decl):
+        self._flush()
+        self._add_string(decl[len("DOCTYPE "):])
+
+    def handle_pi(self, data):
+        self._flush()
+        self._add_string(data)
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.upper().startswith("CDATA["):
+            # CData is text to get_text() everywhere except inside script/style/template.
+            self._add_string(data[len("CDATA["):], None)
+        else:
+            self._add_string(data)
+
+    def handle_starttag(self, tag, attrs, self_closing=False):
+        self._flush()
+        frame = _Frame(tag, {name: value if value is not None else "" for name, value in attrs})
+        self.start(frame)
+        if tag in VOID_TAGS:
+            self._close(frame)
+            if not self_closing:
+                # A later explicit </tag> for it is swallowed without ending the current text.
+                self.closed_voids.append(tag)
+            return
+        self.stack.append(frame)
+        self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+        if tag in STRING_CONTAINERS:
+            self.containers.append(frame)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, self_closing=True)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_voids:
+            self.closed_voids.remove(tag)
+            return
+        self._flush()
+        if not self.open_counts.get(tag):
+            return
+        while True:
+            frame = self.stack.pop()
+            self.open_counts[frame.tag] -= 1
+            self._close(frame)
+            if frame.tag == tag:
+                return
+
+    def _close(self, frame):
+        if self.containers and self.containers[-1] is frame:
+            self.containers.pop()
+        if frame.texts is not None:
+            self.collectors.remove(frame)
+        parent = self.stack[-1]
+        parent.children += 1
+        parent.string = frame.string if frame.children == 1 else None
+        self.end(frame)
+
+    def collect_text(self, frame):
+        if frame.texts is None:
+            frame.texts = []
+            frame.container = frame.tag if frame.tag in STRING_CONTAINERS else None
+            self.collectors.append(frame)
+
+    def run(self, html):
+        try:
+            self.feed(html)
+            self.close()
+            self._flush()
+            while len(self.stack) > 1:
+                self._close(self.stack.pop())
+        except _Done:
+            pass
+
+    def start(self, frame):
+        pass
+
+    def end(self, frame):
+        pass
+
+
+class _PaperParser(_TreeParser):
+    """Pulls the fields parse_paper needs, stopping as soon as all of them are known.
+
+    BeautifulSoup's find() returns the first match in document order, but an
+    element's `.string` is only known when it closes, so matches are ranked by
+    the order their start tags appeared (an enclosing h4 or a wins).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.seq = 0
+        self.title = None
+        self.first_h4 = None
+        self.sections = {"Authors": None, "Abstract": None}   # heading -> sibling text, False if no sibling
+        self.owners = {}                                        # heading -> start order of its h4
+        self.waiting = {}                                       # heading -> parent frame of its h4
+        self.siblings = {}                                      # frame -> headings it is the sibling of
+        self.pdf_href = None
+        self.pdf_seq = None
+
+    def start(self, frame):
+        self.seq += 1
+        frame.seq = self.seq
+        if self.waiting:
+            parent = self.stack[-1]
+            for heading, waiting_parent in list(self.waiting.items()):
+                if waiting_parent is parent:
+                    del self.waiting[heading]
+                    self.siblings.setdefault(frame, []).append(heading)
+                    self.collect_text(frame)
+        if frame.tag == "h4":
+            if self.first_h4 is None:
+                self.first_h4 = frame
+            self.collect_text(frame)
+        elif frame.tag == "a":
+            self.collect_text(frame)
+
+    def end(self, frame):
+        if frame.tag == "h4":
+            if frame is self.first_h4:
+                self.title = "".join(frame.texts)
+            string = frame.string if frame.children == 1 else None
+            if string:
+                for heading in self.sections:
+                    owner = self.owners.get(heading)
+                    if heading in string and (owner is None or frame.seq < owner):
+                        self.owners[heading] = frame.seq
+                        self.sections[heading] = None
+                        self.waiting[heading] = self.stack[-1]
+                        for headings in self.siblings.values():
+                            if heading in headings:
+                                headings.remove(heading)
+        elif frame.tag == "a" and (self.pdf_seq is None or frame.seq < self.pdf_seq):
+            if frame.children == 1 and frame.string == "Paper":
+                self.pdf_href = frame.attrs["href"]
+                self.pdf_seq = frame.seq
+        for heading in self.siblings.pop(frame, ()):
+            self.sections[heading] = "".join(frame.texts)
+        # Any heading still waiting on this element as its parent has no next sibling.
+        for heading, waiting_parent in list(self.waiting.items()):
+            if waiting_parent is frame:
+                del self.waiting[heading]
+                self.sections[heading] = False
+        if (self.title is not None and self.pdf_href is not None
+                and all(value is not None for value in self.sections.values())
+                and not self.open_counts.get("h4") and not self.open_counts.get("a")):
+            raise _Done()
+
+
+class _PaperLinksParser(_TreeParser):
+    """Matches "body > div.container-fluid > div > ul li a" against the open-element stack."""
+
+    def __init__(self):
+        super().__init__()
+        self.hrefs = []
+
+    def start(self, frame):
+        if frame.tag != "a":
+            return
+        stack = self.stack
+        seen_li = False
+        for i in range(len(stack) - 1, 0, -1):
+            tag = stack[i].tag
+            if tag == "li":
+                seen_li = True
+            elif tag == "ul" and seen_li and i >= 4:
+                container = stack[i - 2]
+                if (stack[i - 1].tag == "div" and container.tag == "div"
+                        and "container-fluid" in container.attrs.get("class", "").split()
+                        and stack[i - 3].tag == "body"):
+                    self.hrefs.append(frame.attrs["href"])
+                    return
+
+
+class _YearLinksParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href") or ""
+            if href.startswith("/paper_files/paper/"):
+                self.hrefs.append(href)
+
+
+def parse_year_links(main_page_html, base_url):
+    """Returns the year page URLs linked from the main page."""
+    parser = _YearLinksParser()
+    parser.feed(main_page_html)
+    parser.close()
+    return [base_url + href for href in parser.hrefs]
+
+
+def parse_paper_links(year_page_html, base_url):
+    """Returns the paper page URLs listed on a year page."""
+    parser = _PaperLinksParser()
+    parser.run(year_page_html)
+    return [base_url + href for href in parser.hrefs]
+
+
+def parse_paper(paper_html, base_url):
+    """Extracts title, authors, abstract and PDF URL from a paper page."""
+    parser = _PaperParser()
+    parser.run(paper_html)
+    # A section is None when its heading is missing and False when the heading has no next sibling.
+    authors = parser.sections["Authors"]
+    abstract = parser.sections["Abstract"]
+    return {
+        "title": parser.title if parser.title is not None else "Untitled",
+        "authors": authors if isinstance(authors, str) else "Unknown",
+        "abstract": abstract if isinstance(abstract, str) else "No abstract available",
+        "pdf_url": base_url + parser.pdf_href if parser.pdf_href is not None else None,
+    }
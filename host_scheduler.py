@@ -0,0 +1,258 @@
+"""Host-aware adaptive concurrency for the crawler.
+
+Each (host, kind) pair, kind being "pages" or "pdfs", has its own AIMD
+limit on requests in flight. It grows while responses come back quickly and
+cleanly: doubling per round trip at first, then by one per round trip. It is
+cut multiplicatively on 429/5xx/timeouts, or when latency climbs well above
+the best the host has shown, at most once per round trip. A 429/503 with
+Retry-After pauses the whole host for that long. Retries wait an exponential
+backoff with full jitter. The configured thread count / concurrency stays
+the hard ceiling.
+"""
+import time
+import random
+import asyncio
+import threading
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+
+INITIAL_LIMIT = 4
+MIN_LIMIT = 1
+ERROR_DECREASE = 0.5         # Limit multiplier on 429/5xx/network errors
+LATENCY_DECREASE = 0.8       # Limit multiplier when latency climbs
+LATENCY_TOLERANCE = 2.0      # Latency above this multiple of the baseline...
+LATENCY_SLACK = 0.05         # ...plus these seconds counts as congestion (jitter on fast hosts does not)
+EWMA_WEIGHT = 0.2
+BASELINE_DRIFT = 0.01        # Lets the baseline follow a host that got permanently slower
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+MAX_RETRY_AFTER = 300.0
+REPORT_INTERVAL = 5.0
+
+OK = "ok"                    # 2xx/3xx
+NEUTRAL = "neutral"          # Other 4xx: the server is fine, the request is not
+ERROR = "error"              # 5xx, timeouts, connection errors
+OVERLOAD = "overload"        # 429/503: the server asked us to slow down
+OVERLOAD_STATUSES = {429, 503}
+
+
+def outcome_for(status):
+    if status in OVERLOAD_STATUSES:
+        return OVERLOAD
+    if status >= 500:
+        return ERROR
+    if status >= 400:
+        return NEUTRAL
+    return OK
+
+
+def retry_after_seconds(headers):
+    """Parses Retry-After (seconds or an HTTP date); None if absent or unreadable."""
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def error_outcome(error):
+    """(outcome, retry_after) for an exception from a request: HTTP errors by status, anything else is ERROR."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status", None)
+    if not isinstance(status, int):
+        return ERROR, None
+    return outcome_for(status), retry_after_seconds(getattr(response, "headers", None) or getattr(error, "headers", None))
+
+
+def backoff_delay(attempt, retry_after=None, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Full-jitter exponential backoff for retry number attempt (0-based), never shorter than Retry-After."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after) if retry_after else delay
+
+
+class AdaptiveLimiter:
+    """AIMD limit on concurrent requests to one host, usable from threads and from one event loop."""
+
+    def __init__(self, name, maximum, adaptive=True, use_latency=True, initial=INITIAL_LIMIT):
+        self.name = name
+        self.maximum = max(MIN_LIMIT, maximum)
+        self.adaptive = adaptive
+        self.use_latency = use_latency
+        self.limit = float(min(initial, self.maximum) if adaptive else self.maximum)
+        self.slow_start = adaptive
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.latency = None      # EWMA of response latency
+        self.baseline = None     # Best recent latency
+        self.last_decrease = 0.0
+        self.counts = {OK: 0, NEUTRAL: 0, ERROR: 0, OVERLOAD: 0}
+        self.condition = threading.Condition()
+        self.async_condition = None
+
+    def _wait_time(self):
+        """0 if a request may start now, the seconds left if the host is paused, None if at the limit."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        return 0 if self.in_flight < int(self.limit) else None
+
+    def acquire(self, stop_event=None):
+        """Blocks until a request may start; returns False if stop_event was set meanwhile."""
+        with self.condition:
+            while True:
+                if stop_event and stop_event.is_set():
+                    return False
+                wait = self._wait_time()
+                if wait == 0:
+                    self.in_flight += 1
+                    return True
+                self.condition.wait(min(wait, 1.0) if wait else 1.0)
+
+    async def acquire_async(self, stop_event=None):
+        if self.async_condition is None:
+            self.async_condition = asyncio.Condition()
+        async with self.async_condition:
+            while True:
+                if stop_event and stop_event.is_set():
+                    return False
+                with self.condition:
+                    wait = self._wait_time()
+                    if wait == 0:
+                        self.in_flight += 1
+                        return True
+                try:
+                    await asyncio.wait_for(self.async_condition.wait(), min(wait, 1.0) if wait else 1.0)
+                except asyncio.TimeoutError:
+                    pass
+
+    def release(self, outcome, latency=None, retry_after=None):
+        with self.condition:
+            self.in_flight -= 1
+            self._record(outcome, latency, retry_after)
+            self.condition.notify_all()
+
+    async def release_async(self, outcome, latency=None, retry_after=None):
+        self.release(outcome, latency, retry_after)
+        async with self.async_condition:
+            self.async_condition.notify_all()
+
+    def _record(self, outcome, latency, retry_after):
+        now = time.monotonic()
+        self.counts[outcome] += 1
+        if outcome == OVERLOAD and retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+        if outcome == OK and latency is not None:
+            self.latency = latency if self.latency is None else \
+                self.latency + EWMA_WEIGHT * (latency - self.latency)
+            self.baseline = self.latency if self.baseline is None else \
+                min(self.latency, self.baseline + BASELINE_DRIFT * (self.latency - self.baseline))
+        if not self.adaptive:
+            return
+        if outcome in (ERROR, OVERLOAD):
+            self._decrease(now, ERROR_DECREASE)
+        elif outcome == OK:
+            congested = (self.use_latency and self.baseline is not None
+                         and self.latency > LATENCY_TOLERANCE * self.baseline + LATENCY_SLACK)
+            if congested:
+                self._decrease(now, LATENCY_DECREASE)
+            elif self.slow_start:
+                self.limit = min(self.maximum, self.limit + 1)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def _decrease(self, now, factor):
+        # Responses already in flight reflect the old limit; react once per round trip.
+        if now - self.last_decrease < (self.latency or 1.0):
+            return
+        self.last_decrease = now
+        self.slow_start = False
+        self.limit = max(MIN_LIMIT, self.limit * factor)
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                "name": self.name,
+                "limit": int(self.limit),
+                "maximum": self.maximum,
+                "in_flight": self.in_flight,
+                "latency": self.latency,
+                "paused": max(0.0, self.paused_until - time.monotonic()),
+                **self.counts,
+            }
+
+
+class HostScheduler:
+    """Hands out one AdaptiveLimiter per (host, kind), with separate ceilings for pages and PDFs."""
+
+    def __init__(self, max_pages, max_pdfs, adaptive=True):
+        self.maximum = {"pages": max_pages, "pdfs": max_pdfs}
+        self.adaptive = adaptive
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def limiter(self, url, kind):
+        host = urlsplit(url).netloc
+        with self.lock:
+            key = (host, kind)
+            if key not in self.limiters:
+                # PDF latency grows with file size, so only errors steer the PDF limit.
+                self.limiters[key] = AdaptiveLimiter(f"{host} {kind}", self.maximum[kind], self.adaptive,
+                                                     use_latency=kind == "pages")
+            return self.limiters[key]
+
+    def snapshot(self):
+        with self.lock:
+            limiters = list(self.limiters.values())
+        return [limiter.snapshot() for limiter in limiters]
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def configure_scheduler(max_pages, max_pdfs, adaptive=True):
+    """Replaces the shared scheduler, e.g. at the start of a run with its concurrency settings."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = HostScheduler(max_pages, max_pdfs, adaptive)
+        return _scheduler
+
+
+def get_scheduler():
+    """Returns the process-wide scheduler, creating a non-adaptive one with generous ceilings on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = HostScheduler(1000, 1000, adaptive=False)
+        return _scheduler
+
+
+def format_limits(snapshot):
+    parts = []
+    for entry in snapshot:
+        part = f"{entry['name']} {entry['in_flight']}/{entry['limit']} (max {entry['maximum']}"
+        if entry["latency"] is not None:
+            part += f", {entry['latency'] * 1000:.0f} ms"
+        if entry[ERROR] or entry[OVERLOAD]:
+            part += f", {entry[ERROR]} errors, {entry[OVERLOAD]} throttled"
+        if entry["paused"]:
+            part += f", paused {entry['paused']:.0f}s"
+        parts.append(part + ")")
+    return "; ".join(parts) or "no requests yet"
+
+
+def start_reporter(log, stop_event, interval=REPORT_INTERVAL):
+    """Logs the live concurrency limits every interval seconds on a daemon thread until stop_event is set."""
+    def report():
+        while not stop_event.wait(interval):
+            log(f"Concurrency: {format_limits(get_scheduler().snapshot())}")
+
+    thread = threading.Thread(target=report, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,227 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+CACHE_DIRNAME = "http_cache"
+MAX_CACHE_MB = 2048
+CACHE_MODES = ["off", "revalidate", "replay"]
+EVICT_BATCH = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    stored_at REAL,
+    last_access REAL
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access);
+CREATE INDEX IF NOT EXISTS entries_sha ON entries (sha256);
+CREATE TABLE IF NOT EXISTS objects (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+"""
+
+
+class CachedResponse:
+    """A page served from the cache, shaped like the requests.Response fields the scraper reads."""
+
+    def __init__(self, url, text, etag, last_modified):
+        self.url = url
+        self.status_code = 200
+        self.text = text
+        self.headers = {}
+        if etag:
+            self.headers["ETag"] = etag
+        if last_modified:
+            self.headers["Last-Modified"] = last_modified
+        self.from_cache = True
+
+    def raise_for_status(self):
+        pass
+
+
+class HttpCache:
+    """Content-addressed on-disk cache of page bodies with size-bounded LRU eviction.
+
+    Bodies are stored once per sha256 under objects/, and an SQLite index maps
+    each URL to its body and validators. "revalidate" mode sends conditional
+    requests; "replay" mode never touches the network.
+    """
+
+    def __init__(self, cache_dir, max_bytes=MAX_CACHE_MB * 1024 * 1024, mode="revalidate"):
+        if mode not in CACHE_MODES[1:]:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.replay = mode == "replay"
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    def _object_path(self, sha256):
+        return os.path.join(self.cache_dir, "objects", sha256[:2], sha256)
+
+    def lookup(self, url):
+        """Returns the cached entry for url with its body read, or None on a miss.
+
+        The body is read here, not in hit(), so an eviction while a revalidation
+        request is in flight cannot take it away; a body evicted before it
+        could be read is a miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, sha256, etag, last_modified FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(("url", "sha256", "etag", "last_modified"), row))
+        try:
+            with open(self._object_path(entry["sha256"]), "rb") as f:
+                entry["text"] = f.read().decode("utf-8")
+        except FileNotFoundError:
+            return None
+        return entry
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def hit(self, entry, revalidated=False):
+        """Serves an entry returned by lookup() and marks it most recently used."""
+        with self._lock:
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), entry["url"]))
+            self._conn.commit()
+            if revalidated:
+                self.revalidated += 1
+            else:
+                self.hits += 1
+        return CachedResponse(entry["url"], entry["text"], entry["etag"], entry["last_modified"])
+
+    def replay_response(self, url):
+        entry = self.lookup(url)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        return self.hit(entry)
+
+    def store(self, url, text, etag=None, last_modified=None, cache_control=None):
+        if cache_control and "no-store" in cache_control.lower():
+            return
+        body = text.encode("utf-8")
+        sha256 = hashlib.sha256(body).hexdigest()
+        path = self._object_path(sha256)
+        if not os.path.exists(path):
+            self._write_object(path, body)
+        now = time.time()
+        with self._lock:
+            self.misses += 1
+            previous = self._conn.execute("SELECT sha256 FROM entries WHERE url = ?", (url,)).fetchone()
+            if self._conn.execute("INSERT OR IGNORE INTO objects (sha256, size) VALUES (?, ?)",
+                                  (sha256, len(body))).rowcount:
+                self._total_bytes += len(body)
+            self._conn.execute(
+                "INSERT INTO entries (url, sha256, etag, last_modified, stored_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(url) DO UPDATE SET sha256 = excluded.sha256, "
+                "etag = excluded.etag, last_modified = excluded.last_modified, "
+                "stored_at = excluded.stored_at, last_access = excluded.last_access",
+                (url, sha256, etag, last_modified, now, now)
+            )
+            if previous and previous[0] != sha256:
+                self._drop_if_unused(previous[0])
+            if not os.path.exists(path):
+                # Another URL's eviction removed the shared body after the check above.
+                self._write_object(path, body)
+            self._evict(url)
+            self._conn.commit()
+
+    def _write_object(self, path, body):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    def total_bytes(self):
+        with self._lock:
+            return self._total_bytes
+
+    def _evict(self, keep_url):
+        """Drops least recently used URLs until the stored bodies fit in max_bytes (lock held)."""
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT url, sha256 FROM entries WHERE url != ? ORDER BY last_access LIMIT ?",
+                (keep_url, EVICT_BATCH)).fetchall()
+            if not rows:
+                break
+            for url, sha256 in rows:
+                self._conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self._drop_if_unused(sha256)
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def _drop_if_unused(self, sha256):
+        """Deletes a body once no URL points at it any more (lock held)."""
+        if self._conn.execute("SELECT 1 FROM entries WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone():
+            return
+        row = self._conn.execute("SELECT size FROM objects WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is None:
+            return
+        self._conn.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+        self._total_bytes -= row[0]
+        try:
+            os.remove(self._object_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses,
+                    "replay": self.replay}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def configure_cache(cache_dir, max_mb=MAX_CACHE_MB, mode="revalidate"):
+    """Installs the process-wide page cache; mode "off" removes it."""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = None if mode == "off" else HttpCache(cache_dir, max_mb * 1024 * 1024, mode)
+        return _cache
+
+
+def get_cache():
+    return _cache
+
+
+def format_stats(stats):
+    served = stats["hits"] + stats["revalidated"]
+    total = served + stats["misses"]
+    rate = served / total if total else 0.0
+    return (f"{stats['hits']} served from cache, {stats['revalidated']} revalidated (304), "
+            f"{stats['misses']} {'missing' if stats['replay'] else 'fetched'} ({rate:.0%} hit rate)")
@@ -0,0 +1,198 @@
+"""CPU-only first tier for paper classification: hashed n-gram TF-IDF features and a softmax linear model.
+
+Trained from rows the LLM has already labelled. Papers it is confident about
+(top-two probability margin at or above a threshold) are labelled locally in
+bulk; the rest still go to the LLM.
+"""
+import re
+import zlib
+import threading
+
+import numpy as np
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+N_FEATURES = 2 ** 18
+DEFAULT_MARGIN = 0.5
+EPOCHS = 300
+L2 = 1e-4
+REPORT_MARGINS = [0.0, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def _require_scipy():
+    if sparse is None:
+        raise RuntimeError("The local classifier requires scipy (pip install scipy)")
+
+
+def paper_text(title, abstract):
+    return f"{title} {title} {abstract}"   # The title counts twice: it is the densest signal.
+
+
+def _features(text, index_cache):
+    tokens = TOKEN_RE.findall(text.lower())
+    grams = tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]
+    columns = []
+    for gram in grams:
+        column = index_cache.get(gram)
+        if column is None:
+            column = index_cache[gram] = zlib.crc32(gram.encode("utf-8")) % N_FEATURES
+        columns.append(column)
+    return columns
+
+
+def hash_vectorize(texts):
+    """Returns a CSR matrix of raw unigram+bigram counts hashed into N_FEATURES columns."""
+    _require_scipy()
+    index_cache = {}
+    indptr, indices = [0], []
+    for text in texts:
+        indices.extend(_features(text, index_cache))
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float32)
+    matrix = sparse.csr_matrix((data, np.array(indices, dtype=np.int64), np.array(indptr)),
+                               shape=(len(texts), N_FEATURES))
+    matrix.sum_duplicates()
+    return matrix
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    np.exp(scores, out=scores)
+    scores /= scores.sum(axis=1, keepdims=True)
+    return scores
+
+
+def _largest_eigenvalue(x, xt, iterations=20):
+    """Power iteration for the largest eigenvalue of X'X/n."""
+    vector = np.random.default_rng(0).standard_normal(x.shape[1]).astype(np.float32)
+    value = 1.0
+    for _ in range(iterations):
+        vector = xt.dot(x.dot(vector)) / x.shape[0]
+        value = float(np.linalg.norm(vector)) or 1.0
+        vector /= value
+    return value
+
+
+class LocalClassifier:
+    def __init__(self, labels, idf=None, weights=None, bias=None, margin=DEFAULT_MARGIN):
+        self.labels = list(labels)
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+        self.margin = margin
+        self.routed = {"local": 0, "llm": 0}
+        self.lock = threading.Lock()
+
+    def _transform(self, texts):
+        matrix = hash_vectorize(texts)
+        matrix.data = np.log1p(matrix.data)
+        matrix = matrix.multiply(self.idf).tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel()
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms).dot(matrix).tocsr().astype(np.float32)
+
+    def fit(self, texts, labels, epochs=EPOCHS, learning_rate=None, l2=L2):
+        """Full-batch gradient descent on the softmax cross-entropy; X stays sparse throughout.
+
+        The default step size is derived from the largest eigenvalue of X'X/n
+        (the curvature bound of the loss), so it suits any corpus size.
+        """
+        _require_scipy()
+        counts = hash_vectorize(texts)
+        document_frequency = np.bincount(counts.indices, minlength=N_FEATURES)
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        x = self._transform(texts)
+        y = np.zeros((len(texts), len(self.labels)), dtype=np.float32)
+        y[np.arange(len(texts)), [self.labels.index(label) for label in labels]] = 1
+        self.weights = np.zeros((N_FEATURES, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+        xt = x.T.tocsr()
+        if learning_rate is None:
+            learning_rate = 4.0 / _largest_eigenvalue(x, xt)
+        for _ in range(epochs):
+            error = (_softmax(x.dot(self.weights) + self.bias) - y) / len(texts)
+            self.weights -= learning_rate * (xt.dot(error) + l2 * self.weights)
+            self.bias -= learning_rate * error.sum(axis=0)
+        return self
+
+    def predict_proba(self, texts):
+        if not texts:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+        return _softmax(self._transform(texts).dot(self.weights) + self.bias)
+
+    def predict(self, texts):
+        """Returns (labels, margins); the margin is the gap between the top two probabilities."""
+        probabilities = self.predict_proba(texts)
+        if not len(probabilities):
+            return [], np.zeros(0)
+        top_two = np.sort(probabilities, axis=1)[:, -2:]
+        return [self.labels[i] for i in probabilities.argmax(axis=1)], top_two[:, 1] - top_two[:, 0]
+
+    def route(self, papers):
+        """Returns {index: label} for the (title, abstract) pairs confident enough to skip the LLM."""
+        labels, margins = self.predict([paper_text(title, abstract) for title, abstract in papers])
+        confident = {i: label for i, (label, margin) in enumerate(zip(labels, margins)) if margin >= self.margin}
+        with self.lock:
+            self.routed["local"] += len(confident)
+            self.routed["llm"] += len(papers) - len(confident)
+        return confident
+
+    def save(self, path):
+        # Only the rows of features seen in training are non-zero; store those sparsely.
+        rows = np.flatnonzero(np.abs(self.weights).sum(axis=1))
+        with open(path, "wb") as f:
+            np.savez_compressed(f, labels=np.array(self.labels), idf=self.idf, rows=rows,
+                                weights=self.weights[rows], bias=self.bias)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        weights = np.zeros((N_FEATURES, len(data["labels"])), dtype=np.float32)
+        weights[data["rows"]] = data["weights"]
+        return cls(data["labels"].tolist(), data["idf"], weights, data["bias"])
+
+
+def coverage_report(model, texts, labels, margins=REPORT_MARGINS):
+    """For each margin threshold: the share of papers labelled locally and how often they agree with the LLM."""
+    predicted, margin = model.predict(texts)
+    agree = np.array([p == label for p, label in zip(predicted, labels)])
+    report = []
+    for threshold in margins:
+        covered = margin >= threshold
+        report.append({
+            "margin": threshold,
+            "coverage": covered.mean() if len(covered) else 0.0,
+            "agreement": agree[covered].mean() if covered.any() else 0.0,
+        })
+    return report
+
+
+def format_routing(routed):
+    total = routed["local"] + routed["llm"]
+    share = routed["local"] / total * 100 if total else 0.0
+    return f"{routed['local']} of {total} papers labelled locally ({share:.1f}%), {routed['llm']} sent to the LLM"
+
+
+def format_report(report):
+    lines = ["margin  coverage  agreement"]
+    for row in report:
+        lines.append(f"{row['margin']:6.2f}  {row['coverage']:8.1%}  {row['agreement']:9.1%}")
+    return "\n".join(lines)
+
+
+def train_with_report(texts, labels, label_set, holdout=0.2, seed=0):
+    """Evaluates on a held-out split against the LLM labels, then refits on everything.
+
+    Returns (model, report).
+    """
+    order = np.random.default_rng(seed).permutation(len(texts))
+    cut = int(len(texts) * (1 - holdout))
+    train, test = order[:cut], order[cut:]
+    model = LocalClassifier(label_set).fit([texts[i] for i in train], [labels[i] for i in train])
+    report = coverage_report(model, [texts[i] for i in test], [labels[i] for i in test])
+    return LocalClassifier(label_set).fit(texts, labels), report
@@ -0,0 +1,213 @@
+import io
+import os
+import csv
+import json
+import time
+import shutil
+
+import metadata_store
+from crawl_metrics import get_metrics
+
+METADATA_FIELDS = ["title", "authors", "abstract", "pdf_url", "paper_url", "year"]
+SINK_FORMATS = {"csv": "metadata.csv", "jsonl": "metadata.jsonl", "parquet": metadata_store.PARQUET_FILENAME}
+DEFAULT_FORMAT = "csv"
+FLUSH_ROWS = 200         # Rows buffered per year before they are written out
+FLUSH_SECONDS = 5.0      # Longest a row waits before the next checkpoint
+SPARE_SUFFIXES = (".0.tmp", ".1.tmp")   # The two working copies a CSV/JSONL sink alternates between
+
+
+def render_rows(rows, fmt, fieldnames):
+    """The text rows are written as: CSV lines in fieldnames order, or one JSON object per line."""
+    if fmt == "csv":
+        buffer = io.StringIO(newline="")
+        csv.DictWriter(buffer, fieldnames=fieldnames, restval="", extrasaction="ignore").writerows(rows)
+        return buffer.getvalue()
+    return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+class _TextYearFile:
+    """Publishes each checkpoint by temp file + rename, appending only the rows since the last one.
+
+    Two working copies take turns: a checkpoint appends the rows the idle copy
+    is missing (at most the last two checkpoints' worth), fsyncs it and
+    renames a hard link to it over the published file. The published file is
+    left alone until two checkpoints later, long after readers that opened it
+    have finished, so they only see whole checkpoints; a crash leaves the last
+    one intact.
+    """
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.fieldnames = list(METADATA_FIELDS)
+        self.spares = [path + suffix for suffix in SPARE_SUFFIXES]
+        for spare in self.spares + [path + ".tmp"]:
+            if os.path.exists(spare):
+                os.remove(spare)      # Left behind by a crashed run; the published file is the truth.
+        header = ""
+        if os.path.exists(path):
+            if fmt == "csv":
+                with open(path, newline="", encoding="utf-8") as f:
+                    self.fieldnames = next(csv.reader(f), None) or self.fieldnames
+            # The published file stays as copy 0, so the first checkpoint goes to copy 1.
+            os.link(path, self.spares[0])
+            shutil.copyfile(path, self.spares[1])
+            self.published = 0
+        else:
+            if fmt == "csv":
+                buffer = io.StringIO(newline="")
+                csv.writer(buffer).writerow(self.fieldnames)
+                header = buffer.getvalue()
+            open(self.spares[0], "w").close()
+            open(self.spares[1], "w").close()
+            self.published = 1
+        self.handles = [open(spare, "a", newline="", encoding="utf-8") for spare in self.spares]
+        self.pending = [[header], [header]]    # Text each copy still lacks
+
+    def write(self, rows):
+        text = render_rows(rows, self.fmt, self.fieldnames)
+        for pending in self.pending:
+            pending.append(text)
+
+    def checkpoint(self):
+        idle = 1 - self.published
+        handle = self.handles[idle]
+        handle.write("".join(self.pending[idle]))
+        handle.flush()
+        os.fsync(handle.fileno())
+        link_path = self.path + ".tmp"
+        os.link(self.spares[idle], link_path)
+        os.replace(link_path, self.path)
+        self.pending[idle] = []
+        self.published = idle
+
+    def close(self):
+        for handle, spare in zip(self.handles, self.spares):
+            handle.close()
+            os.remove(spare)
+
+
+class _ParquetYearFile:
+    """Keeps the year as an Arrow table and publishes it at each checkpoint via temp file + rename.
+
+    A Parquet file is only readable once its footer is written and cannot be
+    appended to, so every checkpoint writes the whole partition; checkpoints
+    are time-based (flush_seconds), which bounds how often that happens.
+    """
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.root = os.path.dirname(os.path.dirname(path))
+        self.year = os.path.basename(os.path.dirname(path))
+        # Not memory-mapped: the file is replaced at the next checkpoint.
+        self.table = None
+        if os.path.exists(path):
+            table = metadata_store.load_year(self.root, self.year, memory_map=False)
+            self.table = table.select(metadata_store.COLUMNS).cast(metadata_store.schema())
+        self.rows = []
+
+    def write(self, rows):
+        self.rows.extend(rows)
+
+    def checkpoint(self):
+        if not self.rows:
+            return
+        table = metadata_store.rows_to_table(self.rows)
+        self.table = table if self.table is None else metadata_store.pa.concat_tables([self.table, table])
+        metadata_store.write_year(self.root, self.year, self.table)
+        self.rows = []
+
+    def close(self):
+        pass
+
+
+class MetadataSink:
+    """Buffers metadata rows and writes them per year in batches, by row count or by time.
+
+    on_commit(rows) is called once rows are durable in a published checkpoint;
+    on_error(rows, error) when a batch could not be written.
+    """
+
+    def __init__(self, output_dir, fmt=DEFAULT_FORMAT, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS,
+                 on_commit=None, on_error=None):
+        if fmt not in SINK_FORMATS:
+            raise ValueError(f"Unknown metadata format: {fmt}")
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.on_commit = on_commit
+        self.on_error = on_error
+        self.files = {}
+        self.buffers = {}
+        self.written = {}        # year -> rows written to the working copy since the last checkpoint
+        self.last_checkpoint = time.monotonic()
+
+    def path(self, year):
+        return os.path.join(self.output_dir, str(year), SINK_FORMATS[self.fmt])
+
+    def _file(self, year):
+        if year not in self.files:
+            os.makedirs(os.path.join(self.output_dir, str(year)), exist_ok=True)
+            year_file = _ParquetYearFile if self.fmt == "parquet" else _TextYearFile
+            self.files[year] = year_file(self.path(year), self.fmt)
+        return self.files[year]
+
+    def write(self, row):
+        year = str(row["year"])
+        buffer = self.buffers.setdefault(year, [])
+        buffer.append(row)
+        if len(buffer) >= self.flush_rows:
+            self._write_buffer(year)
+
+    def _write_buffer(self, year):
+        rows = self.buffers.pop(year, [])
+        if not rows:
+            return
+        try:
+            self._file(year).write(rows)
+            self.written.setdefault(year, []).extend(rows)
+        except Exception as e:
+            if self.on_error:
+                self.on_error(rows, e)
+
+    def maybe_checkpoint(self):
+        """Checkpoints every year once flush_seconds have passed since the last checkpoint."""
+        if time.monotonic() - self.last_checkpoint >= self.flush_seconds:
+            self.checkpoint()
+
+    def checkpoint(self):
+        metrics = get_metrics()
+        for year in list(self.buffers):
+            self._write_buffer(year)
+        for year, rows in list(self.written.items()):
+            try:
+                with metrics.timer("metadata_write"):
+                    self.files[year].checkpoint()
+                metrics.count("rows", "metadata_write", len(rows))
+                if self.on_commit:
+                    self.on_commit(rows)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(rows, e)
+            del self.written[year]
+        self.last_checkpoint = time.monotonic()
+
+    def close(self):
+        self.checkpoint()
+        for year_file in self.files.values():
+            year_file.close()
+        self.files = {}
+
+
+def read_rows(output_dir, year, fmt=DEFAULT_FORMAT):
+    """Reads back the rows checkpointed for a year in the given format; [] if there are none."""
+    path = os.path.join(output_dir, str(year), SINK_FORMATS[fmt])
+    if not os.path.exists(path):
+        return []
+    if fmt == "parquet":
+        return metadata_store.load_year(output_dir, year, memory_map=False).to_pylist()
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,145 @@
+"""Year-partitioned Parquet store for scraped metadata.
+
+Layout mirrors the CSV outputs: <root>/<year>/metadata.parquet. Reads are
+memory-mapped and can project columns, so loading titles and labels never
+touches the abstract pages.
+
+    python metadata_store.py convert OUTPUTS [--years 2020 2021] [--remove-csv]
+"""
+import os
+import csv
+import argparse
+
+# Imported on first use: pyarrow adds about a tenth of a second to every
+# start, and CSV/JSONL crawls never need it.
+pa = pq = None
+
+PARQUET_FILENAME = "metadata.parquet"
+CSV_FILENAME = "metadata.csv"
+LABEL_COLUMN = "annotation"
+COLUMNS = ["title", "authors", "abstract", "pdf_url", "paper_url", "year", LABEL_COLUMN]
+
+
+def _require_pyarrow():
+    global pa, pq
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("The Parquet metadata store requires pyarrow (pip install pyarrow)")
+        pa, pq = pyarrow, pyarrow.parquet
+
+
+def schema():
+    _require_pyarrow()
+    return pa.schema([
+        ("title", pa.string()),
+        ("authors", pa.string()),
+        ("abstract", pa.string()),
+        ("pdf_url", pa.string()),
+        ("paper_url", pa.string()),
+        ("year", pa.int32()),
+        (LABEL_COLUMN, pa.string()),
+    ])
+
+
+def rows_to_table(rows):
+    """Builds a table in the store schema from metadata dicts; a missing label is stored as null."""
+    _require_pyarrow()
+    columns = {name: [] for name in COLUMNS}
+    for row in rows:
+        for name in COLUMNS:
+            value = row.get(name)
+            if name == "year":
+                value = int(value) if value not in (None, "") else None
+            elif name == LABEL_COLUMN:
+                value = value or None
+            else:
+                value = "" if value is None else str(value)
+            columns[name].append(value)
+    return pa.table(columns, schema=schema())
+
+
+def year_path(root, year):
+    return os.path.join(root, str(year), PARQUET_FILENAME)
+
+
+def write_year(root, year, table):
+    """Writes one year's partition atomically (temp file + rename)."""
+    _require_pyarrow()
+    path = year_path(root, year)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    work_path = path + ".tmp"
+    pq.write_table(table, work_path, use_dictionary=["year", LABEL_COLUMN])
+    os.replace(work_path, path)
+
+
+def dataset_years(root):
+    """Returns the years that have a Parquet partition under root, in order."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if name.isdigit() and os.path.exists(year_path(root, name)))
+
+
+def load_year(root, year, columns=None, memory_map=True):
+    _require_pyarrow()
+    return pq.read_table(year_path(root, year), columns=columns, memory_map=memory_map)
+
+
+def load_metadata(root, years=None, columns=None):
+    """Loads the selected years (all by default) as one Arrow table.
+
+    Files are memory-mapped and only the requested columns are read, e.g.
+    load_metadata("OUTPUTS", columns=["title", "annotation"]).
+    """
+    _require_pyarrow()
+    years = [str(year) for year in years] if years else dataset_years(root)
+    tables = [load_year(root, year, columns) for year in years if os.path.exists(year_path(root, year))]
+    if not tables:
+        fields = [schema().field(name) for name in (columns or COLUMNS)]
+        return pa.schema(fields).empty_table()
+    return pa.concat_tables(tables)
+
+
+def read_csv_rows(csv_path):
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def convert_csv_year(root, year, remove_csv=False):
+    """Converts <root>/<year>/metadata.csv into the Parquet partition; returns the row count."""
+    csv_path = os.path.join(root, str(year), CSV_FILENAME)
+    rows = read_csv_rows(csv_path)
+    write_year(root, year, rows_to_table(rows))
+    if remove_csv:
+        os.remove(csv_path)
+    return len(rows)
+
+
+def convert_csv_dataset(root, years=None, remove_csv=False, log=print):
+    """Converts every (or the selected) year's metadata.csv under root."""
+    if years is None:
+        years = sorted(name for name in os.listdir(root)
+                       if name.isdigit() and os.path.exists(os.path.join(root, name, CSV_FILENAME)))
+    for year in years:
+        count = convert_csv_year(root, year, remove_csv)
+        log(f"Converted {year}: {count} rows -> {year_path(root, year)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the Parquet metadata store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="Convert <root>/<year>/metadata.csv files to Parquet")
+    convert.add_argument("root")
+    convert.add_argument("--years", nargs="+")
+    convert.add_argument("--remove-csv", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_csv_dataset(args.root, args.years, args.remove_csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""Cross-year identity index: duplicate papers and stable author IDs.
+
+Every metadata row is matched against the papers seen before it, in any
+year. An exact match on the normalized title (case, accents and punctuation
+folded away) or a near match on title + abstract makes the row a duplicate
+of that paper's cluster. Near matches are found with MinHash over word
+shingles: the signature's bands are looked up in an LSH table, and
+candidates whose estimated Jaccard similarity reaches NEAR_DUPLICATE are
+accepted. A paper_url that was indexed before with the same content (say, a
+row repeated by a rerun of the appending metadata writer) is only counted.
+
+Authors are split from the comma-joined authors field and normalized the
+same way as in paper_index.py. Each name gets an ID derived from the
+normalized name, so it is the same in every output directory and after a
+rebuild, and maps to the papers listing it.
+
+Everything lives in <output-dir>/identity.sqlite3 and is updated one row at
+a time, so a scrape costs O(new rows): the crawler's metadata writer feeds
+it as rows are checkpointed, and build catches an output directory up.
+
+    python paper_identity.py build --output-dir OUTPUTS
+    python paper_identity.py duplicates --output-dir OUTPUTS
+    python paper_identity.py author --output-dir OUTPUTS "Max Welling"
+"""
+import os
+import re
+import sys
+import array
+import random
+import sqlite3
+import hashlib
+import argparse
+import threading
+import unicodedata
+
+from metadata_sink import read_rows, SINK_FORMATS, DEFAULT_FORMAT
+from paper_index import tokenize, normalize_author
+
+IDENTITY_FILENAME = "identity.sqlite3"
+SHINGLE_WORDS = 3
+BANDS = 16
+ROWS_PER_BAND = 4            # BANDS * ROWS_PER_BAND hash functions; papers at 0.8 similarity collide with p > 0.999
+NEAR_DUPLICATE = 0.8         # Estimated Jaccard similarity of title + abstract shingles
+MINHASH_SEED = 20240917      # Fixed, so signatures stay comparable across runs
+_PRIME = (1 << 61) - 1
+
+_rng = random.Random(MINHASH_SEED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(BANDS * ROWS_PER_BAND)]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    paper_url TEXT PRIMARY KEY,
+    year TEXT NOT NULL,
+    title TEXT,
+    title_key TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    digest TEXT NOT NULL,
+    canonical_url TEXT NOT NULL,
+    match TEXT NOT NULL,
+    similarity REAL
+);
+CREATE INDEX IF NOT EXISTS papers_title_key ON papers (title_key);
+CREATE INDEX IF NOT EXISTS papers_canonical ON papers (canonical_url);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    hash INTEGER NOT NULL,
+    paper_url TEXT NOT NULL,
+    PRIMARY KEY (band, hash, paper_url)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS authors (
+    author_id TEXT PRIMARY KEY,
+    name_key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS paper_authors (
+    author_id TEXT NOT NULL,
+    paper_url TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (author_id, paper_url)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS paper_authors_paper ON paper_authors (paper_url);
+"""
+
+
+def normalize_title(title):
+    """"Graph  Neural Networks: A Review." and "graph neural networks - a review" -> "graph neural networks a review"."""
+    title = unicodedata.normalize("NFKD", title or "")
+    title = "".join(c for c in title if not unicodedata.combining(c)).casefold()
+    return " ".join(re.sub(r"[\W_]+", " ", title).split())
+
+
+def title_key(title):
+    return hashlib.sha1(normalize_title(title).encode("utf-8")).hexdigest()[:20]
+
+
+def author_id(name):
+    """A stable ID for an author name: the same for every spelling that normalizes alike."""
+    return "a" + hashlib.sha1(normalize_author(name).encode("utf-8")).hexdigest()[:12]
+
+
+def shingles(text):
+    """Hashes of the overlapping SHINGLE_WORDS-word runs of text (the words themselves if it is shorter)."""
+    tokens = tokenize(text)
+    if len(tokens) < SHINGLE_WORDS:
+        runs = tokens
+    else:
+        runs = (" ".join(tokens[i:i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1))
+    return {int.from_bytes(hashlib.blake2b(run.encode("utf-8"), digest_size=8).digest(), "little") % _PRIME
+            for run in runs}
+
+
+def minhash(hashes):
+    """The MinHash signature of a set of shingle hashes, as an array of BANDS * ROWS_PER_BAND values."""
+    if not hashes:
+        return array.array("Q", [0] * len(_PERMUTATIONS))
+    return array.array("Q", (min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS))
+
+
+def band_hashes(signature):
+    """One LSH bucket per band, as signed 64-bit integers for SQLite."""
+    return [int.from_bytes(hashlib.blake2b(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes(),
+                                           digest_size=8).digest(), "little", signed=True)
+            for band in range(BANDS)]
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity: the share of signature positions that agree."""
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+def row_digest(row):
+    fields = [str(row.get(name) or "") for name in ("title", "authors", "abstract", "year")]
+    return hashlib.sha1("\x1f".join(fields).encode("utf-8")).hexdigest()
+
+
+def open_identity(output_dir):
+    """Opens (or creates) the identity index stored in the output directory."""
+    os.makedirs(output_dir, exist_ok=True)
+    return IdentityIndex(os.path.join(output_dir, IDENTITY_FILENAME))
+
+
+class IdentityIndex:
+    """Persistent paper clusters and author IDs, shared by all threads of a process."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def add(self, rows):
+        """Indexes metadata rows in one transaction; returns counts of new, title and near duplicates, repeated and updated rows."""
+        counts = {"new": 0, "title": 0, "near": 0, "repeated": 0, "updated": 0}
+        with self._lock:
+            for row in rows:
+                url = row.get("paper_url")
+                if url:
+                    counts[self._add(row, url)] += 1
+            self._conn.commit()
+        return counts
+
+    def _add(self, row, url):
+        digest = row_digest(row)
+        previous = self._conn.execute("SELECT digest FROM papers WHERE paper_url = ?", (url,)).fetchone()
+        if previous and previous["digest"] == digest:
+            return "repeated"
+        if previous:
+            # The page changed since it was indexed: match it afresh, keeping other papers' links to it.
+            self._conn.execute("DELETE FROM bands WHERE paper_url = ?", (url,))
+            self._conn.execute("DELETE FROM paper_authors WHERE paper_url = ?", (url,))
+            self._conn.execute("DELETE FROM papers WHERE paper_url = ?", (url,))
+
+        key = title_key(row.get("title"))
+        signature = minhash(shingles(f"{row.get('title') or ''} {row.get('abstract') or ''}"))
+        buckets = band_hashes(signature)
+        canonical, match, score = url, "new", None
+        same_title = self._conn.execute("SELECT canonical_url FROM papers WHERE title_key = ? LIMIT 1", (key,)).fetchone()
+        if same_title:
+            canonical, match, score = same_title["canonical_url"], "title", 1.0
+        else:
+            candidates = set()
+            for band, bucket in enumerate(buckets):
+                candidates.update(found["paper_url"] for found in self._conn.execute(
+                    "SELECT paper_url FROM bands WHERE band = ? AND hash = ?", (band, bucket)))
+            best = None
+            for candidate in candidates:
+                found = self._conn.execute("SELECT signature, canonical_url FROM papers WHERE paper_url = ?",
+                                           (candidate,)).fetchone()
+                estimate = similarity(signature, array.array("Q", found["signature"]))
+                if estimate >= NEAR_DUPLICATE and (best is None or estimate > best[0]):
+                    best = (estimate, found["canonical_url"])
+            if best:
+                score, canonical = best
+                match = "near"
+
+        self._conn.execute(
+            "INSERT INTO papers (paper_url, year, title, title_key, signature, digest, canonical_url, match, similarity) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (url, str(row.get("year", "")), row.get("title"), key, signature.tobytes(), digest, canonical, match, score))
+        self._conn.executemany("INSERT OR IGNORE INTO bands (band, hash, paper_url) VALUES (?, ?, ?)",
+                               [(band, bucket, url) for band, bucket in enumerate(buckets)])
+        for position, name in enumerate(part.strip() for part in (row.get("authors") or "").split(",")):
+            if not normalize_author(name):
+                continue
+            identifier = author_id(name)
+            self._conn.execute("INSERT OR IGNORE INTO authors (author_id, name_key, name) VALUES (?, ?, ?)",
+                               (identifier, normalize_author(name), name))
+            self._conn.execute("INSERT OR IGNORE INTO paper_authors (author_id, paper_url, position) VALUES (?, ?, ?)",
+                               (identifier, url, position))
+        return "updated" if previous else match
+
+    def paper(self, paper_url):
+        rows = self._query("SELECT paper_url, year, title, canonical_url, match, similarity FROM papers "
+                           "WHERE paper_url = ?", (paper_url,))
+        return dict(rows[0]) if rows else None
+
+    def cluster(self, paper_url):
+        """The papers sharing paper_url's identity (itself included), first-seen paper first."""
+        paper = self.paper(paper_url)
+        if not paper:
+            return []
+        rows = self._query("SELECT paper_url, year, title, match, similarity FROM papers WHERE canonical_url = ? "
+                           "ORDER BY match != 'new', rowid", (paper["canonical_url"],))
+        return [dict(row) for row in rows]
+
+    def duplicates(self, limit=None):
+        """Clusters with more than one paper: [(canonical paper, [its duplicates])], largest first."""
+        rows = self._query("SELECT canonical_url, COUNT(*) AS size FROM papers GROUP BY canonical_url "
+                           "HAVING size > 1 ORDER BY size DESC, canonical_url LIMIT ?", (limit or -1,))
+        clusters = []
+        for row in rows:
+            members = self.cluster(row["canonical_url"])
+            clusters.append((members[0], members[1:]))
+        return clusters
+
+    def author(self, name):
+        """{"author_id", "name", "papers": [{paper_url, year, title, position}]} for a name or author ID; None if unknown."""
+        identifier = name if re.fullmatch(r"a[0-9a-f]{12}", name) else author_id(name)
+        rows = self._query("SELECT author_id, name FROM authors WHERE author_id = ?", (identifier,))
+        if not rows:
+            return None
+        papers = self._query("SELECT p.paper_url, p.year, p.title, pa.position FROM paper_authors pa "
+                             "JOIN papers p ON p.paper_url = pa.paper_url WHERE pa.author_id = ? "
+                             "ORDER BY p.year, p.rowid", (identifier,))
+        return {"author_id": rows[0]["author_id"], "name": rows[0]["name"], "papers": [dict(row) for row in papers]}
+
+    def top_authors(self, limit=10):
+        rows = self._query("SELECT a.author_id, a.name, COUNT(*) AS papers FROM paper_authors pa "
+                           "JOIN authors a ON a.author_id = pa.author_id GROUP BY pa.author_id "
+                           "ORDER BY papers DESC, a.name LIMIT ?", (limit,))
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        row = self._query(
+            "SELECT (SELECT COUNT(*) FROM papers) AS papers, "
+            "(SELECT COUNT(DISTINCT canonical_url) FROM papers) AS distinct_papers, "
+            "(SELECT COUNT(*) FROM papers WHERE match = 'title') AS title_duplicates, "
+            "(SELECT COUNT(*) FROM papers WHERE match = 'near') AS near_duplicates, "
+            "(SELECT COUNT(*) FROM authors) AS authors")[0]
+        return dict(row)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def format_counts(counts):
+    return (f"{counts['new']} new, {counts['title']} same title, {counts['near']} near duplicates, "
+            f"{counts['repeated']} already indexed, {counts['updated']} changed")
+
+
+def format_stats(stats):
+    return (f"{stats['papers']} papers, {stats['distinct_papers']} distinct ({stats['title_duplicates']} same title, "
+            f"{stats['near_duplicates']} near duplicates), {stats['authors']} authors")
+
+
+def build(output_dir, metadata_format, years=None, log=print):
+    """Indexes the metadata of the given years (default: every year in output_dir); rows seen before are only counted."""
+    identity = open_identity(output_dir)
+    try:
+        if years is None:
+            years = sorted(name for name in os.listdir(output_dir) if name.isdigit())
+        for year in years:
+            log(f"Year {year}: {format_counts(identity.add(read_rows(output_dir, year, metadata_format)))}")
+        log(f"Identity index: {format_stats(identity.stats())}")
+    finally:
+        identity.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find duplicate papers and author identities across years.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Index the metadata files of an output directory")
+    build_parser.add_argument("--output-dir", default=os.getcwd())
+    build_parser.add_argument("--metadata-format", choices=list(SINK_FORMATS), default=DEFAULT_FORMAT)
+    duplicates_parser = commands.add_parser("duplicates", help="List papers found more than once")
+    duplicates_parser.add_argument("--output-dir", default=os.getcwd())
+    duplicates_parser.add_argument("--limit", type=int, default=20)
+    author_parser = commands.add_parser("author", help="An author's ID and papers (without a name: the most prolific)")
+    author_parser.add_argument("name", nargs="?")
+    author_parser.add_argument("--output-dir", default=os.getcwd())
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build(args.output_dir, args.metadata_format)
+        return 0
+    identity = open_identity(args.output_dir)
+    try:
+        if args.command == "duplicates":
+            for first, others in identity.duplicates(args.limit):
+                print(f"{first['year']}  {first['title']}  {first['paper_url']}")
+                for other in others:
+                    print(f"    {other['match']} {other['similarity']:.2f}  {other['year']}  {other['title']}  "
+                          f"{other['paper_url']}")
+        elif args.name:
+            author = identity.author(args.name)
+            if author is None:
+                print(f"Unknown author: {args.name}")
+                return 1
+            print(f"{author['name']} ({author['author_id']}): {len(author['papers'])} papers")
+            for paper in author["papers"]:
+                print(f"    {paper['year']}  {paper['title']}")
+        else:
+            for author in identity.top_authors():
+                print(f"{author['papers']:5}  {author['name']} ({author['author_id']})")
+    finally:
+        identity.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
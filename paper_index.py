@@ -0,0 +1,462 @@
+"""Persistent full-text index over the scraped metadata, with boolean and BM25 ranked search.
+
+Title and abstract are tokenized into one text field; the comma-joined
+authors field becomes one normalized key per author; year and annotation
+label are facets. Papers are added in batches that become immutable
+segments: a term dictionary (JSON, loaded at open), the postings (doc ids
+and term frequencies as uint32 arrays, memory-mapped) and the segment's
+documents. index.json lists the live segments and is replaced atomically
+after every flush, so readers always see a consistent set and a crash loses
+at most the unflushed batch. Re-adding a paper (say, once it has a label)
+supersedes its earlier document. Small segments are merged once there are
+more than MAX_SEGMENTS.
+
+The metadata writer feeds the index as rows are checkpointed; build
+catches an output directory up from its metadata files.
+
+    python paper_index.py build --output-dir OUTPUTS
+    python paper_index.py search --output-dir OUTPUTS "graph neural" --year 2020
+    python paper_index.py search --output-dir OUTPUTS 'author:"Seongmin Ok"' --match all
+"""
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import shlex
+import array
+import heapq
+import hashlib
+import argparse
+import threading
+import unicodedata
+
+from metadata_sink import read_rows, SINK_FORMATS, DEFAULT_FORMAT
+
+INDEX_DIRNAME = "search_index"
+MANIFEST_FILENAME = "index.json"
+FLUSH_DOCS = 1000         # Papers buffered before they are written as a segment
+MAX_SEGMENTS = 8
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"\w+")
+STOPWORDS = frozenset("a an and are as at be by for from has have in is it its of on or that the this "
+                      "to was we were which with".split())
+FIELD_PREFIXES = {"author": "a:", "year": "y:", "label": "l:"}
+TEXT_PREFIX = "t:"
+LABEL_NOISE_RE = re.compile(r"\([^)]*\)?")
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall((text or "").casefold()) if token not in STOPWORDS]
+
+
+def normalize_author(name):
+    """Case, accents, dots and spacing folded away: "José  M. Pérez" -> "jose m perez"."""
+    name = unicodedata.normalize("NFKD", name or "")
+    name = "".join(c for c in name if not unicodedata.combining(c)).casefold().replace(".", " ")
+    return " ".join(name.split())
+
+
+def split_authors(authors):
+    return [name for name in (normalize_author(part) for part in (authors or "").split(",")) if name]
+
+
+def split_labels(annotation):
+    """Label facet values of an annotation: its first line, minus markdown, numbering and asides in parentheses.
+
+    "**5. Optimization** (and potentially Deep Learning)" -> ["optimization"];
+    "Deep Learning, Computer Vision" -> ["deep learning", "computer vision"].
+    """
+    first = next((line for line in (annotation or "").splitlines() if line.strip()), "")
+    first = LABEL_NOISE_RE.sub(" ", first.replace("*", "")).casefold()
+    labels = []
+    for part in re.split(r",|\band\b", first):
+        label = " ".join(re.sub(r"^\s*\d+\.", "", part).split()).strip(" .:")
+        if label and label not in labels:
+            labels.append(label)
+    return labels
+
+
+def document_keys(row):
+    """(term frequencies by key, text length) for one metadata row."""
+    tokens = tokenize(row.get("title")) + tokenize(row.get("abstract"))
+    frequencies = {}
+    for token in tokens:
+        key = TEXT_PREFIX + token
+        frequencies[key] = frequencies.get(key, 0) + 1
+    for name in split_authors(row.get("authors")):
+        frequencies[FIELD_PREFIXES["author"] + name] = 1
+    frequencies[FIELD_PREFIXES["year"] + str(row.get("year", ""))] = 1
+    for label in split_labels(row.get("annotation")):
+        frequencies[FIELD_PREFIXES["label"] + label] = 1
+    return frequencies, len(tokens)
+
+
+def row_digest(row):
+    fields = [str(row.get(name) or "") for name in ("title", "authors", "abstract", "year", "annotation")]
+    return hashlib.sha1("\x1f".join(fields).encode("utf-8")).hexdigest()
+
+
+class Segment:
+    """One immutable batch of documents: its term dictionary in memory, its postings memory-mapped."""
+
+    def __init__(self, directory, name):
+        self.name = name
+        with open(os.path.join(directory, f"{name}.terms.json"), encoding="utf-8") as f:
+            self.terms = json.load(f)          # key -> [offset, count] in uint32 items
+        with open(os.path.join(directory, f"{name}.docs.jsonl"), encoding="utf-8") as f:
+            self.docs = [json.loads(line) for line in f if line.strip()]
+        self.file = open(os.path.join(directory, f"{name}.postings"), "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.items = memoryview(self.map).cast("I") if self.map else memoryview(b"").cast("I")
+
+    def postings(self, key, skip=()):
+        """(doc id, tf) pairs for key, read straight from the mapped file, leaving out the ids in skip."""
+        entry = self.terms.get(key)
+        if not entry:
+            return []
+        offset, count = entry
+        with self.items[offset:offset + count] as ids, self.items[offset + count:offset + 2 * count] as tfs:
+            if not skip:
+                return list(zip(ids, tfs))
+            return [(doc_id, tf) for doc_id, tf in zip(ids, tfs) if doc_id not in skip]
+
+    def close(self):
+        self.items.release()
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+
+def write_segment(directory, name, docs, postings):
+    """Writes a segment from docs (dicts with "id") and postings {key: [(doc id, tf), ...]} in id order."""
+    terms = {}
+    data = array.array("I")
+    for key in sorted(postings):
+        entries = postings[key]
+        terms[key] = [len(data), len(entries)]
+        data.extend(doc_id for doc_id, _ in entries)
+        data.extend(tf for _, tf in entries)
+    with open(os.path.join(directory, f"{name}.postings"), "wb") as f:
+        data.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    with open(os.path.join(directory, f"{name}.docs.jsonl"), "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(doc, ensure_ascii=False) + "\n" for doc in docs))
+    with open(os.path.join(directory, f"{name}.terms.json"), "w", encoding="utf-8") as f:
+        json.dump(terms, f, ensure_ascii=False, separators=(",", ":"))
+
+
+class PaperIndex:
+    """Adds metadata rows in batches and answers queries over every flushed segment.
+
+    Thread-safe; meant for one writing process at a time (the crawler's
+    metadata writer or a build run). Other processes can search the same
+    directory and see new segments after reload().
+    """
+
+    def __init__(self, directory, flush_docs=FLUSH_DOCS):
+        self.directory = directory
+        self.flush_docs = flush_docs
+        self.lock = threading.Lock()
+        self.pending = {}          # paper_url -> row, in arrival order
+        self.segments = []
+        os.makedirs(directory, exist_ok=True)
+        self.reload()
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_FILENAME)
+
+    def reload(self):
+        """(Re)reads the manifest and maps the segments it lists."""
+        with self.lock:
+            try:
+                with open(self._manifest_path(), encoding="utf-8") as f:
+                    self.manifest = json.load(f)
+            except FileNotFoundError:
+                self.manifest = {"segments": [], "next_id": 0, "next_segment": 0, "superseded": []}
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+            self.superseded = set(self.manifest["superseded"])
+            self.docs = {}             # doc id -> document
+            self.by_url = {}           # paper_url -> live doc id
+            self.total_length = 0      # Text tokens over the live documents, for BM25's average length
+            self.norm_key = None
+            for name in self.manifest["segments"]:
+                self._attach(Segment(self.directory, name))
+
+    def _attach(self, segment):
+        """Adds a segment's documents to the in-memory maps; a later document for a URL supersedes the earlier one."""
+        self.segments.append(segment)
+        for doc in segment.docs:
+            self.docs[doc["id"]] = doc
+            if doc["id"] in self.superseded:
+                continue
+            previous = self.by_url.get(doc["paper_url"])
+            if previous is not None:
+                self.superseded.add(previous)
+                self.total_length -= self.docs[previous]["length"]
+            self.by_url[doc["paper_url"]] = doc["id"]
+            self.total_length += doc["length"]
+
+    def __len__(self):
+        return len(self.by_url)
+
+    def add(self, rows):
+        """Queues rows for the next segment and returns how many; rows already indexed unchanged are skipped."""
+        queued = 0
+        with self.lock:
+            for row in rows:
+                url = row.get("paper_url")
+                if not url:
+                    continue
+                doc_id = self.by_url.get(url)
+                if doc_id is not None and self.docs[doc_id]["digest"] == row_digest(row) and url not in self.pending:
+                    continue
+                self.pending[url] = row
+                queued += 1
+            full = len(self.pending) >= self.flush_docs
+        if full:
+            self.flush()
+        return queued
+
+    def flush(self):
+        """Writes the queued rows as a new segment and publishes it."""
+        with self.lock:
+            if not self.pending:
+                return 0
+            rows, self.pending = list(self.pending.values()), {}
+            manifest = dict(self.manifest)
+            name = f"seg_{manifest['next_segment']:06d}"
+            docs, postings = [], {}
+            superseded = set(self.superseded)
+            for row in rows:
+                doc_id = manifest["next_id"]
+                manifest["next_id"] += 1
+                frequencies, length = document_keys(row)
+                for key, tf in frequencies.items():
+                    postings.setdefault(key, []).append((doc_id, tf))
+                if row["paper_url"] in self.by_url:
+                    superseded.add(self.by_url[row["paper_url"]])
+                docs.append({"id": doc_id, "paper_url": row["paper_url"], "title": row.get("title", ""),
+                             "authors": row.get("authors", ""), "year": str(row.get("year", "")),
+                             "labels": split_labels(row.get("annotation")), "length": length, "digest": row_digest(row)})
+            write_segment(self.directory, name, docs, postings)
+            manifest["segments"] = manifest["segments"] + [name]
+            manifest["next_segment"] += 1
+            manifest["superseded"] = sorted(superseded)
+            self._publish(manifest)
+            self.manifest = manifest
+            self._attach(Segment(self.directory, name))
+        if len(self.manifest["segments"]) > MAX_SEGMENTS:
+            self.compact()
+        return len(rows)
+
+    def _publish(self, manifest):
+        temporary = self._manifest_path() + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._manifest_path())
+
+    def compact(self):
+        """Merges every segment into one, dropping superseded documents."""
+        with self.lock:
+            manifest = dict(self.manifest)
+            name = f"seg_{manifest['next_segment']:06d}"
+            docs, postings = [], {}
+            for segment in self.segments:
+                docs.extend(doc for doc in segment.docs if doc["id"] not in self.superseded)
+                for key in segment.terms:
+                    entries = segment.postings(key, self.superseded)
+                    if entries:
+                        postings.setdefault(key, []).extend(entries)
+            write_segment(self.directory, name, docs, postings)
+            old = manifest["segments"]
+            manifest.update(segments=[name], next_segment=manifest["next_segment"] + 1, superseded=[])
+            self._publish(manifest)
+        self.reload()
+        for old_name in old:
+            for suffix in (".postings", ".docs.jsonl", ".terms.json"):
+                try:
+                    os.remove(os.path.join(self.directory, old_name + suffix))
+                except OSError:
+                    pass   # Still mapped by a reader on Windows; harmless garbage.
+
+    def postings(self, key):
+        """Live (doc id, tf) pairs for an index key such as "t:graph" or "a:seongmin ok"."""
+        pairs = []
+        for segment in self.segments:
+            pairs.extend(segment.postings(key, self.superseded))
+        return pairs
+
+    def _norms(self):
+        """BM25's length normalization per live doc id, recomputed only when the documents change."""
+        if self.norm_key != len(self.docs):
+            average = self.total_length / max(len(self.by_url), 1) or 1.0
+            self.norms = {doc_id: BM25_K1 * (1 - BM25_B + BM25_B * self.docs[doc_id]["length"] / average)
+                          for doc_id in self.by_url.values()}
+            self.norm_key = len(self.docs)
+        return self.norms
+
+    def _matching(self, key):
+        return {doc_id for doc_id, _ in self.postings(key)}
+
+    def search(self, query="", year=None, label=None, author=None, match="any", limit=10):
+        """Ranks papers for a query; returns [{"score", "paper_url", "title", "authors", "year", "labels"}].
+
+        Free words are ranked with BM25 over title + abstract. match="all"
+        requires every word (boolean AND), "any" at least one (OR). -word
+        excludes papers containing it; author:"Name", year:2020 and
+        label:"Deep Learning" in the query (or the keyword arguments) filter.
+        With only filters, matches come back in index order with score 0.
+        """
+        words, excluded, filters = parse_query(query)
+        for field, value in (("year", year), ("label", label), ("author", author)):
+            if value:
+                filters.append(facet_key(field, value))
+        with self.lock:
+            allowed = None
+            for key in filters:
+                matching = self._matching(key)
+                allowed = matching if allowed is None else allowed & matching
+            banned = set()
+            for word in excluded:
+                banned |= self._matching(TEXT_PREFIX + word)
+
+            norms = self._norms()
+            live = len(self.by_url)
+            scores, matched = {}, []
+            for word in dict.fromkeys(words):
+                pairs = self.postings(TEXT_PREFIX + word)
+                if allowed is not None or banned:
+                    pairs = [(doc_id, tf) for doc_id, tf in pairs
+                             if (allowed is None or doc_id in allowed) and doc_id not in banned]
+                weight = math.log(1 + (live - len(pairs) + 0.5) / (len(pairs) + 0.5)) * (BM25_K1 + 1)
+                for doc_id, tf in pairs:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight * tf / (tf + norms[doc_id])
+                matched.append({doc_id for doc_id, _ in pairs})
+            if words:
+                candidates = set.intersection(*matched) if match == "all" else scores
+                ranked = heapq.nlargest(limit, candidates, key=lambda doc_id: (scores[doc_id], -doc_id))
+            else:
+                candidates = allowed if allowed is not None else self.by_url.values()
+                ranked = sorted(doc_id for doc_id in candidates if doc_id not in banned)[:limit]
+            return [{"score": round(scores.get(doc_id, 0.0), 4), "paper_url": self.docs[doc_id]["paper_url"],
+                     "title": self.docs[doc_id]["title"], "authors": self.docs[doc_id]["authors"],
+                     "year": self.docs[doc_id]["year"], "labels": self.docs[doc_id]["labels"]}
+                    for doc_id in ranked]
+
+    def facet_counts(self, field):
+        """{value: live paper count} for "year" or "label"; a paper counts once for each of its labels."""
+        counts = {}
+        with self.lock:
+            for doc_id in self.by_url.values():
+                doc = self.docs[doc_id]
+                for value in (doc["labels"] if field == "label" else [doc["year"]]):
+                    counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+
+
+def facet_key(field, value):
+    if field == "author":
+        return FIELD_PREFIXES["author"] + normalize_author(value)
+    if field == "label":
+        return FIELD_PREFIXES["label"] + " ".join(str(value).split()).casefold()
+    return FIELD_PREFIXES[field] + str(value).strip()
+
+
+def parse_query(query):
+    """Splits a query into (words, excluded words, filter keys); quotes group multi-word values."""
+    words, excluded, filters = [], [], []
+    for part in shlex.split(query or ""):
+        field, _, value = part.partition(":")
+        if value and field in FIELD_PREFIXES:
+            filters.append(facet_key(field, value))
+        elif part.startswith("-"):
+            excluded.extend(tokenize(part[1:]))
+        elif part.upper() not in ("AND", "OR"):
+            words.extend(tokenize(part))
+    return words, excluded, filters
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def index_path(output_dir):
+    return os.path.join(output_dir, INDEX_DIRNAME)
+
+
+def open_index(output_dir):
+    """Returns the index of output_dir; one instance per directory per process, like open_store."""
+    key = os.path.abspath(output_dir)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = PaperIndex(index_path(output_dir))
+        return _indexes[key]
+
+
+def build(output_dir, metadata_format, years=None, log=print):
+    """Indexes the metadata of the given years (default: every year in output_dir) the index lacks in its current form."""
+    index = open_index(output_dir)
+    if years is None:
+        years = sorted(name for name in os.listdir(output_dir) if name.isdigit())
+    for year in years:
+        rows = read_rows(output_dir, year, metadata_format)
+        log(f"Year {year}: {len(rows)} rows, {index.add(rows)} new or changed")
+    index.flush()
+    log(f"Index: {len(index)} papers in {len(index.segments)} segments")
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the search index over scraped metadata.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Index the metadata files of an output directory")
+    build_parser.add_argument("--output-dir", default=os.getcwd())
+    build_parser.add_argument("--metadata-format", choices=list(SINK_FORMATS), default=DEFAULT_FORMAT)
+    search_parser = commands.add_parser("search", help="Search the index")
+    search_parser.add_argument("query", nargs="?", default="")
+    search_parser.add_argument("--output-dir", default=os.getcwd())
+    search_parser.add_argument("--year")
+    search_parser.add_argument("--label")
+    search_parser.add_argument("--author")
+    search_parser.add_argument("--match", choices=["any", "all"], default="any")
+    search_parser.add_argument("--limit", type=int, default=10)
+    search_parser.add_argument("--json", action="store_true", help="One JSON object per result")
+    facets_parser = commands.add_parser("facets", help="Paper counts per year and label")
+    facets_parser.add_argument("--output-dir", default=os.getcwd())
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build(args.output_dir, args.metadata_format)
+        return 0
+    index = PaperIndex(index_path(args.output_dir))
+    if args.command == "facets":
+        for field in ("year", "label"):
+            print(f"{field}: " + ", ".join(f"{value} {count}" for value, count in sorted(index.facet_counts(field).items())))
+        return 0
+    for result in index.search(args.query, args.year, args.label, args.author, args.match, args.limit):
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            print(f"{result['score']:7.3f}  {result['year']}  {result['title']}  ({result['authors']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import os
+import asyncio
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+
+from parsers import parse_paper, get_extractor
+from crawl_metrics import get_metrics
+
+BATCH_SIZE = 16          # Pages handed to a parse worker at once
+BATCH_WAIT = 0.2         # Seconds a partial batch may wait for more pages
+REPORT_INTERVAL = 5.0    # Seconds between queue depth reports
+
+_END = object()
+
+
+def parse_batch(pages, base_url, extractor):
+    """Parses (paper_url, html) pairs in a worker process; returns (paper_url, record, error, seconds) tuples."""
+    results = []
+    for paper_url, html in pages:
+        started = time.monotonic()
+        try:
+            results.append((paper_url, parse_paper(html, base_url, extractor), None, time.monotonic() - started))
+        except Exception as e:
+            results.append((paper_url, None, str(e), time.monotonic() - started))
+    return results
+
+
+class ParsePool:
+    """Process pool that runs the CPU-bound parse stage outside the GIL.
+
+    Created once per run and shared by every year, so worker start-up is paid once.
+    """
+
+    def __init__(self, workers=None, batch_size=BATCH_SIZE, extractor=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.extractor = extractor or get_extractor()
+        # spawn, not fork: the parent already runs GUI and worker threads.
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, pages, base_url):
+        return self.executor.submit(parse_batch, pages, base_url, self.extractor)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class AsyncParseBatcher:
+    """Collects pages parsed from asyncio coroutines into batches for a ParsePool."""
+
+    def __init__(self, parse_pool, base_url):
+        self.parse_pool = parse_pool
+        self.base_url = base_url
+        self.pending = []
+        self.in_flight = 0
+        self._timer = None
+
+    async def parse(self, paper_url, html):
+        loop = asyncio.get_running_loop()
+        result = loop.create_future()
+        self.pending.append((paper_url, html, result))
+        if len(self.pending) >= self.parse_pool.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(BATCH_WAIT, self._flush)
+        return await result
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            future = self.parse_pool.submit([(url, html) for url, html, _ in batch], self.base_url)
+        except Exception as e:
+            # E.g. BrokenProcessPool: nothing will resolve these pages, so fail them here.
+            for _, _, result in batch:
+                if not result.done():
+                    result.set_exception(e)
+            return
+        self.in_flight += len(batch)
+        asyncio.wrap_future(future).add_done_callback(lambda done: self._resolve(batch, done))
+
+    def _resolve(self, batch, done):
+        self.in_flight -= len(batch)
+        error = done.exception()
+        results = {}
+        if not error:
+            metrics = get_metrics()
+            for url, record, message, seconds in done.result():
+                metrics.observe("parse", seconds)
+                results[url] = (record, message)
+        for url, _, result in batch:
+            if result.done():
+                continue
+            record, message = results.get(url, (None, str(error)))
+            if message:
+                result.set_exception(ValueError(message))
+            else:
+                result.set_result(record)
+
+    def depths(self):
+        return f"Queue depths: waiting to parse {len(self.pending)} | parsing {self.in_flight}"
+
+
+def run_staged(paper_links, fetch, finish, fail, base_url, io_workers, parse_pool, stop_event, log,
+               report_interval=REPORT_INTERVAL):
+    """Runs fetch -> parse -> finish for a list of papers as three overlapping stages.
+
+    fetch(paper_url) returns (html, context) or None on I/O threads; pages are
+    batched into parse_pool; finish(paper_url, record, context) runs on I/O
+    threads again (PDF download, metadata hand-off). fail(paper_url, error) is
+    called for each paper whose fetch, parse or finish raised.
+    """
+    fetched = queue.Queue(maxsize=parse_pool.batch_size * parse_pool.workers * 4)
+    parsing = queue.Queue()
+    contexts = {}
+    # Bounding the batches in flight makes a slow parse stage back up into the fetchers.
+    slots = threading.BoundedSemaphore(parse_pool.workers * 2)
+    depths = {"parsing": 0, "finishing": 0}
+    depth_lock = threading.Lock()
+    metrics = get_metrics()
+    metrics.register_gauge("fetched", fetched.qsize)
+    metrics.register_gauge("parsing", lambda: depths["parsing"])
+    metrics.register_gauge("finishing", lambda: depths["finishing"])
+
+    def fetch_stage(paper_url):
+        if stop_event.is_set():
+            return
+        page = fetch(paper_url)
+        if page is not None:
+            html, context = page
+            contexts[paper_url] = context
+            fetched.put((paper_url, html))
+
+    def fail_papers(paper_urls, error):
+        for paper_url in paper_urls:
+            contexts.pop(paper_url, None)
+            fail(paper_url, error)
+
+    def submit_batch(batch):
+        slots.acquire()
+        try:
+            future = parse_pool.submit(batch, base_url)
+        except Exception as e:
+            # E.g. BrokenProcessPool after a worker died: these papers fail, the stage keeps draining.
+            slots.release()
+            fail_papers([paper_url for paper_url, _ in batch], e)
+            return
+        with depth_lock:
+            depths["parsing"] += len(batch)
+        parsing.put(([paper_url for paper_url, _ in batch], future))
+
+    def batch_stage():
+        batch = []
+        started = time.monotonic()
+        try:
+            while True:
+                try:
+                    item = fetched.get(timeout=BATCH_WAIT)
+                except queue.Empty:
+                    item = None
+                if item is not None and item is not _END:
+                    if not batch:
+                        started = time.monotonic()
+                    batch.append(item)
+                full = len(batch) >= parse_pool.batch_size
+                stale = batch and time.monotonic() - started >= BATCH_WAIT
+                if batch and (full or stale or item is _END):
+                    submit_batch(batch)
+                    batch = []
+                if item is _END:
+                    return
+        finally:
+            # Always, or the hand-off loop below would wait for batches forever.
+            parsing.put(_END)
+
+    def close_fetch_stage():
+        for paper_url, future in zip(paper_links, fetch_futures):
+            error = future.exception()
+            if error:
+                fail_papers([paper_url], error)
+        fetched.put(_END)
+
+    def finish_stage(paper_url, record, context):
+        try:
+            finish(paper_url, record, context)
+        except Exception as e:
+            fail(paper_url, e)
+        finally:
+            with depth_lock:
+                depths["finishing"] -= 1
+
+    def report():
+        with depth_lock:
+            log(f"Queue depths: fetched {fetched.qsize()} | parsing {depths['parsing']} | "
+                f"finishing {depths['finishing']}")
+
+    with ThreadPoolExecutor(max_workers=io_workers) as fetchers, \
+            ThreadPoolExecutor(max_workers=io_workers) as finishers:
+        batcher = threading.Thread(target=batch_stage, daemon=True)
+        batcher.start()
+        fetch_futures = [fetchers.submit(fetch_stage, url) for url in paper_links]
+        threading.Thread(target=close_fetch_stage, daemon=True).start()
+
+        # Hand parsed batches to the finishers as they complete, reporting depths while waiting.
+        last_report = time.monotonic()
+        while True:
+            try:
+                item = parsing.get(timeout=report_interval)
+            except queue.Empty:
+                item = None
+            if time.monotonic() - last_report >= report_interval:
+                report()
+                last_report = time.monotonic()
+            if item is None:
+                continue
+            if item is _END:
+                break
+            paper_urls, future = item
+            while not future.done():
+                wait([future], timeout=report_interval)
+                if not future.done():
+                    report()
+                    last_report = time.monotonic()
+            slots.release()
+            with depth_lock:
+                depths["parsing"] -= len(paper_urls)
+            try:
+                results = future.result()
+            except Exception as e:
+                log(f"Error: parse batch failed: {str(e)}")
+                fail_papers(paper_urls, e)
+                continue
+            for paper_url, record, error, seconds in results:
+                metrics.observe("parse", seconds)
+                context = contexts.pop(paper_url, None)
+                if error:
+                    fail(paper_url, ValueError(error))
+                    continue
+                with depth_lock:
+                    depths["finishing"] += 1
+                finishers.submit(finish_stage, paper_url, record, context)
+        batcher.join()
+    report()
+    for name in ["fetched", "parsing", "finishing"]:
+        metrics.unregister_gauge(name)
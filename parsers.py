@@ -0,0 +1,97 @@
+from bs4 import BeautifulSoup
+
+import fast_parsers
+
+DEFAULT_EXTRACTOR = "fast"
+_extractor = DEFAULT_EXTRACTOR
+
+
+def bs4_parse_year_links(main_page_html, base_url):
+    """Returns the year page URLs linked from the main page."""
+    soup = BeautifulSoup(main_page_html, "html.parser")
+    return [base_url + link["href"] for link in soup.select("a[href^='/paper_files/paper/']")]
+
+
+def bs4_parse_paper_links(year_page_html, base_url):
+    """Returns the paper page URLs listed on a year page."""
+    soup = BeautifulSoup(year_page_html, "html.parser")
+    return [base_url + a["href"] for a in soup.select("body > div.container-fluid > div > ul li a")]
+
+
+def bs4_parse_paper(paper_html, base_url):
+    """Extracts title, authors, abstract and PDF URL from a paper page."""
+    soup = BeautifulSoup(paper_html, "html.parser")
+
+    try:
+        title = soup.find('h4').get_text(strip=True)
+    except AttributeError:
+        title = "Untitled"
+
+    # Authors: find h4 containing "Authors" and then get its next sibling's text.
+    authors_element = soup.find("h4", string=lambda t: t and "Authors" in t)
+    if authors_element:
+        authors_sibling = authors_element.find_next_sibling()
+        authors = authors_sibling.get_text(strip=True) if authors_sibling else "Unknown"
+    else:
+        authors = "Unknown"
+
+    # Abstract: find h4 containing "Abstract" and then get its next sibling's text.
+    abstract_element = soup.find("h4", string=lambda t: t and "Abstract" in t)
+    if abstract_element:
+        abstract_sibling = abstract_element.find_next_sibling()
+        abstract = abstract_sibling.get_text(strip=True) if abstract_sibling else "No abstract available"
+    else:
+        abstract = "No abstract available"
+
+    pdf_link = soup.find('a', string='Paper')
+    pdf_url = base_url + pdf_link['href'] if pdf_link else None
+
+    return {"title": title, "authors": authors, "abstract": abstract, "pdf_url": pdf_url}
+
+
+# "bs4" is the reference implementation; "fast" must produce identical records
+# (checked by benchmarks/parse_parity.py).
+EXTRACTORS = {
+    "fast": {
+        "year_links": fast_parsers.parse_year_links,
+        "paper_links": fast_parsers.parse_paper_links,
+        "paper": fast_parsers.parse_paper,
+    },
+    "bs4": {
+        "year_links": bs4_parse_year_links,
+        "paper_links": bs4_parse_paper_links,
+        "paper": bs4_parse_paper,
+    },
+}
+
+
+def configure_extractor(name):
+    """Selects the extraction backend used by the parse_* functions."""
+    global _extractor
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor: {name}")
+    _extractor = name
+
+
+def get_extractor():
+    return _extractor
+
+
+def parse_year_links(main_page_html, base_url, extractor=None):
+    """Returns the year page URLs linked from the main page."""
+    return EXTRACTORS[extractor or _extractor]["year_links"](main_page_html, base_url)
+
+
+def parse_paper_links(year_page_html, base_url, extractor=None):
+    """Returns the paper page URLs listed on a year page."""
+    return EXTRACTORS[extractor or _extractor]["paper_links"](year_page_html, base_url)
+
+
+def parse_paper(paper_html, base_url, extractor=None):
+    """Extracts title, authors, abstract and PDF URL from a paper page."""
+    return EXTRACTORS[extractor or _extractor]["paper"](paper_html, base_url)
+
+
+def sanitize_filename(filename):
+    """Sanitizes a filename by removing special characters."""
+    return "".join(c for c in filename if c.isalnum() or c in (" ", "-", "_")).strip().replace(" ", "_")
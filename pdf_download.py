@@ -0,0 +1,200 @@
+"""Resumable, verified PDF downloads shared by the threaded and asyncio engines.
+
+Bytes go to <name>.pdf.part and are only renamed to <name>.pdf once the size
+matches Content-Length and the file starts with %PDF, so a stopped or failed
+run never leaves a truncated .pdf behind. A later attempt resumes the .part
+file with an HTTP Range request. Failures are queued in
+failed_pdfs/retry_queue.jsonl and retried at the start of the next run; an
+entry leaves the queue only once its retry has succeeded.
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 1024 * 1024
+PDF_MAGIC = b"%PDF"
+FAILED_DIRNAME = "failed_pdfs"
+RETRY_QUEUE = "retry_queue.jsonl"
+DOWNLOAD_ATTEMPTS = 3    # Within a run; throttled or cut-off downloads resume from their .part file
+
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-\d+/(\d+|\*)")
+_LEGACY_FAILURE_RE = re.compile(r"^Failed to download (\S+): ")
+_queue_lock = threading.Lock()
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadStopped(Exception):
+    pass
+
+
+def part_path(path):
+    return path + ".part"
+
+
+def chunk_size_for(remaining):
+    """Larger reads for larger files: about 32 reads per file, between 64 KB and 1 MB."""
+    if not remaining:
+        return MIN_CHUNK
+    return max(MIN_CHUNK, min(MAX_CHUNK, remaining // 32 // MIN_CHUNK * MIN_CHUNK))
+
+
+def resume_offset(path, keep=None):
+    """Returns (offset, sha256 of the bytes already in the .part file); keep, a bytearray, receives those bytes."""
+    digest = hashlib.sha256()
+    if keep is not None:
+        keep.clear()
+    try:
+        with open(part_path(path), "rb") as f:
+            for block in iter(lambda: f.read(MAX_CHUNK), b""):
+                digest.update(block)
+                if keep is not None:
+                    keep += block
+            return f.tell(), digest
+    except FileNotFoundError:
+        return 0, digest
+
+
+def range_headers(offset):
+    return {"Range": f"bytes={offset}-"} if offset else None
+
+
+def plan_write(status, headers, offset):
+    """Decides how to use a response to a (possibly ranged) request.
+
+    Returns (append, expected_total): append is False when the server sent the
+    whole file and the .part file must be restarted; expected_total is None
+    when the server did not say how large the file is.
+    """
+    if status == 206:
+        match = _CONTENT_RANGE_RE.match(headers.get("Content-Range", ""))
+        if not match or int(match.group(1)) != offset:
+            raise DownloadError(f"Unexpected Content-Range {headers.get('Content-Range')!r} for offset {offset}")
+        return True, int(match.group(2)) if match.group(2) != "*" else None
+    length = headers.get("Content-Length")
+    return False, int(length) if length and length.isdigit() else None
+
+
+def finalize(path, size, expected_total):
+    """Checks the .part file and atomically renames it to path."""
+    partial = part_path(path)
+    if expected_total is not None and size != expected_total:
+        raise DownloadError(f"Incomplete download: got {size} of {expected_total} bytes")
+    with open(partial, "rb") as f:
+        magic = f.read(len(PDF_MAGIC))
+    if magic != PDF_MAGIC:
+        os.remove(partial)   # Not resumable: the server sent something other than a PDF.
+        raise DownloadError("Downloaded file is not a PDF")
+    os.replace(partial, path)
+
+
+def download_file(transport, url, path, timeout, stop_event, keep=None):
+    """Downloads url to path through a .part file; returns (size, sha256).
+
+    Raises DownloadStopped if stop_event is set (the .part file is kept for
+    the next run) and DownloadError / requests.RequestException on failure.
+    If keep is a bytearray it ends up holding the file's bytes, so they can
+    be used without reading the file back.
+    """
+    offset, digest = resume_offset(path, keep)
+    with transport.get(url, timeout, stream=True, headers=range_headers(offset)) as response:
+        if response.status_code == 416 and offset:
+            # The .part file already holds the whole body (or more); start over.
+            os.remove(part_path(path))
+            raise DownloadError("Range not satisfiable; discarded partial file")
+        response.raise_for_status()
+        append, expected_total = plan_write(response.status_code, response.headers, offset)
+        if not append:
+            offset, digest = 0, hashlib.sha256()
+            if keep is not None:
+                keep.clear()
+        size = offset
+        remaining = expected_total - offset if expected_total else None
+        with open(part_path(path), "ab" if append else "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size_for(remaining)):
+                if stop_event.is_set():
+                    raise DownloadStopped()
+                f.write(chunk)
+                digest.update(chunk)
+                if keep is not None:
+                    keep += chunk
+                size += len(chunk)
+    finalize(path, size, expected_total)
+    return size, digest.hexdigest()
+
+
+def record_failure(output_dir, url, filename, year, paper_url, error):
+    """Logs a failed PDF to failed_pdfs.txt and queues it for retry on the next run."""
+    failed_dir = os.path.join(output_dir, FAILED_DIRNAME)
+    os.makedirs(failed_dir, exist_ok=True)
+    entry = {"url": url, "filename": filename, "year": str(year), "paper_url": paper_url}
+    with _queue_lock:
+        with open(os.path.join(failed_dir, "failed_pdfs.txt"), "a", encoding="utf-8") as f:
+            f.write(f"Failed to download {url}: {error}\n")
+        with open(os.path.join(failed_dir, RETRY_QUEUE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def read_retry_queue(output_dir):
+    """Returns the queued failures, de-duplicated by URL; they stay queued until remove_from_retry_queue.
+
+    The first time it runs on an output directory without a queue, the URLs
+    listed in an older failed_pdfs.txt are queued too.
+    """
+    failed_dir = os.path.join(output_dir, FAILED_DIRNAME)
+    queue_path = os.path.join(failed_dir, RETRY_QUEUE)
+    with _queue_lock:
+        if os.path.exists(queue_path):
+            return list(_queued_entries(queue_path).values())
+        entries = {}
+        legacy_path = os.path.join(failed_dir, "failed_pdfs.txt")
+        if os.path.exists(legacy_path):
+            with open(legacy_path, encoding="utf-8") as f:
+                for line in f:
+                    match = _LEGACY_FAILURE_RE.match(line)
+                    if match:
+                        entries[match.group(1)] = legacy_entry(match.group(1))
+            _write_queue(queue_path, entries.values())
+        return list(entries.values())
+
+
+def remove_from_retry_queue(output_dir, urls):
+    """Drops the given URLs (retried successfully) from the queue, which is also compacted to one entry per URL."""
+    queue_path = os.path.join(output_dir, FAILED_DIRNAME, RETRY_QUEUE)
+    urls = set(urls)
+    with _queue_lock:
+        if os.path.exists(queue_path):
+            entries = _queued_entries(queue_path)
+            _write_queue(queue_path, [entry for url, entry in entries.items() if url not in urls])
+
+
+def _queued_entries(queue_path):
+    entries = {}
+    with open(queue_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue    # Blank, or torn by a crash while it was appended
+            entries[entry["url"]] = entry
+    return entries
+
+
+def _write_queue(queue_path, entries):
+    """Replaces the queue atomically (temp file + rename)."""
+    work_path = queue_path + ".tmp"
+    with open(work_path, "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+    os.replace(work_path, queue_path)
+
+
+def legacy_entry(url):
+    """Rebuilds a queue entry from a bare URL: the year from its path, the name from its file name."""
+    year = re.search(r"/paper/(\d{4})/", url)
+    filename = os.path.splitext(os.path.basename(url))[0]
+    return {"url": url, "filename": filename, "year": year.group(1) if year else "unknown", "paper_url": None}
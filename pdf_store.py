@@ -0,0 +1,155 @@
+"""Content-addressed PDF storage.
+
+Every PDF is stored once under blobs/<aa>/<sha256>.pdf. Each year directory
+keeps a manifest.jsonl mapping paper_url -> sha256 -> file name (plus the
+name asked for, before any clash suffix), and the readable <year>/<name>.pdf
+is a hard link (or symlink, or copy where neither is supported) to the blob.
+Papers whose titles sanitize to the same name get numbered names instead of
+overwriting each other, identical PDFs share one blob, and a paper already
+in the manifest is answered without the network.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+BLOBS_DIRNAME = "blobs"
+INCOMING_DIRNAME = "incoming"
+MANIFEST_FILENAME = "manifest.jsonl"
+UNTITLED = "Untitled"
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(output_dir):
+    """Returns the store for output_dir; one instance per directory per process, so all threads share its lock."""
+    key = os.path.abspath(output_dir)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = PdfStore(output_dir)
+        return _stores[key]
+
+
+def link_or_copy(source, target):
+    """Points target at source: a hard link, else a symlink, else a copy. Replaces target atomically."""
+    temporary = target + ".link"
+    if os.path.lexists(temporary):
+        os.remove(temporary)
+    try:
+        os.link(source, temporary)
+    except OSError:
+        try:
+            os.symlink(os.path.relpath(source, os.path.dirname(target)), temporary)
+        except OSError:
+            shutil.copyfile(source, temporary)
+    os.replace(temporary, target)
+
+
+class PdfStore:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.blob_dir = os.path.join(output_dir, BLOBS_DIRNAME)
+        self.lock = threading.Lock()
+        self.manifests = {}    # year -> {paper_url: {"sha256", "name"}}
+        self.names = {}        # year -> {casefolded name: paper_url}
+        self.counts = {"stored": 0, "deduplicated": 0, "renamed": 0, "known": 0}
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256[:2], f"{sha256}.pdf")
+
+    def staging_path(self, url):
+        """Where a download of url is written before its hash is known; stable, so .part files resume."""
+        incoming = os.path.join(self.blob_dir, INCOMING_DIRNAME)
+        os.makedirs(incoming, exist_ok=True)
+        return os.path.join(incoming, f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.pdf")
+
+    def _manifest_path(self, year):
+        return os.path.join(self.output_dir, str(year), MANIFEST_FILENAME)
+
+    def _load(self, year):
+        year = str(year)
+        if year not in self.manifests:
+            entries = {}
+            try:
+                with open(self._manifest_path(year), encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            entries[entry["paper_url"]] = entry   # Later lines win.
+            except FileNotFoundError:
+                pass
+            self.manifests[year] = entries
+            self.names[year] = {entry["name"].casefold(): url for url, entry in entries.items()}
+        return self.manifests[year], self.names[year]
+
+    def _unique_name(self, names, name, paper_url):
+        # Case-insensitive, since Windows and macOS file systems are.
+        name = name or UNTITLED
+        candidate, number = name, 1
+        while names.get(candidate.casefold(), paper_url) != paper_url:
+            number += 1
+            candidate = f"{name}_{number}"
+        return candidate
+
+    def lookup(self, year, paper_url):
+        """Returns (path, size, sha256) if the paper is already stored, else None."""
+        with self.lock:
+            entry = self._load(year)[0].get(paper_url)
+            if not entry:
+                return None
+            path = os.path.join(self.output_dir, str(year), f"{entry['name']}.pdf")
+            blob = self.blob_path(entry["sha256"])
+            if not os.path.exists(blob):
+                return None
+            if not os.path.exists(path):
+                link_or_copy(blob, path)
+            self.counts["known"] += 1
+            return path, os.path.getsize(blob), entry["sha256"]
+
+    def add(self, year, paper_url, staged, sha256, name):
+        """Moves a verified download into the blob store and links it under a unique name; returns the path."""
+        blob = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        with self.lock:
+            if os.path.exists(blob):
+                os.remove(staged)
+                self.counts["deduplicated"] += 1
+            else:
+                os.replace(staged, blob)
+                self.counts["stored"] += 1
+            manifest, names = self._load(year)
+            previous = manifest.get(paper_url)
+            if previous:
+                unique = previous["name"]
+                name = previous.get("requested", name)
+            else:
+                unique = self._unique_name(names, name, paper_url)
+                if unique != (name or UNTITLED):
+                    self.counts["renamed"] += 1
+            year_dir = os.path.join(self.output_dir, str(year))
+            os.makedirs(year_dir, exist_ok=True)
+            path = os.path.join(year_dir, f"{unique}.pdf")
+            link_or_copy(blob, path)
+            entry = {"paper_url": paper_url, "sha256": sha256, "name": unique, "requested": name}
+            if previous != entry:
+                with open(self._manifest_path(year), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+                manifest[paper_url] = entry
+                names[unique.casefold()] = paper_url
+            return path
+
+    def entries(self, year):
+        """The manifest entries of a year, in the order they were first added."""
+        with self.lock:
+            return [dict(entry) for entry in self._load(year)[0].values()]
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+def format_stats(stats):
+    return (f"{stats['stored']} stored, {stats['deduplicated']} duplicates of stored PDFs, "
+            f"{stats['renamed']} renamed to avoid a title clash, {stats['known']} already present")
@@ -0,0 +1,284 @@
+"""Text and page counts from downloaded PDFs, extracted in a process pool.
+
+The downloaders keep each PDF's bytes as they stream it to disk and hand
+them to the TextExtractor once the file is in the PDF store, so extraction
+never reads the file back. Workers run pypdf and stop reading pages once
+max_chars of text are in; the page count always covers the whole PDF.
+Results are appended to <year>/pdf_text.jsonl next to the year's metadata,
+one record per paper:
+
+    {"paper_url", "sha256", "pages", "pages_read", "chars", "truncated", "text", "error"}
+
+A PDF whose sha256 already has a record is not extracted again: another
+paper with the same file gets a record with "same_as" pointing at the first.
+Annotator.py falls back on this text for papers without an abstract.
+
+    python pdf_text.py build --output-dir OUTPUTS     # PDFs stored before extraction was on
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_store import open_store
+from crawl_metrics import get_metrics
+
+TEXT_FILENAME = "pdf_text.jsonl"
+MAX_TEXT_CHARS = 20000
+QUEUED_PER_WORKER = 2    # PDFs waiting per worker; downloads wait beyond that, bounding the bytes held
+
+# Imported on first use, in the parent to fail early and in each worker.
+pypdf = None
+
+
+def _require_pypdf():
+    global pypdf
+    if pypdf is None:
+        try:
+            import pypdf as module
+        except ImportError:
+            raise RuntimeError("PDF text extraction requires pypdf (pip install pypdf)")
+        pypdf = module
+
+
+def extract_text(data, max_chars):
+    """Runs in a worker: returns (pages, pages read, text, truncated, error, CPU seconds) for a PDF's bytes."""
+    started = time.process_time()
+    try:
+        _require_pypdf()
+        reader = pypdf.PdfReader(io.BytesIO(data))
+        pages = len(reader.pages)
+        parts, length = [], 0
+        for page in reader.pages:
+            if length >= max_chars:
+                break
+            text = page.extract_text() or ""
+            parts.append(text)
+            length += len(text) + 1
+        text = "\n".join(parts)
+        truncated = len(text) > max_chars or len(parts) < pages
+        return pages, len(parts), text[:max_chars], truncated, None, time.process_time() - started
+    except Exception as e:
+        return 0, 0, "", False, f"{type(e).__name__}: {e}", time.process_time() - started
+
+
+def year_dirs(output_dir):
+    return sorted(name for name in os.listdir(output_dir) if name.isdigit()) if os.path.isdir(output_dir) else []
+
+
+def text_path(output_dir, year):
+    return os.path.join(output_dir, str(year), TEXT_FILENAME)
+
+
+def read_records(output_dir, year):
+    """The pdf_text.jsonl records of a year, by paper_url (later lines win); {} if there are none."""
+    records = {}
+    try:
+        with open(text_path(output_dir, year), encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["paper_url"]] = record
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def append_records(output_dir, year, records):
+    if not records:
+        return
+    os.makedirs(os.path.join(output_dir, str(year)), exist_ok=True)
+    with open(text_path(output_dir, year), "a", encoding="utf-8") as f:
+        f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+
+
+def read_texts(output_dir, year):
+    """{paper_url: extracted text} for a year, resolving records that share another paper's PDF."""
+    records = read_records(output_dir, year)
+    by_sha = {record["sha256"]: record for record in records.values() if "text" in record}
+    texts = {}
+    for url, record in records.items():
+        source = record if "text" in record else by_sha.get(record["sha256"])
+        if source is None:
+            source = _find_sha(output_dir, record["sha256"])
+        if source and source.get("text"):
+            texts[url] = source["text"]
+    return texts
+
+
+def _find_sha(output_dir, sha256):
+    for year in year_dirs(output_dir):
+        for record in read_records(output_dir, year).values():
+            if record["sha256"] == sha256 and "text" in record:
+                return record
+    return None
+
+
+class TextExtractor:
+    """Extracts text from PDF bytes in worker processes and records the results per year.
+
+    Created once per run; submit() is called from the download threads and
+    blocks while QUEUED_PER_WORKER PDFs per worker are already waiting.
+    """
+
+    def __init__(self, output_dir, workers=None, max_chars=MAX_TEXT_CHARS):
+        _require_pypdf()
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.max_chars = max_chars
+        # spawn, not fork: the parent already runs GUI and worker threads.
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        # Start the workers and import pypdf in them now, while the crawl is still fetching its first pages.
+        for _ in range(self.workers):
+            self.executor.submit(_require_pypdf)
+        self.slots = threading.BoundedSemaphore(self.workers * QUEUED_PER_WORKER)
+        self.lock = threading.Lock()
+        self.papers = set()       # paper_urls with a record (or an extraction in flight)
+        self.hashes = {}          # sha256 -> paper_url of the record holding its text
+        for year in year_dirs(output_dir):
+            for url, record in read_records(output_dir, year).items():
+                self.papers.add(url)
+                if "text" in record:
+                    self.hashes.setdefault(record["sha256"], url)
+        self.counts = {"extracted": 0, "failed": 0, "skipped": 0, "pages": 0, "pages_read": 0, "cpu": 0.0}
+        self.first_submit = self.last_done = None
+
+    def submit(self, year, paper_url, sha256, data, wait=True):
+        """Queues a stored PDF's bytes for extraction, unless the paper or its content is already done.
+
+        Returns the extraction's future, or None if there was nothing to do.
+        With wait=False it does not wait for a free slot; the caller bounds
+        the PDFs in flight instead (the asyncio engine awaits the future).
+        """
+        with self.lock:
+            if paper_url in self.papers:
+                return None
+            self.papers.add(paper_url)
+            first = self.hashes.get(sha256)
+            if first is not None:
+                self.counts["skipped"] += 1
+                append_records(self.output_dir, year, [{"paper_url": paper_url, "sha256": sha256, "same_as": first}])
+                return None
+            self.hashes[sha256] = paper_url
+            if self.first_submit is None:
+                self.first_submit = time.monotonic()
+        if wait:
+            self.slots.acquire()
+        try:
+            future = self.executor.submit(extract_text, data, self.max_chars)
+        except RuntimeError:     # Shut down under us: the run is ending.
+            self._forget(paper_url, sha256, wait)
+            return None
+        size = len(data)
+        future.add_done_callback(lambda done: self._finish(done, year, paper_url, sha256, size, wait))
+        return future
+
+    def _forget(self, paper_url, sha256, slot):
+        if slot:
+            self.slots.release()
+        with self.lock:
+            self.papers.discard(paper_url)
+            self.hashes.pop(sha256, None)
+
+    def _finish(self, done, year, paper_url, sha256, size, slot):
+        if done.cancelled():
+            self._forget(paper_url, sha256, slot)
+            return
+        if slot:
+            self.slots.release()
+        error = done.exception()
+        if error:
+            pages, pages_read, text, truncated, message, cpu = 0, 0, "", False, str(error), 0.0
+        else:
+            pages, pages_read, text, truncated, message, cpu = done.result()
+        metrics = get_metrics()
+        metrics.observe("extract_text", cpu, size)
+        metrics.count("pdf_pages", str(year), pages_read)
+        if message:
+            metrics.count("errors", "extract_text")
+        with self.lock:
+            self.counts["failed" if message else "extracted"] += 1
+            self.counts["pages"] += pages
+            self.counts["pages_read"] += pages_read
+            self.counts["cpu"] += cpu
+            self.last_done = time.monotonic()
+            append_records(self.output_dir, year, [{
+                "paper_url": paper_url, "sha256": sha256, "pages": pages, "pages_read": pages_read,
+                "chars": len(text), "truncated": truncated, "text": text, "error": message}])
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts, workers=self.workers)
+            wall = (self.last_done - self.first_submit) if self.last_done and self.first_submit else 0.0
+        stats["pages_per_core_second"] = stats["pages_read"] / stats["cpu"] if stats["cpu"] else 0.0
+        stats["pages_per_second"] = stats["pages_read"] / wall if wall else 0.0
+        return stats
+
+    def shutdown(self, cancel=False):
+        """Waits for the queued PDFs (or, with cancel, only the running ones); cancelled ones get no record."""
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+
+
+def format_stats(stats):
+    return (f"{stats['extracted']} PDFs, {stats['pages']} pages ({stats['pages_read']} read), "
+            f"{stats['failed']} failed, {stats['skipped']} duplicates of extracted PDFs; "
+            f"{stats['pages_per_core_second']:.1f} pages/s per core, {stats['pages_per_second']:.1f} pages/s "
+            f"on {stats['workers']} workers")
+
+
+_extractor = None
+
+
+def configure_text_extractor(output_dir=None, workers=None, max_chars=MAX_TEXT_CHARS):
+    """Starts the process-wide extractor for a run, or stops it when output_dir is None."""
+    global _extractor
+    if _extractor is not None:
+        _extractor.shutdown()
+    _extractor = TextExtractor(output_dir, workers, max_chars) if output_dir else None
+    return _extractor
+
+
+def get_text_extractor():
+    return _extractor
+
+
+def build(output_dir, workers=None, max_chars=MAX_TEXT_CHARS, log=print):
+    """Extracts every stored PDF of output_dir that has no record yet, reading it from the blob store."""
+    extractor = TextExtractor(output_dir, workers, max_chars)
+    store = open_store(output_dir)
+    try:
+        for year in year_dirs(output_dir):
+            queued = 0
+            for entry in store.entries(year):
+                if entry["paper_url"] in extractor.papers:
+                    continue
+                with open(store.blob_path(entry["sha256"]), "rb") as f:
+                    extractor.submit(year, entry["paper_url"], entry["sha256"], f.read())
+                queued += 1
+            log(f"Year {year}: {queued} PDFs queued")
+    finally:
+        extractor.shutdown()
+    log(f"PDF text: {format_stats(extractor.stats())}")
+    return extractor.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract text from the PDFs already in an output directory.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Extract every stored PDF without a pdf_text.jsonl record")
+    build_parser.add_argument("--output-dir", default=os.getcwd())
+    build_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    build_parser.add_argument("--max-chars", type=int, default=MAX_TEXT_CHARS)
+    args = parser.parse_args(argv)
+    build(args.output_dir, args.workers, args.max_chars)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,11 @@ import requests
 from bs4 import BeautifulSoup
 from concurrent.futures import ThreadPoolExecutor
 import time
+import threading
+
+from transport import configure_transport, format_stats
+from pdf_download import download_file, DownloadError
+from pdf_store import open_store
 
 # Constants
 THREAD_COUNT = 50  # Number of concurrent threads
@@ -11,13 +16,15 @@ TIMEOUT = 60       # Timeout in seconds
 BASE_URL = "https://papers.nips.cc"
 OUTPUT_DIR = "E:/programing/Data Science/scrapping python/output"
 YEAR = 0 
+NEVER_STOP = threading.Event()
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+transport = configure_transport(pool_size=THREAD_COUNT)  # Shared keep-alive connections for all threads
 
 def fetch_page(url):
     """Fetches a web page with retries."""
     for attempt in range(MAX_RETRIES):
         try:
-            response = requests.get(url, timeout=TIMEOUT)
+            response = transport.get(url, TIMEOUT)
             response.raise_for_status()
             return response.text
         except requests.RequestException as e:
@@ -66,21 +73,21 @@ def process_paper(paper_url):
     if pdf_link:
         pdf_url = BASE_URL + pdf_link["href"]
         print(f"Downloading PDF: {pdf_url}")
-        download_pdf(pdf_url, paper_title)
+        download_pdf(pdf_url, paper_title, paper_url)
 
-def download_pdf(pdf_url, file_name):
-    """Downloads a PDF file."""
-    os.makedirs(f"{OUTPUT_DIR}/{YEAR}", exist_ok=True)
-    file_path = os.path.join(f"{OUTPUT_DIR}/{YEAR}", file_name + ".pdf")
+def download_pdf(pdf_url, file_name, paper_url):
+    """Downloads a PDF into the content-addressed store under OUTPUT_DIR."""
+    store = open_store(OUTPUT_DIR)
+    if store.lookup(YEAR, paper_url):
+        print(f"Already have PDF: {pdf_url}")
+        return
+    staged = store.staging_path(pdf_url)
     try:
-        response = requests.get(pdf_url, timeout=TIMEOUT, stream=True)
-        response.raise_for_status()
-        
-        with open(file_path, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
+        # Written to a .part file, checked and renamed; a rerun resumes a partial file.
+        _, sha256 = download_file(transport, pdf_url, staged, TIMEOUT, NEVER_STOP)
+        file_path = store.add(YEAR, paper_url, staged, sha256, file_name)
         print(f"Saved PDF: {file_path}")
-    except requests.RequestException as e:
+    except (requests.RequestException, DownloadError) as e:
         with open("failed.txt", "a") as file:
             file.write(f"failed downloading {pdf_url}\n")
         print(f"Failed to download PDF {pdf_url}: {e}")
@@ -91,3 +98,4 @@ def sanitize_filename(filename):
 
 if __name__ == "__main__":
     process_year_links()
+    print(f"Connections: {format_stats(transport.snapshot())}")
@@ -1,13 +1,17 @@
 import os
-import csv
-import requests
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor
-import time
-import tkinter as tk
-from tkinter import ttk, scrolledtext, filedialog, messagebox
+import sys
 import threading
-import queue
+import itertools
+
+try:
+    import tkinter as tk
+    from tkinter import ttk, scrolledtext, filedialog, messagebox
+except ImportError:
+    tk = None
+
+from crawler import (run_crawl, message_level, main as run_headless, EXTRACTORS, DEFAULT_EXTRACTOR,
+                     SINK_FORMATS, DEFAULT_FORMAT, POOL_SIZE, MAX_CACHE_MB)
+from ui_events import UiEventBus, RowWindow, format_summary, FRAME_MS, LOG_LINES, VISIBLE_ROWS
 
 class ScraperGUI:
     def __init__(self, master):
@@ -23,16 +27,13 @@ class ScraperGUI:
         style.configure('TButton', background='#cceeff', font=('Helvetica', 10, 'bold'))
         style.configure('TEntry', fieldbackground='#ffffff')
         
-        # Counters for downloads
-        self.total_downloads = 0
-        self.yearly_downloads = {}
-        
+        # Workers post to the bus; the UI thread draws what arrived once per frame.
+        self.events = UiEventBus()
+        self.table_rows = RowWindow(VISIBLE_ROWS)
+
         self.create_widgets()
         self.stop_event = None
-        self.log_queue = queue.Queue()
         self.scraping_thread = None
-        self.metadata_queue = None
-        self.stop_metadata_writer = None
 
     def create_widgets(self):
         # Create a main frame that splits into two columns (left for inputs/logs, right for table)
@@ -86,6 +87,65 @@ class ScraperGUI:
         self.thread_count = ttk.Entry(self.left_frame)
         self.thread_count.grid(row=row, column=1, sticky=tk.W)
         self.thread_count.insert(0, "50")
+        self.adaptive = tk.BooleanVar(value=True)
+        ttk.Checkbutton(self.left_frame, text="Adaptive (thread count is the ceiling)",
+                        variable=self.adaptive).grid(row=row, column=2, sticky=tk.W)
+        row += 1
+
+        ttk.Label(self.left_frame, text="Engine:").grid(row=row, column=0, sticky=tk.W)
+        self.engine = ttk.Combobox(self.left_frame, values=["Threads", "Asyncio"], state="readonly")
+        self.engine.current(0)
+        self.engine.grid(row=row, column=1, sticky=tk.W)
+        row += 1
+
+        ttk.Label(self.left_frame, text="PDF Concurrency:").grid(row=row, column=0, sticky=tk.W)
+        self.pdf_concurrency = ttk.Entry(self.left_frame)
+        self.pdf_concurrency.grid(row=row, column=1, sticky=tk.W)
+        self.pdf_concurrency.insert(0, "20")
+        row += 1
+
+        ttk.Label(self.left_frame, text="Pool Size (per host):").grid(row=row, column=0, sticky=tk.W)
+        self.pool_size = ttk.Entry(self.left_frame)
+        self.pool_size.grid(row=row, column=1, sticky=tk.W)
+        self.pool_size.insert(0, str(POOL_SIZE))
+        self.http2 = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.left_frame, text="HTTP/2", variable=self.http2).grid(row=row, column=2, sticky=tk.W)
+        row += 1
+
+        ttk.Label(self.left_frame, text="HTML Extractor:").grid(row=row, column=0, sticky=tk.W)
+        self.extractor = ttk.Combobox(self.left_frame, values=list(EXTRACTORS), state="readonly")
+        self.extractor.set(DEFAULT_EXTRACTOR)
+        self.extractor.grid(row=row, column=1, sticky=tk.W)
+        row += 1
+
+        ttk.Label(self.left_frame, text="Metadata Format:").grid(row=row, column=0, sticky=tk.W)
+        self.metadata_format = ttk.Combobox(self.left_frame, values=list(SINK_FORMATS), state="readonly")
+        self.metadata_format.set(DEFAULT_FORMAT)
+        self.metadata_format.grid(row=row, column=1, sticky=tk.W)
+        row += 1
+
+        ttk.Label(self.left_frame, text="Parse Workers:").grid(row=row, column=0, sticky=tk.W)
+        self.parse_workers = ttk.Entry(self.left_frame)
+        self.parse_workers.grid(row=row, column=1, sticky=tk.W)
+        self.parse_workers.insert(0, "0")
+        ttk.Label(self.left_frame, text="(0 = parse in I/O threads)").grid(row=row, column=2, sticky=tk.W)
+        row += 1
+
+        ttk.Label(self.left_frame, text="HTTP Cache:").grid(row=row, column=0, sticky=tk.W)
+        self.cache_mode = ttk.Combobox(self.left_frame, values=["Off", "Revalidate", "Replay"], state="readonly")
+        self.cache_mode.current(1)
+        self.cache_mode.grid(row=row, column=1, sticky=tk.W)
+        row += 1
+
+        ttk.Label(self.left_frame, text="Cache Size (MB):").grid(row=row, column=0, sticky=tk.W)
+        self.cache_size = ttk.Entry(self.left_frame)
+        self.cache_size.grid(row=row, column=1, sticky=tk.W)
+        self.cache_size.insert(0, str(MAX_CACHE_MB))
+        row += 1
+
+        self.incremental = tk.BooleanVar(value=True)
+        ttk.Checkbutton(self.left_frame, text="Incremental (skip papers finished by earlier runs)",
+                        variable=self.incremental).grid(row=row, column=0, columnspan=3, sticky=tk.W)
         row += 1
 
         ttk.Label(self.left_frame, text="Max Retries:").grid(row=row, column=0, sticky=tk.W)
@@ -123,7 +183,8 @@ class ScraperGUI:
         # --- Right Frame Widgets (Table) ---
         ttk.Label(self.right_frame, text="Downloaded Items", font=('Helvetica', 12, 'bold'),
                   background='#e6f7ff').grid(row=0, column=0, sticky=tk.W)
-        self.table = ttk.Treeview(self.right_frame, columns=("Year", "Type", "Name"), show="headings", height=20)
+        self.table = ttk.Treeview(self.right_frame, columns=("Year", "Type", "Name"), show="headings",
+                                  height=VISIBLE_ROWS)
         self.table.heading("Year", text="Year")
         self.table.heading("Type", text="Type")
         self.table.heading("Name", text="Name")
@@ -131,9 +192,11 @@ class ScraperGUI:
         self.table.column("Type", width=80, anchor="center")
         self.table.column("Name", width=200, anchor="w")
         self.table.grid(row=1, column=0, sticky="nsew")
-        scrollbar = ttk.Scrollbar(self.right_frame, orient="vertical", command=self.table.yview)
-        self.table.configure(yscroll=scrollbar.set)
-        scrollbar.grid(row=1, column=1, sticky="ns")
+        # The Treeview only ever holds one screenful; the scrollbar moves that window over all rows.
+        self.table_scrollbar = ttk.Scrollbar(self.right_frame, orient="vertical", command=self.scroll_table)
+        self.table_scrollbar.grid(row=1, column=1, sticky="ns")
+        for sequence in ["<MouseWheel>", "<Button-4>", "<Button-5>"]:
+            self.table.bind(sequence, self.wheel_table)
         self.right_frame.columnconfigure(0, weight=1)
         self.right_frame.rowconfigure(1, weight=1)
 
@@ -143,37 +206,79 @@ class ScraperGUI:
             self.output_dir.delete(0, tk.END)
             self.output_dir.insert(0, directory)
 
-    def log_message(self, message, tag=None):
-        self.log_area.insert(tk.END, message + "\n", tag)
+    def log_lines(self, lines, skipped=0):
+        """Appends lines in as few Text inserts as possible and trims the log to LOG_LINES."""
+        if skipped:
+            lines = [(f"... {skipped} log lines skipped ...", None)] + lines
+        for tag, group in itertools.groupby(lines, key=lambda line: line[1]):
+            self.log_area.insert(tk.END, "".join(message + "\n" for message, _ in group), tag)
+        excess = int(self.log_area.index("end-1c").split(".")[0]) - 1 - LOG_LINES
+        if excess > 0:
+            self.log_area.delete("1.0", f"{excess + 1}.0")
         self.log_area.see(tk.END)
 
-    def update_summary(self):
-        summary_text = f"Total Downloads: {self.total_downloads} | " + \
-                       " | ".join([f"{year}: {count}" for year, count in sorted(self.yearly_downloads.items())])
-        self.master.after(0, lambda: self.summary_label.config(text=summary_text))
-
-    def update_download_count(self, year):
-        self.total_downloads += 1
-        self.yearly_downloads[year] = self.yearly_downloads.get(year, 0) + 1
-        self.update_summary()
-
-    def add_table_entry(self, year, file_type, name):
-        # Use after() to safely update the Treeview from worker threads
-        self.master.after(0, lambda: self.table.insert("", "end", values=(year, file_type, name)))
+    def render_table(self):
+        """Shows the rows in the table window, reusing the Treeview's items."""
+        items = self.table.get_children()
+        view = self.table_rows.view()
+        for index, values in enumerate(view):
+            if index < len(items):
+                self.table.item(items[index], values=values)
+            else:
+                self.table.insert("", "end", values=values)
+        if len(items) > len(view):
+            self.table.delete(*items[len(view):])
+        self.table_scrollbar.set(*self.table_rows.fractions())
+
+    def scroll_table(self, *args):
+        self.table_rows.scrollbar_command(*args)
+        self.render_table()
+
+    def wheel_table(self, event):
+        # <MouseWheel> carries a delta (Windows, macOS); X11 sends buttons 4 and 5 instead.
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.scroll_table("scroll", -1 if up else 1, "units")
+        return "break"
+
+    def draw_frame(self):
+        """Applies everything the workers reported since the last frame."""
+        lines, skipped, rows, totals = self.events.drain()
+        if lines or skipped:
+            self.log_lines(lines, skipped)
+        if rows:
+            self.table_rows.extend(rows)
+            self.render_table()
+        if totals:
+            self.summary_label.config(text=format_summary(*totals))
 
     def start_scraping(self):
         params = {
             "base_url": self.base_url.get(),
             "output_dir": self.output_dir.get(),
             "thread_count": self.thread_count.get(),
+            "adaptive": self.adaptive.get(),
             "max_retries": self.max_retries.get(),
             "timeout": self.timeout.get(),
             "start_year": self.start_year.get(),
             "end_year": self.end_year.get(),
-            "scrape_type": self.scrape_type.get()
+            "scrape_type": self.scrape_type.get(),
+            "engine": self.engine.get(),
+            "pdf_concurrency": self.pdf_concurrency.get(),
+            "pool_size": self.pool_size.get(),
+            "http2": self.http2.get(),
+            "incremental": self.incremental.get(),
+            "cache_mode": self.cache_mode.get().lower(),
+            "cache_size": self.cache_size.get(),
+            "extractor": self.extractor.get(),
+            "parse_workers": self.parse_workers.get(),
+            "metadata_format": self.metadata_format.get()
         }
         try:
             params["thread_count"] = int(params["thread_count"])
+            params["pdf_concurrency"] = int(params["pdf_concurrency"])
+            params["pool_size"] = int(params["pool_size"])
+            params["cache_size"] = int(params["cache_size"])
+            params["parse_workers"] = int(params["parse_workers"])
             params["max_retries"] = int(params["max_retries"])
             params["timeout"] = int(params["timeout"])
             params["start_year"] = int(params["start_year"]) if params["start_year"] else None
@@ -187,250 +292,50 @@ class ScraperGUI:
         self.start_btn.config(state=tk.DISABLED)
         self.stop_btn.config(state=tk.NORMAL)
         self.stop_event = threading.Event()
-        self.log_queue = queue.Queue()
-        self.metadata_queue = queue.Queue()
-        self.stop_metadata_writer = threading.Event()
 
         # Reset counters
-        self.total_downloads = 0
-        self.yearly_downloads = {}
-        self.update_summary()
-
-        update_count_callback = self.update_download_count
-        update_table_callback = self.add_table_entry
+        self.events.reset()
+        self.table_rows.clear()
+        self.render_table()
 
         self.scraping_thread = threading.Thread(
             target=self.run_scraping,
-            args=(params, update_count_callback, update_table_callback),
+            args=(params, self.events.update_count, self.events.update_table),
             daemon=True
         )
         self.scraping_thread.start()
-        self.master.after(100, self.check_log_queue)
+        self.master.after(FRAME_MS, self.run_frames)
 
     def stop_scraping(self):
         if self.stop_event:
             self.stop_event.set()
-        if self.stop_metadata_writer:
-            self.stop_metadata_writer.set()
         self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
 
-    def check_log_queue(self):
-        while True:
-            try:
-                msg, tag = self.log_queue.get_nowait()
-                self.log_message(msg, tag)
-            except queue.Empty:
-                break
+    def run_frames(self):
+        # Fixed-rate frames: the UI cost does not depend on how fast the workers report.
+        self.draw_frame()
         if self.scraping_thread.is_alive():
-            self.master.after(100, self.check_log_queue)
+            self.master.after(FRAME_MS, self.run_frames)
+        else:
+            self.draw_frame()
+            self.stop_scraping()
 
     def run_scraping(self, params, update_count, update_table):
         def log(msg):
-            tag = "success" if any(x in msg for x in ["Downloaded:", "Metadata saved:", "Collected metadata for:"]) else \
-                  "error" if "Failed" in msg or "Error:" in msg else None
-            self.log_queue.put((msg, tag))
-
-        def metadata_writer():
-            while not self.stop_metadata_writer.is_set() or not self.metadata_queue.empty():
-                try:
-                    metadata = self.metadata_queue.get(timeout=1)
-                    year = metadata['year']
-                    save_dir = os.path.join(params["output_dir"], str(year))
-                    os.makedirs(save_dir, exist_ok=True)
-                    csv_path = os.path.join(save_dir, "metadata.csv")
-                    file_exists = os.path.isfile(csv_path)
-                    try:
-                        with open(csv_path, "a", newline="", encoding="utf-8") as csvfile:
-                            writer = csv.DictWriter(csvfile, fieldnames=metadata.keys())
-                            if not file_exists:
-                                writer.writeheader()
-                            writer.writerow(metadata)
-                        log(f"Metadata saved: {metadata['title']}")
-                    except Exception as e:
-                        error_msg = f"Failed to save metadata for {metadata['title']}: {str(e)}"
-                        log(error_msg)
-                        failed_dir = os.path.join(params["output_dir"], "failed_metadata")
-                        os.makedirs(failed_dir, exist_ok=True)
-                        with open(os.path.join(failed_dir, "failed_metadata.txt"), "a", encoding="utf-8") as f:
-                            f.write(error_msg + "\n")
-                except queue.Empty:
-                    continue
-
-        writer_thread = threading.Thread(target=metadata_writer, daemon=True)
-        if params["scrape_type"] in ["Metadata", "Both"]:
-            writer_thread.start()
+            self.events.log(msg, message_level(msg))
 
         try:
-            process_year_links(
-                base_url=params["base_url"],
-                output_dir=params["output_dir"],
-                thread_count=params["thread_count"],
-                max_retries=params["max_retries"],
-                timeout=params["timeout"],
-                start_year=params["start_year"],
-                end_year=params["end_year"],
-                scrape_type=params["scrape_type"],
-                stop_event=self.stop_event,
-                log=log,
-                metadata_queue=self.metadata_queue,
-                update_count=update_count,
-                update_table=update_table
-            )
-            log("Scraping completed successfully!")
+            run_crawl(params, self.stop_event, log, update_count, update_table)
         except Exception as e:
             log(f"Error: {str(e)}")
-        finally:
-            self.stop_metadata_writer.set()
-            self.stop_scraping()
-
-def process_year_links(base_url, output_dir, thread_count, max_retries, timeout, start_year, end_year,
-                         scrape_type, stop_event, log, metadata_queue, update_count, update_table):
-    log("Fetching main page...")
-    main_page_html = fetch_page(base_url, max_retries, timeout, stop_event, log)
-    if not main_page_html:
-        return
-
-    soup = BeautifulSoup(main_page_html, "html.parser")
-    year_links = soup.select("a[href^='/paper_files/paper/']")
-
-    for link in year_links:
-        if stop_event.is_set():
-            log("Process stopped by user")
-            return
-        year_url = base_url + link["href"]
-        year = year_url.split("/")[-1]
-        if not year.isdigit():
-            continue
-        year_int = int(year)
-        if (start_year and year_int < start_year) or (end_year and year_int > end_year):
-            log(f"Skipping year {year}")
-            continue
-
-        log(f"\nProcessing year: {year}")
-        process_paper_links(year_url, year, base_url, output_dir, thread_count, max_retries,
-                            timeout, scrape_type, stop_event, log, metadata_queue, update_count, update_table)
-
-def process_paper_links(year_url, year, base_url, output_dir, thread_count, max_retries, timeout,
-                        scrape_type, stop_event, log, metadata_queue, update_count, update_table):
-    log(f"Fetching year page: {year_url}")
-    year_page_html = fetch_page(year_url, max_retries, timeout, stop_event, log)
-    if not year_page_html:
-        return
-
-    soup = BeautifulSoup(year_page_html, "html.parser")
-    paper_links = [base_url + a["href"] for a in soup.select("body > div.container-fluid > div > ul li a")]
-
-    with ThreadPoolExecutor(max_workers=thread_count) as executor:
-        futures = []
-        for url in paper_links:
-            futures.append(executor.submit(
-                process_paper,
-                url, year, base_url, output_dir,
-                max_retries, timeout, scrape_type,
-                stop_event, log, metadata_queue, update_count, update_table
-            ))
-        for future in futures:
-            future.result()
-
-def process_paper(paper_url, year, base_url, output_dir, max_retries, timeout,
-                  scrape_type, stop_event, log, metadata_queue, update_count, update_table):
-    if stop_event.is_set():
-        return
-
-    log(f"Processing paper: {paper_url}")
-    paper_html = fetch_page(paper_url, max_retries, timeout, stop_event, log)
-    if not paper_html:
-        return
-
-    soup = BeautifulSoup(paper_html, "html.parser")
-
-    try:
-        title = soup.find('h4').get_text(strip=True)
-    except AttributeError:
-        title = "Untitled"
-    
-    # New logic for authors: find h4 containing "Authors" and then get its next sibling's text.
-    authors_element = soup.find("h4", string=lambda t: t and "Authors" in t)
-    if authors_element:
-        authors_sibling = authors_element.find_next_sibling()
-        authors = authors_sibling.get_text(strip=True) if authors_sibling else "Unknown"
-    else:
-        authors = "Unknown"
-
-    # New logic for abstract: find h4 containing "Abstract" and then get its next sibling's text.
-    abstract_element = soup.find("h4", string=lambda t: t and "Abstract" in t)
-    if abstract_element:
-        abstract_sibling = abstract_element.find_next_sibling()
-        abstractText = abstract_sibling.get_text(strip=True) if abstract_sibling else "No abstract available"
-    else:
-        abstractText = "No abstract available"
-
-    pdf_link = soup.find('a', string='Paper')
-    pdf_url = base_url + pdf_link['href'] if pdf_link else None
-
-    if scrape_type in ["PDFs", "Both"] and pdf_url:
-        sanitized_title = sanitize_filename(title)
-        download_pdf(pdf_url, sanitized_title, year, output_dir, timeout, stop_event, log, update_count, update_table)
-
-    if scrape_type in ["Metadata", "Both"]:
-        metadata = {
-            "title": title,
-            "authors": authors,
-            "abstract": abstractText,
-            "pdf_url": pdf_url or "",
-            "paper_url": paper_url,
-            "year": year
-        }
-        metadata_queue.put(metadata)
-        log(f"Collected metadata for: {title}")
-        update_table(year, "Metadata", title)
-
-def download_pdf(url, filename, year, output_dir, timeout, stop_event, log, update_count, update_table):
-    if stop_event.is_set():
-        return
-    save_dir = os.path.join(output_dir, str(year))
-    os.makedirs(save_dir, exist_ok=True)
-    path = os.path.join(save_dir, f"{filename}.pdf")
-
-    try:
-        response = requests.get(url, stream=True, timeout=timeout)
-        response.raise_for_status()
-        with open(path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if stop_event.is_set():
-                    log(f"Stopped downloading: {filename}")
-                    return
-                f.write(chunk)
-        log(f"Downloaded: {filename}")
-        update_count(year)
-        update_table(year, "PDF", filename)
-    except Exception as e:
-        error_msg = f"Failed to download {url}: {str(e)}"
-        log(error_msg)
-        failed_dir = os.path.join(output_dir, "failed_pdfs")
-        os.makedirs(failed_dir, exist_ok=True)
-        with open(os.path.join(failed_dir, "failed_pdfs.txt"), "a", encoding="utf-8") as f:
-            f.write(error_msg + "\n")
-
-def fetch_page(url, max_retries, timeout, stop_event, log):
-    for attempt in range(max_retries):
-        if stop_event.is_set():
-            return None
-        try:
-            response = requests.get(url, timeout=timeout)
-            response.raise_for_status()
-            return response.text
-        except requests.RequestException as e:
-            log(f"Attempt {attempt+1} failed for {url}: {str(e)}")
-            time.sleep(2)
-    log(f"Max retries reached for {url}")
-    return None
-
-def sanitize_filename(filename):
-    return "".join(c for c in filename if c.isalnum() or c in (" ", "-", "_")).strip().replace(" ", "_")
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = ScraperGUI(root)
-    root.mainloop()
+    if "--headless" in sys.argv[1:]:
+        sys.exit(run_headless())
+    elif tk is None:
+        sys.exit("The GUI requires tkinter; use --headless (or crawler.py) on machines without it")
+    else:
+        root = tk.Tk()
+        app = ScraperGUI(root)
+        root.mainloop()
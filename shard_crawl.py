@@ -0,0 +1,496 @@
+"""Sharded crawling: one coordinator, many worker processes, a SQLite work queue in between.
+
+The coordinator lists the papers of the selected years into the queue. Each
+worker leases a batch of papers, crawls them into its own shard directory
+(<output>/shards/<worker>/, with its own crawl state, PDF store and metadata
+files) and marks each paper done once its results are durable there.
+Running workers keep renewing their leases; a lease that is not renewed in
+time, e.g. because its worker died, goes back to the queue, and papers
+that keep failing are given up after MAX_ATTEMPTS. Finally merge folds the
+shards into the normal output layout in the order the coordinator listed
+the papers, so the result does not depend on which worker crawled what.
+
+A queue is one crawl job: papers already in it are not queued again, so
+delete work_queue.sqlite3 (after merging) to start the next one.
+
+Workers on several machines need the output directory on a shared file
+system whose locking SQLite can rely on; otherwise run them as processes on
+one machine (the run command does exactly that).
+
+    python shard_crawl.py enqueue --output-dir OUTPUTS --start-year 2015 --end-year 2023
+    python shard_crawl.py worker --output-dir OUTPUTS --worker-id node1-a --scrape-type Both
+    python shard_crawl.py merge --output-dir OUTPUTS --metadata-format csv
+    python shard_crawl.py run --workers 4 --output-dir OUTPUTS --start-year 2020 --end-year 2021
+"""
+import os
+import re
+import sys
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from crawler import (crawl_session, log_run_summary, add_crawl_arguments, options_from_args, print_log,
+                     fetch_page, process_paper, stop_on_interrupt)
+from parsers import parse_year_links, parse_paper_links
+from crawl_state import open_state, STATE_FILENAME
+from metadata_sink import MetadataSink, read_rows
+from pdf_store import open_store, link_or_copy
+from paper_index import open_index
+from paper_identity import open_identity
+from pdf_text import read_records as read_text_records, append_records as append_text_records
+
+QUEUE_FILENAME = "work_queue.sqlite3"
+SHARDS_DIRNAME = "shards"
+LEASE_SECONDS = 600      # A worker that has not renewed its leases by then is presumed dead
+RENEWALS_PER_LEASE = 4   # A working worker renews its leases this often per lease period
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    url TEXT PRIMARY KEY,
+    year TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+"""
+
+
+def queue_path(output_dir):
+    return os.path.join(output_dir, QUEUE_FILENAME)
+
+
+def shard_dir(output_dir, worker_id):
+    return os.path.join(output_dir, SHARDS_DIRNAME, worker_id)
+
+
+def default_worker_id():
+    return re.sub(r"[^\w.-]", "_", f"{socket.gethostname()}-{os.getpid()}")
+
+
+class WorkQueue:
+    """Paper URLs with leases; safe to share between threads, processes and (given working locks) machines.
+
+    Tasks keep the order they were enqueued in (their rowid), which merge uses
+    to put rows and file names in a deterministic order.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit mode with explicit BEGIN IMMEDIATE, so a claim is atomic across processes.
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def _transaction(self, statements):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, year, urls):
+        """Adds papers; ones already queued (in any state) are left alone. Returns how many were new."""
+        now = time.time()
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO tasks (url, year, updated_at) VALUES (?, ?, ?)",
+                             [(url, str(year), now) for url in urls])
+            return conn.total_changes - before
+        return self._transaction(insert)
+
+    def claim(self, worker, count, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        """Leases up to count pending papers to worker.
+
+        Expired leases are re-queued first (or given up on, once out of
+        attempts). Returns ([(url, year)], number of expired leases).
+        """
+        now = time.time()
+
+        def lease(conn):
+            expired = conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL, error = 'lease expired', updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ?", (max_attempts, now, now)).rowcount
+            rows = conn.execute("SELECT url, year FROM tasks WHERE status = 'pending' ORDER BY rowid LIMIT ?",
+                                (count,)).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE url = ?",
+                [(worker, now + lease_seconds, now, row["url"]) for row in rows])
+            return [(row["url"], row["year"]) for row in rows], expired
+        return self._transaction(lease)
+
+    def renew(self, worker, lease_seconds=LEASE_SECONDS):
+        """Extends every lease worker holds; the heartbeat of a worker that is still making progress."""
+        now = time.time()
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE tasks SET lease_expires = ? WHERE worker = ? AND status = 'leased'",
+            (now + lease_seconds, worker)))
+
+    def complete(self, worker, urls):
+        """Marks papers done; a lease that already expired and went to another worker still counts."""
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE tasks SET status = 'done', worker = ?, error = NULL, updated_at = ? "
+            "WHERE url = ? AND status != 'done'",
+            [(worker, now, url) for url in urls]))
+
+    def fail(self, worker, failures, max_attempts=MAX_ATTEMPTS):
+        """Returns failed papers ({url: error}) to the queue, or gives up on those out of attempts."""
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "worker = NULL, error = ?, updated_at = ? WHERE url = ? AND worker = ? AND status = 'leased'",
+            [(max_attempts, error, now, url, worker) for url, error in failures.items()]))
+
+    def release(self, worker):
+        """Hands a stopping worker's leases straight back, without using up an attempt."""
+        now = time.time()
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE tasks SET status = 'pending', worker = NULL, attempts = attempts - 1, updated_at = ? "
+            "WHERE worker = ? AND status = 'leased'", (now, worker)))
+
+    def unfinished(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased')").fetchone()[0]
+
+    def order(self):
+        """{url: position} in enqueue order."""
+        with self._lock:
+            return {row[0]: row[1] for row in self._conn.execute("SELECT url, rowid FROM tasks")}
+
+    def status(self):
+        with self._lock:
+            by_status = dict(self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+            workers = self._conn.execute(
+                "SELECT worker, SUM(status = 'done'), SUM(status = 'leased') FROM tasks "
+                "WHERE worker IS NOT NULL GROUP BY worker ORDER BY worker").fetchall()
+        return by_status, [tuple(row) for row in workers]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def enqueue_years(options, log, stop_event=None):
+    """Coordinator: lists the selected years' papers into the queue.
+
+    With incremental options, papers the merged crawl state already has
+    complete are not queued again.
+    """
+    stop_event = stop_event or threading.Event()
+    output_dir = options["output_dir"]
+    os.makedirs(output_dir, exist_ok=True)
+    work = WorkQueue(queue_path(output_dir))
+    crawl_state = open_state(output_dir) if options["incremental"] else None
+    try:
+        # Scrape type "PDFs" only so that no metadata writer is started: the coordinator just lists papers.
+        with crawl_session({**options, "scrape_type": "PDFs"}, log):
+            main_page = fetch_page(options["base_url"], options["max_retries"], options["timeout"], stop_event, log)
+            if not main_page:
+                return 0
+            queued = 0
+            for year_url in parse_year_links(main_page, options["base_url"]):
+                year = year_url.split("/")[-1]
+                if not year.isdigit():
+                    continue
+                if (options["start_year"] and int(year) < options["start_year"]) or \
+                        (options["end_year"] and int(year) > options["end_year"]):
+                    continue
+                year_page = fetch_page(year_url, options["max_retries"], options["timeout"], stop_event, log)
+                if not year_page:
+                    continue
+                paper_links = parse_paper_links(year_page, options["base_url"])
+                if crawl_state:
+                    crawl_state.add_papers(year, paper_links)
+                    paper_links = crawl_state.incomplete_papers(year, options["scrape_type"])
+                added = work.enqueue(year, paper_links)
+                queued += added
+                log(f"Year {year}: queued {added} papers ({len(paper_links) - added} already in the queue)")
+            return queued
+    finally:
+        work.close()
+        if crawl_state:
+            crawl_state.close()
+
+
+def paper_outcome(row, scrape_type):
+    """Reads a shard's crawl state row: "done", "pending" (metadata not checkpointed yet) or an error message."""
+    if row is None or row["status"] != "fetched":
+        return (row and row["error"]) or "paper page not fetched"
+    if scrape_type in ["PDFs", "Both"] and row["has_pdf"] and not row["pdf_sha256"]:
+        return "PDF download failed"
+    if scrape_type in ["Metadata", "Both"] and not row["metadata_saved"]:
+        return "pending"
+    return "done"
+
+
+def run_worker(options, worker_id, stop_event, log, lease_seconds=LEASE_SECONDS, batch_size=None):
+    """Worker: leases papers and crawls them into its shard until the queue is drained or stop_event is set."""
+    output_dir = options["output_dir"]
+    shard_options = {**options, "output_dir": shard_dir(output_dir, worker_id), "engine": "threads",
+                     "search_index": False, "identity_index": False}
+    if options.get("metrics_file"):
+        root, extension = os.path.splitext(options["metrics_file"])
+        shard_options["metrics_file"] = f"{root}.{worker_id}{extension}"   # One file per worker
+    batch_size = batch_size or options["thread_count"] * 2
+    work = WorkQueue(queue_path(output_dir))
+    crawl_state = open_state(shard_options["output_dir"])
+    waiting = set()      # Papers crawled whose metadata the writer has not checkpointed yet
+    totals = {"done": 0, "failed": 0}
+    finished = threading.Event()
+
+    def heartbeat():
+        # Renews the leases for as long as this worker runs, however long a batch takes.
+        while not finished.wait(lease_seconds / RENEWALS_PER_LEASE):
+            try:
+                work.renew(worker_id, lease_seconds)
+            except sqlite3.Error as e:
+                log(f"Failed to renew leases: {str(e)}")
+
+    def settle(urls):
+        done, failures = [], {}
+        for url in urls:
+            outcome = paper_outcome(crawl_state.paper(url), options["scrape_type"])
+            if outcome == "done":
+                done.append(url)
+            elif outcome == "pending":
+                waiting.add(url)
+            else:
+                failures[url] = outcome
+        waiting.difference_update(done)
+        work.complete(worker_id, done)
+        work.fail(worker_id, failures)
+        totals["done"] += len(done)
+        totals["failed"] += len(failures)
+
+    renewer = threading.Thread(target=heartbeat, daemon=True)
+    renewer.start()
+    try:
+        with crawl_session(shard_options, log, crawl_state) as (metadata_queue, _):
+            def crawl(task):
+                url, year = task
+                try:
+                    process_paper(url, year, options["base_url"], shard_options["output_dir"],
+                                  options["max_retries"], options["timeout"], options["scrape_type"], stop_event,
+                                  log, metadata_queue, lambda year: None, lambda year, file_type, name: None,
+                                  crawl_state)
+                except Exception as e:
+                    log(f"Failed to process {url}: {str(e)}")
+                    crawl_state.record_failure(url, year, str(e))
+
+            with ThreadPoolExecutor(max_workers=options["thread_count"]) as executor:
+                while not stop_event.is_set():
+                    if waiting:
+                        settle(list(waiting))
+                    tasks, expired = work.claim(worker_id, batch_size, lease_seconds)
+                    if expired:
+                        log(f"Re-queued {expired} papers whose lease expired")
+                    if not tasks:
+                        if not waiting and not work.unfinished():
+                            break
+                        stop_event.wait(POLL_SECONDS)
+                        continue
+                    log(f"Worker {worker_id}: leased {len(tasks)} papers")
+                    list(executor.map(crawl, tasks))
+                    if not stop_event.is_set():
+                        settle([url for url, _ in tasks])
+        log_run_summary(shard_options, log)
+        # Leaving crawl_session drained the metadata writer, so every crawled paper is settled now.
+        if waiting and not stop_event.is_set():
+            settle(list(waiting))
+        log(f"Worker {worker_id}: {totals['done']} papers done, {totals['failed']} failed")
+    except KeyboardInterrupt:
+        stop_event.set()     # So the unfinished leases are released below
+        raise
+    finally:
+        finished.set()
+        renewer.join()
+        if stop_event.is_set():
+            work.release(worker_id)
+        work.close()
+        crawl_state.close()
+    return totals
+
+
+def merge_shards(output_dir, metadata_format, log, search_index=True, identity_index=True):
+    """Folds every shard into output_dir: metadata rows, PDFs (by name through the PDF store), PDF text and crawl state.
+
+    Papers are taken in queue order, the first shard (by name) holding a
+    paper wins, and papers already in the output are skipped, so merging is
+    deterministic and can be repeated. Merged rows go into output_dir's
+    search and identity indexes; the shards do not keep their own.
+    """
+    shards_root = os.path.join(output_dir, SHARDS_DIRNAME)
+    shards = sorted(name for name in os.listdir(shards_root)
+                    if os.path.isdir(os.path.join(shards_root, name))) if os.path.isdir(shards_root) else []
+    if not shards:
+        log("No shards to merge")
+        return
+    work = WorkQueue(queue_path(output_dir))
+    order = work.order()
+    work.close()
+
+    def position(url):
+        return order.get(url, len(order)), url
+
+    crawl_state = open_state(output_dir)
+    store = open_store(output_dir)
+    index = open_index(output_dir) if search_index else None
+    identity = open_identity(output_dir) if identity_index else None
+    states = [open_state(os.path.join(shards_root, shard)) for shard in shards
+              if os.path.exists(os.path.join(shards_root, shard, STATE_FILENAME))]
+    years = sorted({year for shard in shards for year in os.listdir(os.path.join(shards_root, shard))
+                    if year.isdigit()})
+    try:
+        for year in years:
+            rows, pdfs, texts = {}, {}, {}
+            for shard in shards:
+                shard_path = os.path.join(shards_root, shard)
+                for row in read_rows(shard_path, year, metadata_format):
+                    rows.setdefault(row["paper_url"], row)
+                for url, record in read_text_records(shard_path, year).items():
+                    texts.setdefault(url, record)
+                shard_store = open_store(shard_path)
+                for entry in shard_store.entries(year):
+                    pdfs.setdefault(entry["paper_url"], (shard_store, entry))
+
+            existing = {row["paper_url"] for row in read_rows(output_dir, year, metadata_format)}
+            new_rows = [rows[url] for url in sorted(rows, key=position) if url not in existing]
+            if new_rows:
+                sink = MetadataSink(output_dir, metadata_format)
+                for row in new_rows:
+                    sink.write(row)
+                sink.close()
+                if index is not None:
+                    index.add(new_rows)
+                if identity is not None:
+                    identity.add(new_rows)
+            extracted = read_text_records(output_dir, year)
+            append_text_records(output_dir, year, [texts[url] for url in sorted(texts, key=position)
+                                                   if url not in extracted])
+
+            for url in sorted(set(rows) | set(pdfs), key=position):
+                page = next((row for row in map(lambda state: state.paper(url), states)
+                             if row and row["status"] == "fetched"), None)
+                if page:
+                    crawl_state.record_paper_page(url, year, page["title"], page["has_pdf"])
+                if url in pdfs:
+                    shard_store, entry = pdfs[url]
+                    staged = store.staging_path(url)
+                    link_or_copy(shard_store.blob_path(entry["sha256"]), staged)
+                    path = store.add(year, url, staged, entry["sha256"], entry.get("requested", entry["name"]))
+                    crawl_state.record_pdf(url, path, os.path.getsize(path), entry["sha256"])
+                if url in rows:
+                    crawl_state.record_metadata(url)
+            log(f"Year {year}: merged {len(new_rows)} new metadata rows and {len(pdfs)} PDFs "
+                f"from {len(shards)} shards")
+    finally:
+        for state in states:
+            state.close()
+        crawl_state.close()
+        if index is not None:
+            index.flush()
+        if identity is not None:
+            identity.close()
+
+
+def _worker_process(options, worker_id):
+    def log(msg):
+        print_log(f"[{worker_id}] {msg.strip()}")
+    stop_event = threading.Event()
+    try:
+        with stop_on_interrupt(stop_event, log):
+            run_worker(options, worker_id, stop_event, log)
+    except KeyboardInterrupt:
+        log("Worker stopped")
+
+
+def run_local(options, workers, log):
+    """enqueue, then workers processes on this machine, then merge."""
+    enqueue_years(options, log)
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_worker_process, args=(options, f"local-{i}")) for i in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Ctrl-C reached the workers too: let them hand their leases back before leaving.
+        log("Waiting for the workers to release their leases (Ctrl-C again to abort)")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+        raise
+    merge_shards(options["output_dir"], options["metadata_format"], log, options["search_index"],
+                 options["identity_index"])
+
+
+def format_status(by_status, workers):
+    lines = ["  ".join(f"{status}: {count}" for status, count in sorted(by_status.items())) or "queue is empty"]
+    lines += [f"  {worker}: {done} done, {leased} leased" for worker, done, leased in workers]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in [("enqueue", "List the selected years' papers into the work queue"),
+                            ("worker", "Crawl papers from the work queue into this worker's shard"),
+                            ("merge", "Fold all shards into the output directory"),
+                            ("status", "Show the work queue"),
+                            ("run", "enqueue, run local worker processes, merge")]:
+        command = commands.add_parser(name, help=help_text)
+        add_crawl_arguments(command)
+        if name == "worker":
+            command.add_argument("--worker-id", default=default_worker_id())
+            command.add_argument("--lease-seconds", type=int, default=LEASE_SECONDS)
+        if name == "run":
+            command.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+    options = options_from_args(args)
+
+    if args.command == "enqueue":
+        print_log(f"Queued {enqueue_years(options, print_log)} papers")
+    elif args.command == "worker":
+        stop_event = threading.Event()
+        try:
+            with stop_on_interrupt(stop_event, print_log):
+                run_worker(options, args.worker_id, stop_event, print_log, args.lease_seconds)
+        except KeyboardInterrupt:
+            print_log("Worker stopped")
+    elif args.command == "merge":
+        merge_shards(options["output_dir"], options["metadata_format"], print_log, options["search_index"],
+                     options["identity_index"])
+    elif args.command == "status":
+        work = WorkQueue(queue_path(options["output_dir"]))
+        print_log(format_status(*work.status()))
+        work.close()
+    else:
+        run_local(options, args.workers, print_log)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import os
+import sys
+import argparse
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import site_simulator  # noqa: E402
+import fake_llm_server  # noqa: E402
+
+
+def serve(server):
+    """Runs an http.server in a daemon thread; returns its base URL."""
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.fixture
+def make_site():
+    """Starts NeurIPS site simulators: make_site("--pdf-kb", "512") returns (base_url, faults)."""
+    servers = []
+
+    def start(*flags):
+        parser = argparse.ArgumentParser()
+        site_simulator.add_simulator_arguments(parser)
+        server, faults = site_simulator.build_server(parser.parse_args(["--papers", "20", "--pdf-kb", "8", *flags]), 0)
+        servers.append(server)
+        return serve(server), faults
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def site(make_site):
+    """A local NeurIPS site simulator (one year of 20 small papers) on a free port: (base_url, faults)."""
+    return make_site()
+
+
+@pytest.fixture
+def llm():
+    """Starts fake LLM servers: llm(rpm=..., garble_rate=...) returns (url, quota)."""
+    servers = []
+
+    def start(rpm=6000, tpm=10_000_000, latency=0.0, garble_rate=0.0):
+        quota = fake_llm_server.Quota(rpm, tpm)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), fake_llm_server.make_handler(quota, latency, garble_rate))
+        servers.append(server)
+        return serve(server) + "/", quota
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,196 @@
+import os
+import csv
+import json
+
+import pytest
+
+import Annotator
+from Annotator import (ANNOTATION_LABELS, build_batch_prompt, parse_batch_reply, plan_batches, classify_batched,
+                       classify_papers)
+from annotation_engine import AnnotationEngine, HttpLLMClient, RateLimitError, BACKOFF_START
+
+
+def make_papers(count):
+    return [(f"Paper title {number}", f"An abstract about topic {number}. " * 5) for number in range(count)]
+
+
+@pytest.fixture
+def engines():
+    """Builds AnnotationEngines with generous rate limits and closes them after the test."""
+    created = []
+
+    def build(client, **options):
+        engine = AnnotationEngine(client, requests_per_minute=6000, tokens_per_minute=10_000_000,
+                                  log=lambda message: None, **options)
+        created.append(engine)
+        return engine
+
+    yield build
+    for engine in created:
+        engine.close()
+
+
+class FlakyClient:
+    """Answers like the fake LLM, after rejecting the first `rejections` calls for quota reasons."""
+
+    def __init__(self, rejections, retry_after=0.01):
+        self.rejections = rejections
+        self.retry_after = retry_after
+        self.calls = 0
+
+    def generate(self, prompt):
+        self.calls += 1
+        if self.calls <= self.rejections:
+            raise RateLimitError("quota exhausted", self.retry_after)
+        return ANNOTATION_LABELS[0]
+
+
+def test_parse_batch_reply_accepts_a_fenced_array_in_any_order():
+    reply = '```json\n[{"id": 2, "label": "Optimization"}, {"id": 1, "label": "Computer Vision"}]\n```'
+    assert parse_batch_reply(reply, 2) == ["Computer Vision", "Optimization"]
+
+
+@pytest.mark.parametrize("reply", [
+    "Sure! Here are the labels you asked for:",
+    '[{"id": 1, "label": "Computer Vision"}]',
+    '[{"id": 1, "label": "Computer Vision"}, {"id": 1, "label": "Optimization"}]',
+    '[{"id": 1, "label": "Computer Vision"}, {"id": 3, "label": "Optimization"}]',
+    '[{"id": 1, "label": "Computer Vision"}, {"id": 2, "label": "Biology"}]',
+    '[{"id": 1}, {"id": 2, "label": "Optimization"}]',
+])
+def test_parse_batch_reply_rejects_incomplete_replies(reply):
+    with pytest.raises(ValueError):
+        parse_batch_reply(reply, 2)
+
+
+def test_plan_batches_keeps_each_prompt_within_the_budget():
+    papers = make_papers(40)
+    batches = plan_batches(papers, 1000, max_batch_size=8)
+    assert [i for batch in batches for i in batch] == list(range(40))
+    assert all(len(batch) <= 8 for batch in batches)
+    for batch in batches:
+        prompt = build_batch_prompt([papers[i] for i in batch])
+        assert len(batch) == 1 or len(prompt) // 4 + Annotator.BATCH_REPLY_TOKENS * len(batch) <= 1000
+
+
+def test_batches_share_requests(llm, engines):
+    url, quota = llm()
+    engine = engines(HttpLLMClient(url))
+    labels = classify_batched(make_papers(30), engine, 100_000, max_batch_size=10)
+    assert all(label in ANNOTATION_LABELS for label in labels)
+    assert engine.stats()["requests"] == 3
+    assert quota.accepted == 3
+
+
+def test_garbled_batches_are_split_down_to_single_prompts(llm, engines):
+    url, quota = llm(garble_rate=1.0)
+    engine = engines(HttpLLMClient(url))
+    labels = classify_batched(make_papers(8), engine, 100_000)
+    assert all(label in ANNOTATION_LABELS for label in labels)
+    assert engine.stats()["requests"] == 1 + 2 + 4 + 8
+    assert quota.accepted == 15
+
+
+def test_batched_and_single_prompts_label_every_paper(llm, engines):
+    url, _ = llm()
+    papers = make_papers(12)
+    engine = engines(HttpLLMClient(url))
+    assert len(classify_papers(papers, engine)) == 12
+    assert len(classify_papers(papers, engine, batch_tokens=100_000)) == 12
+    assert engine.stats()["requests"] == 13
+
+
+def test_http_client_reports_quota_rejections(llm):
+    url, quota = llm(rpm=1)
+    client = HttpLLMClient(url)
+    assert client.generate(Annotator.build_prompt("Title", "Abstract")) in ANNOTATION_LABELS
+    with pytest.raises(RateLimitError) as error:
+        client.generate(Annotator.build_prompt("Title", "Abstract"))
+    assert 0 < error.value.retry_after <= 60
+    assert quota.rejected == 1
+
+
+def test_engine_retries_rate_limited_requests_and_slows_down(engines):
+    client = FlakyClient(rejections=2)
+    engine = engines(client)
+    assert engine.submit("prompt").result() == ANNOTATION_LABELS[0]
+    stats = engine.stats()
+    assert client.calls == 3
+    assert stats["rate_limited"] == 2
+    assert stats["requests"] == 3
+    assert stats["rate_scale"] < 1.0
+    assert engine.limiter.backoff == BACKOFF_START
+
+
+def test_papers_that_stay_rate_limited_are_labelled_exhausted(engines):
+    engine = engines(FlakyClient(rejections=100), max_retries=2)
+    assert classify_papers(make_papers(2), engine) == ["Unknown(API Exhausted)"] * 2
+    assert engine.stats()["requests"] == 4
+
+
+class CountingClient:
+    """Labels every paper "Optimization" and counts the papers it was asked about."""
+
+    def __init__(self):
+        self.papers = 0
+
+    def generate(self, prompt):
+        self.papers += 1
+        return "Optimization"
+
+
+class CrashingCache:
+    """A label cache that fails the chunk holding paper `number`, as if the process died while annotating it."""
+
+    def __init__(self, number):
+        self.title = make_papers(number + 1)[number][0]
+
+    def lookup(self, papers):
+        if any(title == self.title for title, _ in papers):
+            raise RuntimeError("killed mid-chunk")
+        return {}
+
+    def store(self, papers, labels):
+        pass
+
+
+def write_metadata_csv(path, count):
+    rows = [{"title": title, "authors": "A. Author", "abstract": abstract, "pdf_url": "",
+             "paper_url": f"http://example.org/{number}", "year": 2020}
+            for number, (title, abstract) in enumerate(make_papers(count))]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return [row["paper_url"] for row in rows]
+
+
+def test_interrupted_csv_annotation_resumes_after_the_last_checkpoint(tmp_path, engines):
+    path = str(tmp_path / "metadata.csv")
+    urls = write_metadata_csv(path, 50)
+    with pytest.raises(RuntimeError):
+        Annotator.annotate_metadata_csv(path, engines(CountingClient()), cache=CrashingCache(35), chunk_rows=10)
+    with open(path + ".annotating.ckpt", encoding="utf-8") as f:
+        assert json.load(f)["rows"] == 30
+
+    client = CountingClient()
+    Annotator.annotate_metadata_csv(path, engines(client), chunk_rows=10)
+    assert client.papers == 20
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["paper_url"] for row in rows] == urls
+    assert all(row["annotation"] == "Optimization" for row in rows)
+    assert sorted(os.listdir(tmp_path)) == ["metadata.csv"]
+
+
+def test_a_changed_source_file_restarts_the_annotation(tmp_path, engines):
+    path = str(tmp_path / "metadata.csv")
+    write_metadata_csv(path, 50)
+    with pytest.raises(RuntimeError):
+        Annotator.annotate_metadata_csv(path, engines(CountingClient()), cache=CrashingCache(35), chunk_rows=10)
+    urls = write_metadata_csv(path, 40)
+    client = CountingClient()
+    Annotator.annotate_metadata_csv(path, engines(client), chunk_rows=10)
+    assert client.papers == 40
+    with open(path, newline="", encoding="utf-8") as f:
+        assert [row["paper_url"] for row in csv.DictReader(f)] == urls
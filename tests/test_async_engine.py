@@ -0,0 +1,77 @@
+import time
+import queue
+import asyncio
+import threading
+
+import pytest
+import requests
+
+from crawl_state import open_state, CrawlState
+from parse_pool import AsyncParseBatcher
+from parsers import parse_paper_links
+from test_parse_pool import ThreadParsePool
+
+async_engine = pytest.importorskip("async_engine")
+aiohttp = pytest.importorskip("aiohttp")
+
+
+class SlowState(CrawlState):
+    """A crawl state whose writes stall like SQLite on a busy disk."""
+
+    def _execute(self, sql, args=()):
+        time.sleep(0.2)
+        super()._execute(sql, args)
+
+
+def paper_urls(base_url, count):
+    return parse_paper_links(requests.get(base_url + "/paper_files/paper/2020", timeout=10).text, base_url)[:count]
+
+
+def crawl_papers(base_url, links, state, batcher=None, tick=None):
+    """Runs process_paper_async for links the way process_year_async does; returns the logged lines."""
+    messages = []
+
+    async def main():
+        ticker = asyncio.create_task(tick()) if tick else None
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*(async_engine.guarded(async_engine.process_paper_async(
+                session, asyncio.Semaphore(8), asyncio.Semaphore(2), url, "2020", base_url, "", 2, 10,
+                "Metadata", threading.Event(), messages.append, queue.Queue(), None,
+                lambda *args: None, state, batcher), url, "2020", messages.append, state) for url in links))
+        if ticker:
+            ticker.cancel()
+
+    asyncio.run(asyncio.wait_for(main(), 30))
+    return messages
+
+
+def test_parse_errors_are_recorded_as_failures(site, tmp_path):
+    base_url, _ = site
+    links = paper_urls(base_url, 3)
+    state = open_state(str(tmp_path))
+    messages = crawl_papers(base_url, links, state, AsyncParseBatcher(ThreadParsePool(broken=True), base_url))
+    rows = [state.paper(url) for url in links]
+    state.close()
+    assert [row["status"] for row in rows] == ["failed"] * 3
+    assert all("process pool" in row["error"] for row in rows)
+    assert sum("Failed to process" in message for message in messages) == 3
+
+
+def test_crawl_state_writes_do_not_block_the_event_loop(site, tmp_path):
+    base_url, _ = site
+    links = paper_urls(base_url, 4)
+    state = SlowState(str(tmp_path / "state.sqlite3"))
+    gaps = []
+
+    async def tick():
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(0.01)
+            gaps.append(time.monotonic() - last)
+            last = time.monotonic()
+
+    crawl_papers(base_url, links, state, tick=tick)
+    recorded = [state.paper(url)["status"] for url in links]
+    state.close()
+    assert recorded == ["fetched"] * 4
+    assert gaps and max(gaps) < 0.15
@@ -0,0 +1,9 @@
+import crawler
+
+
+def test_command_line_defaults_match_the_gui_defaults():
+    options = crawler.options_from_args(crawler.build_parser().parse_args([]))
+    defaults = crawler.default_options()
+    assert options["engine"] == defaults["engine"].lower()
+    assert {key: value for key, value in options.items() if key != "engine"} == \
+        {key: value for key, value in defaults.items() if key != "engine"}
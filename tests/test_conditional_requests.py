@@ -0,0 +1,197 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import crawler
+from crawl_state import open_state
+from http_cache import HttpCache, configure_cache
+
+YEAR_PAGE = "<html><body><ul class='paper-list'></ul></body></html>"
+PAPER_PAGE = "<html><body><h4>A paper</h4></body></html>"
+
+
+def etag_for(body):
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:16] + '"'
+
+
+@pytest.fixture
+def validating_site():
+    """A server that answers If-None-Match with 304: (base_url, pages, seen), seen holding (path, status) pairs."""
+    pages = {"/paper_files/paper/2020": YEAR_PAGE, "/paper_files/paper/2020/hash/a-Abstract.html": PAPER_PAGE}
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = pages.get(self.path)
+            if body is None:
+                status = 404
+            elif self.headers.get("If-None-Match") == etag_for(body):
+                status = 304
+            else:
+                status = 200
+            seen.append((self.path, status))
+            self.send_response(status)
+            if body is not None:
+                self.send_header("ETag", etag_for(body))
+                self.send_header("Last-Modified", "Wed, 01 Jan 2020 00:00:00 GMT")
+            data = body.encode("utf-8") if status == 200 else b""
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", pages, seen
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def http_cache(tmp_path):
+    def configure(mode):
+        return configure_cache(str(tmp_path / "http_cache"), mode=mode)
+    yield configure
+    configure_cache(None, mode="off")
+
+
+def fetch(url, headers=None):
+    return crawler.fetch_response(url, 2, 10, threading.Event(), lambda message: None, headers)
+
+
+def test_state_sends_back_the_recorded_validators(tmp_path):
+    state = open_state(str(tmp_path))
+    assert state.conditional_headers("http://example.org/2020") == {}
+    state.record_page("http://example.org/2020", '"v1"', "Wed, 01 Jan 2020 00:00:00 GMT")
+    state.record_page("http://example.org/2020", '"v2"', None)
+    state.close()
+
+    state = open_state(str(tmp_path))
+    assert state.conditional_headers("http://example.org/2020") == {"If-None-Match": '"v2"'}
+    state.close()
+
+
+def test_state_remembers_which_papers_are_incomplete(tmp_path):
+    state = open_state(str(tmp_path))
+    urls = [f"http://example.org/paper/{number}" for number in range(3)]
+    state.add_papers(2020, urls)
+    state.add_papers(2020, urls)
+    state.record_paper_page(urls[0], 2020, "Done", has_pdf=False)
+    state.record_metadata(urls[0])
+    state.record_paper_page(urls[1], 2020, "Half done", has_pdf=True)
+    state.record_metadata(urls[1])
+    assert state.incomplete_papers(2020, "Metadata") == urls[2:]
+    assert state.incomplete_papers(2020, "PDFs") == urls[1:]
+    state.record_pdf(urls[1], "half.pdf", 10, "0" * 64)
+    assert state.incomplete_papers(2020, "Both") == urls[2:]
+    state.close()
+
+
+def test_fetch_response_returns_a_304_for_matching_validators(validating_site):
+    base_url, pages, _ = validating_site
+    url = base_url + "/paper_files/paper/2020"
+    assert fetch(url).text == YEAR_PAGE
+    response = fetch(url, {"If-None-Match": etag_for(YEAR_PAGE)})
+    assert response.status_code == 304
+
+    pages["/paper_files/paper/2020"] = YEAR_PAGE + "<!-- changed -->"
+    assert fetch(url, {"If-None-Match": etag_for(YEAR_PAGE)}).status_code == 200
+
+
+def test_unchanged_year_page_resumes_from_the_state(validating_site, tmp_path):
+    base_url, _, seen = validating_site
+    url = base_url + "/paper_files/paper/2020"
+    state = open_state(str(tmp_path))
+    messages = []
+
+    def run():
+        crawler.process_paper_links(url, 2020, base_url, str(tmp_path), 2, 2, 10, "Metadata",
+                                    threading.Event(), messages.append, None, None, None, state)
+
+    run()
+    assert state.conditional_headers(url)["If-None-Match"] == etag_for(YEAR_PAGE)
+    run()
+    state.close()
+    assert seen == [("/paper_files/paper/2020", 200), ("/paper_files/paper/2020", 304)]
+    assert f"Year page unchanged: {url}" in messages
+    assert messages[-1] == "Year 2020 is up to date"
+
+
+def test_cache_serves_the_stored_body_on_304(validating_site, http_cache):
+    base_url, _, seen = validating_site
+    url = base_url + "/paper_files/paper/2020/hash/a-Abstract.html"
+    cache = http_cache("revalidate")
+    assert fetch(url).text == PAPER_PAGE
+    response = fetch(url)
+    assert response.status_code == 200
+    assert response.text == PAPER_PAGE
+    assert response.from_cache
+    assert [status for _, status in seen] == [200, 304]
+    assert cache.stats() == {"hits": 0, "revalidated": 1, "misses": 1, "replay": False}
+
+
+def test_caller_validators_bypass_the_cache(validating_site, http_cache):
+    base_url, _, _ = validating_site
+    url = base_url + "/paper_files/paper/2020"
+    http_cache("revalidate")
+    fetch(url)
+    assert fetch(url, {"If-None-Match": etag_for(YEAR_PAGE)}).status_code == 304
+
+
+def test_replay_never_touches_the_network(validating_site, http_cache):
+    base_url, _, seen = validating_site
+    url = base_url + "/paper_files/paper/2020/hash/a-Abstract.html"
+    http_cache("revalidate")
+    fetch(url)
+    cache = http_cache("replay")
+    assert fetch(url).text == PAPER_PAGE
+    assert fetch(base_url + "/paper_files/paper/2021") is None
+    assert len(seen) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_a_body_evicted_during_revalidation_is_still_served(tmp_path):
+    cache = HttpCache(str(tmp_path), max_bytes=100)
+    cache.store("http://example.org/a", "a" * 60, '"a"')
+    entry = cache.lookup("http://example.org/a")
+    cache.store("http://example.org/b", "b" * 60, '"b"')
+    assert cache.lookup("http://example.org/a") is None
+    assert cache.hit(entry, revalidated=True).text == "a" * 60
+    cache.close()
+
+
+def test_eviction_races_never_break_lookups_or_hits(tmp_path):
+    cache = HttpCache(str(tmp_path), max_bytes=2000)
+    bodies = {f"http://example.org/{number}": f"page {number % 5} " * 40 for number in range(20)}
+    errors = []
+
+    def work(offset):
+        try:
+            for _ in range(30):
+                for url in list(bodies)[offset::4]:
+                    entry = cache.lookup(url)
+                    if entry:
+                        assert cache.hit(entry).text == bodies[url]
+                    else:
+                        cache.store(url, bodies[url])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert cache.total_bytes() <= 2000
+    for url, body in bodies.items():
+        entry = cache.lookup(url)
+        assert entry is None or entry["text"] == body
+    cache.close()
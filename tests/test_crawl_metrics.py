@@ -0,0 +1,60 @@
+import threading
+
+import crawl_metrics
+from crawl_metrics import Metrics, start_exporter
+
+
+class Clock:
+    """Stands in for the time module so tests decide how long a year took."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+def test_papers_per_second_is_measured_over_each_year(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(crawl_metrics, "time", clock)
+    metrics = Metrics()
+    with metrics.year_timer("2020"):
+        clock.now += 10
+        metrics.count("papers", "2020", 50)
+    with metrics.year_timer("2021"):
+        clock.now += 2
+        metrics.count("papers", "2021", 50)
+        clock.now += 3
+        assert metrics.snapshot()["papers_per_second"]["2021"] == 50 / 5
+    metrics.count("papers", "2019", 30)
+    clock.now += 15
+    rates = metrics.snapshot()["papers_per_second"]
+    assert rates == {"2020": 5.0, "2021": 10.0, "2019": 1.0}
+
+
+def test_exporter_survives_failed_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(crawl_metrics, "SAMPLE_INTERVAL", 0.01)
+    calls = []
+
+    def write_snapshot(path):
+        calls.append(path)
+        if len(calls) < 3:
+            raise PermissionError(13, "Permission denied")
+
+    monkeypatch.setattr(crawl_metrics, "write_snapshot", write_snapshot)
+    logged = []
+    stop_event = threading.Event()
+    thread = start_exporter(logged.append, stop_event, str(tmp_path / "metrics.json"), interval=0.01)
+    try:
+        for _ in range(500):
+            if len(calls) >= 4:
+                break
+            stop_event.wait(0.01)
+    finally:
+        stop_event.set()
+        thread.join(5)
+    assert len(calls) >= 4
+    assert len(logged) == 2 and all("Permission denied" in line for line in logged)
@@ -0,0 +1,200 @@
+import time
+import asyncio
+import threading
+from email.utils import formatdate
+
+import pytest
+
+import host_scheduler
+from host_scheduler import (AdaptiveLimiter, HostScheduler, backoff_delay, outcome_for, retry_after_seconds,
+                            OK, NEUTRAL, ERROR, OVERLOAD, INITIAL_LIMIT, MIN_LIMIT, MAX_RETRY_AFTER)
+
+
+class Clock:
+    """Stands in for the time module so tests decide when a round trip has passed."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(host_scheduler, "time", clock)
+    return clock
+
+
+def respond(limiter, outcome, latency=0.1, retry_after=None):
+    assert limiter.acquire()
+    limiter.release(outcome, latency, retry_after)
+
+
+def test_slow_start_adds_one_per_response(clock):
+    limiter = AdaptiveLimiter("host pages", 32)
+    for _ in range(INITIAL_LIMIT):
+        respond(limiter, OK)
+    assert limiter.limit == INITIAL_LIMIT * 2
+    for _ in range(100):
+        respond(limiter, OK)
+    assert limiter.limit == 32
+
+
+def test_errors_halve_the_limit_then_it_grows_by_one_per_round_trip(clock):
+    limiter = AdaptiveLimiter("host pages", 32, initial=16)
+    respond(limiter, ERROR)
+    assert limiter.limit == 8
+    assert not limiter.slow_start
+    for _ in range(8):
+        respond(limiter, OK)
+    assert 8.9 < limiter.limit < 9.0
+
+
+@pytest.mark.parametrize("outcome", [ERROR, OVERLOAD])
+def test_decrease_happens_once_per_round_trip(clock, outcome):
+    limiter = AdaptiveLimiter("host pages", 32, initial=16)
+    respond(limiter, OK, latency=0.5)
+    for _ in range(3):
+        respond(limiter, outcome)
+    assert limiter.limit == pytest.approx(17 / 2)
+    clock.advance(0.6)
+    respond(limiter, outcome)
+    assert limiter.limit == pytest.approx(17 / 4)
+
+
+def test_limit_never_drops_below_the_minimum(clock):
+    limiter = AdaptiveLimiter("host pages", 32)
+    for _ in range(10):
+        clock.advance(2)
+        respond(limiter, ERROR)
+    assert limiter.limit == MIN_LIMIT
+
+
+def test_neutral_answers_leave_the_limit_alone(clock):
+    limiter = AdaptiveLimiter("host pages", 32)
+    respond(limiter, NEUTRAL)
+    assert limiter.limit == INITIAL_LIMIT
+    assert limiter.snapshot()[NEUTRAL] == 1
+
+
+def test_rising_latency_cuts_pages_but_not_pdfs(clock):
+    pages = AdaptiveLimiter("host pages", 32, initial=10)
+    pdfs = AdaptiveLimiter("host pdfs", 32, initial=10, use_latency=False)
+    for limiter in (pages, pdfs):
+        respond(limiter, OK, latency=0.1)
+        clock.advance(2)
+        respond(limiter, OK, latency=2.0)
+    assert pages.limit == pytest.approx(11 * host_scheduler.LATENCY_DECREASE)
+    assert pdfs.limit == 12
+
+
+def test_jitter_on_fast_hosts_is_not_congestion(clock):
+    limiter = AdaptiveLimiter("host pages", 32, initial=10)
+    respond(limiter, OK, latency=0.001)
+    respond(limiter, OK, latency=0.02)
+    assert limiter.limit == 12
+
+
+def test_non_adaptive_limiter_stays_at_its_ceiling(clock):
+    limiter = AdaptiveLimiter("host pages", 6, adaptive=False)
+    respond(limiter, ERROR)
+    respond(limiter, OK)
+    assert limiter.limit == 6
+
+
+def test_retry_after_pauses_the_host(clock):
+    limiter = AdaptiveLimiter("host pages", 32)
+    respond(limiter, OVERLOAD, retry_after=5)
+    assert limiter.snapshot()["paused"] == 5
+    assert limiter._wait_time() == 5
+    clock.advance(5)
+    assert limiter._wait_time() == 0
+    assert limiter.acquire()
+
+
+def test_stop_event_ends_a_wait_for_a_paused_host(clock):
+    limiter = AdaptiveLimiter("host pages", 32)
+    respond(limiter, OVERLOAD, retry_after=60)
+    stop_event = threading.Event()
+    stop_event.set()
+    assert not limiter.acquire(stop_event)
+    assert limiter.in_flight == 0
+
+
+def test_acquire_waits_for_a_free_slot():
+    limiter = AdaptiveLimiter("host pages", 1)
+    assert limiter.acquire()
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: limiter.acquire() and acquired.set())
+    waiter.start()
+    assert not acquired.wait(0.2)
+    limiter.release(OK, 0.01)
+    assert acquired.wait(5)
+    waiter.join()
+    assert limiter.in_flight == 1
+
+
+def test_acquire_async_shares_the_limit():
+    limiter = AdaptiveLimiter("host pages", 2, adaptive=False)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        assert await limiter.acquire_async()
+        peak = max(peak, limiter.in_flight)
+        await asyncio.sleep(0.01)
+        await limiter.release_async(OK, 0.01)
+
+    async def main():
+        await asyncio.gather(*(request() for _ in range(10)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert limiter.snapshot()[OK] == 10
+
+
+def test_scheduler_keeps_one_limiter_per_host_and_kind():
+    scheduler = HostScheduler(8, 2)
+    pages = scheduler.limiter("http://a.example/x", "pages")
+    assert scheduler.limiter("http://a.example/y", "pages") is pages
+    assert scheduler.limiter("http://b.example/x", "pages") is not pages
+    pdfs = scheduler.limiter("http://a.example/x.pdf", "pdfs")
+    assert (pages.maximum, pages.use_latency) == (8, True)
+    assert (pdfs.maximum, pdfs.use_latency) == (2, False)
+    assert len(scheduler.snapshot()) == 3
+
+
+@pytest.mark.parametrize("attempt", range(8))
+def test_backoff_is_jittered_below_the_exponential_bound(attempt):
+    bound = min(host_scheduler.BACKOFF_CAP, host_scheduler.BACKOFF_BASE * 2 ** attempt)
+    delays = [backoff_delay(attempt) for _ in range(200)]
+    assert all(0 <= delay <= bound for delay in delays)
+    assert max(delays) - min(delays) > bound / 4
+
+
+def test_backoff_respects_retry_after_and_the_cap():
+    assert all(backoff_delay(0, retry_after=7) >= 7 for _ in range(50))
+    assert all(backoff_delay(30, base=1, cap=3) <= 3 for _ in range(50))
+
+
+def test_outcomes_by_status():
+    assert [outcome_for(status) for status in (200, 304, 404, 429, 500, 503)] == \
+        [OK, OK, NEUTRAL, OVERLOAD, ERROR, OVERLOAD]
+
+
+def test_retry_after_parsing():
+    assert retry_after_seconds({"Retry-After": "12"}) == 12
+    assert retry_after_seconds({"Retry-After": "99999"}) == MAX_RETRY_AFTER
+    assert retry_after_seconds({"Retry-After": "soon"}) is None
+    assert retry_after_seconds({}) is None
+    assert retry_after_seconds(None) is None
+    seconds = retry_after_seconds({"Retry-After": formatdate(time.time() + 30, usegmt=True)})
+    assert 25 <= seconds <= 30
@@ -0,0 +1,135 @@
+import os
+import sys
+import subprocess
+import importlib.util
+
+import pytest
+
+import Annotator
+import metadata_store
+from metadata_sink import MetadataSink, read_rows, SINK_FORMATS, SPARE_SUFFIXES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+needs_pyarrow = pytest.mark.skipif(importlib.util.find_spec("pyarrow") is None, reason="Parquet needs pyarrow")
+FORMATS = ["csv", "jsonl", pytest.param("parquet", marks=needs_pyarrow)]
+
+# Writes three rows and checkpoints them, writes three more and dies in the middle of the next checkpoint.
+CRASH_SCRIPT = """
+import os, sys
+from metadata_sink import MetadataSink
+sink = MetadataSink(sys.argv[1], sys.argv[2], flush_rows=1)
+for number in range(6):
+    sink.write({"title": f"Paper {number}", "authors": "A. Author", "abstract": "Text " * 50,
+                "pdf_url": "", "paper_url": f"http://example.org/{number}", "year": 2020})
+    if number == 2:
+        sink.checkpoint()
+os.fsync = os.replace = lambda *args: os._exit(3)
+sink.checkpoint()
+"""
+
+
+def make_rows(count, start=0):
+    return [{"title": f"Paper {number}", "authors": "A. Author", "abstract": "Text",
+             "pdf_url": "", "paper_url": f"http://example.org/{number}", "year": 2020}
+            for number in range(start, start + count)]
+
+
+def urls(rows):
+    return [row["paper_url"] for row in rows]
+
+
+def every_reader(output_dir, fmt):
+    """The paper URLs each reader of a year's metadata file sees."""
+    seen = {"read_rows": urls(read_rows(output_dir, 2020, fmt))}
+    path = os.path.join(output_dir, "2020", SINK_FORMATS[fmt])
+    if fmt == "csv":
+        seen["read_csv_rows"] = urls(metadata_store.read_csv_rows(path))
+    if fmt in ("csv", "parquet"):
+        seen["read_annotated_rows"] = urls(Annotator.read_annotated_rows(output_dir, 2020))
+    if fmt == "parquet":
+        seen["load_metadata"] = metadata_store.load_metadata(output_dir, columns=["paper_url"]).column(0).to_pylist()
+    return seen
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_rows_round_trip_and_reopen_appends(tmp_path, fmt):
+    sink = MetadataSink(str(tmp_path), fmt)
+    for row in make_rows(5):
+        sink.write(row)
+    sink.close()
+    sink = MetadataSink(str(tmp_path), fmt)
+    for row in make_rows(3, start=5):
+        sink.write(row)
+    sink.close()
+    rows = read_rows(str(tmp_path), 2020, fmt)
+    assert urls(rows) == urls(make_rows(8))
+    assert rows[0]["title"] == "Paper 0"
+    assert sorted(os.listdir(tmp_path / "2020")) == [SINK_FORMATS[fmt]]
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_readers_only_see_checkpointed_rows_during_a_run(tmp_path, fmt):
+    committed = []
+    sink = MetadataSink(str(tmp_path), fmt, flush_rows=1, on_commit=committed.extend)
+    for row in make_rows(3):
+        sink.write(row)
+    sink.checkpoint()
+    for row in make_rows(2, start=3):
+        sink.write(row)
+    expected = urls(make_rows(3))
+    assert all(seen == expected for seen in every_reader(str(tmp_path), fmt).values())
+    assert urls(committed) == expected
+    sink.close()
+    assert urls(committed) == urls(make_rows(5))
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_the_published_file_is_left_alone_until_the_next_checkpoint_but_one(tmp_path, fmt):
+    sink = MetadataSink(str(tmp_path), fmt, flush_rows=1)
+    path = os.path.join(str(tmp_path), "2020", SINK_FORMATS[fmt])
+    for number in range(5):
+        sink.write(make_rows(1, start=number)[0])
+        sink.checkpoint()
+        with open(path, "rb") as f:
+            published = f.read()
+            sink.write(make_rows(1, start=number + 100)[0])
+            sink.checkpoint()
+            f.seek(0)
+            assert f.read() == published
+        assert len(read_rows(str(tmp_path), 2020, fmt)) == number * 2 + 2
+    sink.close()
+    assert len(read_rows(str(tmp_path), 2020, fmt)) == 10
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_a_crash_mid_checkpoint_leaves_the_last_checkpoint(tmp_path, fmt):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable, "-c", CRASH_SCRIPT, str(tmp_path), fmt], env=env, cwd=ROOT)
+    assert result.returncode == 3
+
+    expected = urls(make_rows(3))
+    seen = every_reader(str(tmp_path), fmt)
+    assert seen and all(value == expected for value in seen.values()), seen
+    if fmt == "csv":
+        assert all(row["authors"] == "A. Author" for row in metadata_store.read_csv_rows(
+            os.path.join(str(tmp_path), "2020", SINK_FORMATS[fmt])))
+
+    sink = MetadataSink(str(tmp_path), fmt)
+    for row in make_rows(3, start=3):
+        sink.write(row)
+    sink.close()
+    assert all(value == urls(make_rows(6)) for value in every_reader(str(tmp_path), fmt).values())
+    leftovers = [name for name in os.listdir(tmp_path / "2020") if name.endswith(SPARE_SUFFIXES + (".tmp",))]
+    assert leftovers == []
+
+
+def test_an_existing_csv_header_is_kept(tmp_path):
+    path = tmp_path / "2020" / "metadata.csv"
+    path.parent.mkdir()
+    path.write_text("title,authors,abstract,pdf_url,paper_url,year,annotation\r\n"
+                    "Old,B. Author,Text,,http://example.org/old,2020,Optimization\r\n", encoding="utf-8")
+    sink = MetadataSink(str(tmp_path), "csv")
+    sink.write(make_rows(1)[0])
+    sink.close()
+    rows = read_rows(str(tmp_path), 2020, "csv")
+    assert [row["annotation"] for row in rows] == ["Optimization", ""]
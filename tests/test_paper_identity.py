@@ -0,0 +1,113 @@
+from metadata_sink import MetadataSink
+from paper_identity import IdentityIndex, open_identity, build, author_id, normalize_title, IDENTITY_FILENAME
+
+ABSTRACT = ("We train very deep convolutional networks by letting each block learn a residual on top of its input. "
+            "The resulting models are easier to optimize, gain accuracy from depth and win the image classification "
+            "challenge with an ensemble of networks one hundred and fifty layers deep, with fewer parameters than "
+            "the plain networks they replace.")
+
+
+def make_row(number, title, authors="Kaiming He, Xiangyu Zhang", abstract=ABSTRACT, year=2020):
+    return {"title": title, "authors": authors, "abstract": abstract, "pdf_url": "", "year": year,
+            "paper_url": f"http://example.org/{year}/paper/{number}"}
+
+
+def test_titles_that_differ_in_case_and_punctuation_are_one_paper(tmp_path):
+    identity = open_identity(str(tmp_path))
+    first = make_row(1, "Deep Residual Learning: For Image Recognition.")
+    again = make_row(7, "deep residual learning for image recognition", abstract="Another abstract.", year=2021)
+    assert identity.add([first, again]) == {"new": 1, "title": 1, "near": 0, "repeated": 0, "updated": 0}
+    assert identity.paper(again["paper_url"])["canonical_url"] == first["paper_url"]
+    assert [paper["paper_url"] for paper in identity.cluster(again["paper_url"])] == \
+        [first["paper_url"], again["paper_url"]]
+    identity.close()
+
+
+def test_near_duplicates_are_found_across_years(tmp_path):
+    identity = open_identity(str(tmp_path))
+    first = make_row(1, "Deep Residual Learning for Image Recognition")
+    revised = make_row(2, "Deep Residual Learning for Image Recognition (Revised)", year=2021)
+    # About 0.78 of its shingles are shared with the first paper: similar, but under NEAR_DUPLICATE.
+    reworded = make_row(3, "Deep Residual Learning for Image Recognition, Extended",
+                        abstract=ABSTRACT.replace("fewer", "far fewer"))
+    other = make_row(4, "Attention Is All You Need", abstract="Attention replaces recurrence in translation models.")
+    assert identity.add([first, revised, reworded, other]) == \
+        {"new": 3, "title": 0, "near": 1, "repeated": 0, "updated": 0}
+    paper = identity.paper(revised["paper_url"])
+    assert paper["match"] == "near" and paper["canonical_url"] == first["paper_url"]
+    assert 0.8 <= paper["similarity"] < 1
+    assert identity.paper(reworded["paper_url"])["canonical_url"] == reworded["paper_url"]
+    assert identity.paper(other["paper_url"])["canonical_url"] == other["paper_url"]
+    [(canonical, duplicates)] = identity.duplicates()
+    assert canonical["paper_url"] == first["paper_url"]
+    assert [duplicate["paper_url"] for duplicate in duplicates] == [revised["paper_url"]]
+    identity.close()
+
+
+def test_repeated_rows_are_only_counted_and_changed_rows_matched_again(tmp_path):
+    identity = open_identity(str(tmp_path))
+    row = make_row(1, "Deep Residual Learning for Image Recognition")
+    identity.add([row])
+    assert identity.add([row, dict(row)])["repeated"] == 2
+    assert identity.stats()["papers"] == 1
+
+    changed = {**row, "authors": "Kaiming He, Jian Sun"}
+    assert identity.add([changed])["updated"] == 1
+    assert identity.stats()["papers"] == 1
+    assert identity.author("Xiangyu Zhang")["papers"] == []
+    assert [paper["paper_url"] for paper in identity.author("Jian Sun")["papers"]] == [row["paper_url"]]
+    identity.close()
+
+
+def test_author_ids_are_stable_across_spellings_and_directories(tmp_path):
+    assert author_id("José  M. Pérez") == author_id("jose m perez") != author_id("Jose Perez")
+    first = open_identity(str(tmp_path / "first"))
+    second = open_identity(str(tmp_path / "second"))
+    first.add([make_row(1, "Paper One", "José M. Pérez"),
+               make_row(2, "Paper Two", "Jose M Perez, Kaiming He", year=2021)])
+    second.add([make_row(9, "Paper Nine", "JOSE M. PEREZ")])
+
+    author = first.author("José M. Pérez")
+    assert author["author_id"] == second.author("jose m perez")["author_id"]
+    assert author["name"] == "José M. Pérez"
+    assert [(paper["year"], paper["title"], paper["position"]) for paper in author["papers"]] == \
+        [("2020", "Paper One", 0), ("2021", "Paper Two", 0)]
+    assert first.author(author["author_id"]) == author
+    assert first.author("Nobody") is None
+    assert [(row["name"], row["papers"]) for row in first.top_authors(1)] == [("José M. Pérez", 2)]
+    first.close()
+    second.close()
+
+
+def test_the_index_survives_a_reopen(tmp_path):
+    identity = open_identity(str(tmp_path))
+    identity.add([make_row(1, "Deep Residual Learning for Image Recognition")])
+    identity.close()
+
+    reopened = IdentityIndex(str(tmp_path / IDENTITY_FILENAME))
+    counts = reopened.add([make_row(2, "DEEP RESIDUAL LEARNING FOR IMAGE RECOGNITION", year=2022)])
+    assert counts["title"] == 1
+    assert reopened.stats() == {"papers": 2, "distinct_papers": 1, "title_duplicates": 1, "near_duplicates": 0,
+                                "authors": 2}
+    reopened.close()
+
+
+def test_build_only_counts_rows_it_has_seen(tmp_path):
+    output_dir = str(tmp_path)
+    for year, title in ((2020, "Deep Residual Learning"), (2021, "deep residual learning!")):
+        sink = MetadataSink(output_dir, "csv")
+        sink.write(make_row(1, title, year=year))
+        sink.close()
+    messages = []
+    build(output_dir, "csv", log=messages.append)
+    assert messages[:2] == ["Year 2020: 1 new, 0 same title, 0 near duplicates, 0 already indexed, 0 changed",
+                            "Year 2021: 0 new, 1 same title, 0 near duplicates, 0 already indexed, 0 changed"]
+
+    messages = []
+    build(output_dir, "csv", years=["2021"], log=messages.append)
+    assert messages[0] == "Year 2021: 0 new, 0 same title, 0 near duplicates, 1 already indexed, 0 changed"
+
+
+def test_normalized_titles_fold_accents_and_punctuation():
+    assert normalize_title("Graph  Neural Networks: A Review.") == "graph neural networks a review"
+    assert normalize_title("Réseaux_de neurones") == "reseaux de neurones"
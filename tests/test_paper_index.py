@@ -0,0 +1,159 @@
+import os
+import queue
+import threading
+
+import pytest
+
+import crawler
+import paper_index
+from paper_index import PaperIndex, open_index, build, index_path, split_labels, MANIFEST_FILENAME
+from metadata_sink import MetadataSink
+
+PAPERS = [
+    ("Graph Neural Networks for Molecules", "Seongmin Ok, José M. Pérez", "Message passing over molecular graphs."),
+    ("Attention Is All You Need", "Ashish Vaswani, Noam Shazeer", "Attention replaces recurrence in translation."),
+    ("Graph Attention Networks", "Petar Velickovic, Yoshua Bengio", "Attention over graph neighbourhoods."),
+    ("Deep Residual Learning", "Kaiming He", "Residual connections make deep networks trainable."),
+]
+
+
+@pytest.fixture(autouse=True)
+def fresh_indexes(monkeypatch):
+    """open_index keeps one index per directory for the whole process; each test starts without any."""
+    monkeypatch.setattr(paper_index, "_indexes", {})
+
+
+def make_row(number, year=2020, annotation=""):
+    title, authors, abstract = PAPERS[number % len(PAPERS)]
+    return {"title": title, "authors": authors, "abstract": abstract, "pdf_url": "", "year": year,
+            "paper_url": f"http://example.org/paper/{number}", "annotation": annotation}
+
+
+def found(index, *args, **kwargs):
+    """The paper numbers a search returns, in ranked order."""
+    return [result["paper_url"].rsplit("/", 1)[1] for result in index.search(*args, **kwargs)]
+
+
+def test_flushed_batches_are_searchable_after_a_reopen(tmp_path):
+    index = PaperIndex(str(tmp_path))
+    assert index.add([make_row(0), make_row(1)]) == 2
+    assert index.search("graph") == []
+    assert index.flush() == 2
+    index.add([make_row(2), make_row(3)])
+    index.close()
+
+    reopened = PaperIndex(str(tmp_path))
+    assert len(reopened) == 4 and len(reopened.segments) == 2
+    assert sorted(found(reopened, "graph")) == ["0", "2"]
+    assert found(reopened, "graph attention", match="all") == ["2"]
+    assert found(reopened, "graph -molecular") == ["2"]
+    assert found(reopened, 'author:"Jose M Perez"') == ["0"]
+    reopened.close()
+
+
+def test_unchanged_rows_are_not_indexed_again(tmp_path):
+    index = PaperIndex(str(tmp_path))
+    index.add([make_row(0), make_row(1)])
+    index.flush()
+    assert index.add([make_row(0), make_row(1)]) == 0
+    assert index.flush() == 0
+    assert len(index.segments) == 1
+    index.close()
+
+
+def test_a_labelled_row_supersedes_its_earlier_document(tmp_path):
+    index = PaperIndex(str(tmp_path))
+    index.add([make_row(0), make_row(2)])
+    index.flush()
+    assert index.add([make_row(0, annotation="**3. Graph Learning** (and chemistry)")]) == 1
+    index.flush()
+
+    assert len(index) == 2
+    assert sorted(found(index, "graph")) == ["0", "2"]
+    assert found(index, label="graph learning") == ["0"]
+    assert index.facet_counts("label") == {"graph learning": 1}
+    assert index.facet_counts("year") == {"2020": 2}
+    index.close()
+
+    # A reader opening the directory later sees the same live documents.
+    reopened = PaperIndex(str(tmp_path))
+    assert found(reopened, "molecules") == ["0"]
+    assert [result["labels"] for result in reopened.search("molecules")] == [["graph learning"]]
+    reopened.close()
+
+
+def test_compaction_drops_superseded_documents(tmp_path, monkeypatch):
+    monkeypatch.setattr(paper_index, "MAX_SEGMENTS", 2)
+    index = PaperIndex(str(tmp_path))
+    for annotation in ("", "Deep Learning", "Optimization"):
+        index.add([make_row(0, annotation=annotation), make_row(1)])
+        index.flush()
+    assert len(index.segments) == 1
+    assert index.manifest["superseded"] == []
+    assert sum(len(segment.docs) for segment in index.segments) == 2
+    assert found(index, "attention") == ["1"]
+    assert found(index, label="optimization") == ["0"]
+    assert sorted(name for name in os.listdir(str(tmp_path)) if name != MANIFEST_FILENAME) == \
+        [index.segments[0].name + suffix for suffix in (".docs.jsonl", ".postings", ".terms.json")]
+    index.close()
+
+
+def test_bm25_ranks_the_denser_match_first(tmp_path):
+    index = PaperIndex(str(tmp_path))
+    long_abstract = "We study sequence models. " + "Recurrent networks process tokens one at a time. " * 10
+    index.add([{**make_row(1), "abstract": long_abstract + "Attention helps."},
+               {**make_row(3), "paper_url": "http://example.org/paper/4", "abstract": "Attention, attention."},
+               make_row(3)])
+    index.flush()
+    results = index.search("attention")
+    assert [result["paper_url"][-1] for result in results] == ["4", "1"]
+    assert results[0]["score"] > results[1]["score"] > 0
+    assert found(index, "attention", year=2021) == []
+    assert found(index, "attention", limit=1) == ["4"]
+    index.close()
+
+
+def test_build_catches_up_and_skips_what_is_indexed(tmp_path):
+    output_dir = str(tmp_path)
+    for year in (2020, 2021):
+        sink = MetadataSink(output_dir, "csv")
+        for number in range(2):
+            sink.write(make_row(number + 2 * (year - 2020), year))
+        sink.close()
+    messages = []
+    index = build(output_dir, "csv", log=messages.append)
+    assert messages[:2] == ["Year 2020: 2 rows, 2 new or changed", "Year 2021: 2 rows, 2 new or changed"]
+    assert found(index, year=2021) == ["2", "3"]
+
+    messages = []
+    build(output_dir, "csv", log=messages.append)
+    assert messages == ["Year 2020: 2 rows, 0 new or changed", "Year 2021: 2 rows, 0 new or changed",
+                        "Index: 4 papers in 1 segments"]
+    index.close()
+
+
+def test_the_metadata_writer_feeds_the_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(MetadataSink, "maybe_checkpoint", MetadataSink.checkpoint)
+    output_dir = str(tmp_path)
+    metadata_queue, stop_writer = queue.Queue(), threading.Event()
+    writer = threading.Thread(target=crawler.metadata_writer,
+                              args=(metadata_queue, stop_writer, output_dir, lambda message: None),
+                              kwargs={"metadata_format": "csv", "identity_index": False})
+    writer.start()
+    for number in range(4):
+        metadata_queue.put(make_row(number))
+    stop_writer.set()
+    writer.join(30)
+    assert not writer.is_alive()
+
+    index = PaperIndex(index_path(output_dir))
+    assert len(index) == 4
+    assert found(index, "residual") == ["3"]
+    index.close()
+    assert open_index(output_dir).add([make_row(number) for number in range(4)]) == 0
+
+
+def test_labels_drop_markdown_numbering_and_asides():
+    assert split_labels("**5. Optimization** (and potentially Deep Learning)\nMore text") == ["optimization"]
+    assert split_labels("Deep Learning, Computer Vision") == ["deep learning", "computer vision"]
+    assert split_labels("") == []
@@ -0,0 +1,59 @@
+import pytest
+
+from parsers import EXTRACTORS
+from parse_parity import CORPUS_DIR, BASE_URL, corpus_pages
+
+PAPER_PAGE = """<!doctype html>
+<html><body><div class="container-fluid"><div class="col p-3">
+<h4>{snippet} Title</h4>
+<h4>Authors</h4>
+<p><i>{snippet}</i></p>
+<h4>Abstract</h4>
+<p>{snippet}</p>
+<a href="/paper/x-Paper.pdf">{link}</a>
+</div></div></body></html>
+"""
+
+# Markup html.parser reports through handle_decl, handle_pi, unknown_decl and handle_comment.
+SNIPPETS = [
+    "<p><![CDATA[foo]]>bar</p>",
+    "a <?pi x?> b",
+    "a <!DOCTYPE x> b",
+    "a <![CDATA[ b ]]> c",
+    "a <![CDATA[]]> b",
+    "a <!----> b",
+    "a <!-- note --> b",
+    "a <![if !IE]> b <![endif]> c",
+    "<script>a <![CDATA[b]]> c</script> d",
+    "<template><![CDATA[b]]> c</template> d",
+    "<!DOCTYPE>",
+]
+
+LINKS = ["Paper", "<![CDATA[Paper]]>", "<!--Paper-->", "<?Paper>", "<!DOCTYPE Paper>", "Pa<![CDATA[per]]>"]
+
+
+def assert_same_as_bs4(kind, html):
+    expected = EXTRACTORS["bs4"][kind](html, BASE_URL)
+    for backend, functions in EXTRACTORS.items():
+        assert functions[kind](html, BASE_URL) == expected, backend
+
+
+@pytest.mark.parametrize("name, kind, html", list(corpus_pages(CORPUS_DIR)), ids=lambda value: str(value)[:40])
+def test_corpus_pages_match_bs4(name, kind, html):
+    assert_same_as_bs4(kind, html)
+
+
+@pytest.mark.parametrize("snippet", SNIPPETS)
+@pytest.mark.parametrize("link", LINKS)
+def test_declarations_match_bs4(snippet, link):
+    assert_same_as_bs4("paper", PAPER_PAGE.format(snippet=snippet, link=link))
+
+
+@pytest.mark.parametrize("snippet, text", [
+    ("<p><![CDATA[foo]]>bar</p>", "foobar"),
+    ("a <?pi x?> b", "ab"),
+    ("a <!DOCTYPE x> b", "ab"),
+])
+def test_declarations_split_text_like_bs4(snippet, text):
+    record = EXTRACTORS["fast"]["paper"](PAPER_PAGE.format(snippet=snippet, link="Paper"), BASE_URL)
+    assert record["abstract"] == text
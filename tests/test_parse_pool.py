@@ -0,0 +1,138 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import requests
+
+from parsers import parse_paper_links, get_extractor
+from parse_pool import ParsePool, AsyncParseBatcher, run_staged, parse_batch
+
+
+class ThreadParsePool:
+    """ParsePool's interface on a thread pool, so tests need not spawn processes; broken pools refuse work."""
+
+    def __init__(self, batch_size=4, broken=False):
+        self.batch_size = batch_size
+        self.workers = 1
+        self.broken = broken
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, pages, base_url):
+        if self.broken:
+            raise BrokenProcessPool("A process in the process pool was terminated abruptly")
+        return self.executor.submit(parse_batch, pages, base_url, get_extractor())
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def paper_urls(base_url, count):
+    return parse_paper_links(requests.get(base_url + "/paper_files/paper/2020", timeout=10).text, base_url)[:count]
+
+
+def stage(paper_links, parse_pool, fetch=None, finish=None):
+    """Runs run_staged on a thread; returns (finished urls, {failed url: error}) once it ends, failing on a hang."""
+    finished, failed = [], {}
+
+    def default_fetch(paper_url):
+        return requests.get(paper_url, timeout=10).text, None
+
+    def default_finish(paper_url, record, context):
+        finished.append(paper_url)
+
+    runner = threading.Thread(target=run_staged, daemon=True, args=(
+        paper_links, fetch or default_fetch, finish or default_finish, failed.__setitem__, "",
+        2, parse_pool, threading.Event(), lambda message: None))
+    runner.start()
+    runner.join(30)
+    assert not runner.is_alive(), "run_staged hung"
+    return finished, failed
+
+
+def test_pages_are_fetched_parsed_and_finished(site):
+    base_url, _ = site
+    links = paper_urls(base_url, 10)
+    parse_pool = ThreadParsePool()
+    try:
+        finished, failed = stage(links, parse_pool)
+    finally:
+        parse_pool.shutdown()
+    assert sorted(finished) == sorted(links)
+    assert failed == {}
+
+
+def test_process_pool_parses_pages(site):
+    base_url, _ = site
+    links = paper_urls(base_url, 5)
+    records = {}
+    parse_pool = ParsePool(workers=1)
+    try:
+        _, failed = stage(links, parse_pool, finish=lambda url, record, context: records.update({url: record}))
+    finally:
+        parse_pool.shutdown()
+    assert failed == {}
+    assert sorted(records) == sorted(links)
+    assert all(record["title"] and record["pdf_url"] for record in records.values())
+
+
+def test_a_broken_pool_fails_its_papers_instead_of_hanging(site):
+    base_url, _ = site
+    links = paper_urls(base_url, 6)
+    finished, failed = stage(links, ThreadParsePool(broken=True))
+    assert finished == []
+    assert sorted(failed) == sorted(links)
+    assert all(isinstance(error, BrokenProcessPool) for error in failed.values())
+
+
+def test_fetch_and_finish_errors_reach_fail(site):
+    base_url, _ = site
+    links = paper_urls(base_url, 6)
+
+    def fetch(paper_url):
+        if paper_url == links[0]:
+            raise ConnectionResetError("reset by peer")
+        return requests.get(paper_url, timeout=10).text, None
+
+    def finish(paper_url, record, context):
+        if paper_url == links[1]:
+            raise KeyError("pdf_url")
+
+    parse_pool = ThreadParsePool()
+    try:
+        _, failed = stage(links, parse_pool, fetch, finish)
+    finally:
+        parse_pool.shutdown()
+    assert sorted(failed) == sorted(links[:2])
+    assert isinstance(failed[links[0]], ConnectionResetError)
+    assert isinstance(failed[links[1]], KeyError)
+
+
+def test_async_batcher_fails_pages_when_the_pool_is_broken():
+    batcher = AsyncParseBatcher(ThreadParsePool(broken=True), "")
+
+    async def main():
+        return await asyncio.gather(*(batcher.parse(f"http://example.org/{number}", "<html></html>")
+                                      for number in range(3)), return_exceptions=True)
+
+    results = asyncio.run(asyncio.wait_for(main(), 10))
+    assert all(isinstance(result, BrokenProcessPool) for result in results)
+    assert batcher.in_flight == 0
+
+
+def test_async_batcher_resolves_parsed_pages(site):
+    base_url, _ = site
+    links = paper_urls(base_url, 5)
+    pages = [requests.get(url, timeout=10).text for url in links]
+    parse_pool = ThreadParsePool(batch_size=2)
+    batcher = AsyncParseBatcher(parse_pool, base_url)
+
+    async def main():
+        return await asyncio.gather(*(batcher.parse(url, html) for url, html in zip(links, pages)))
+
+    try:
+        records = asyncio.run(asyncio.wait_for(main(), 10))
+    finally:
+        parse_pool.shutdown()
+    expected = [record for _, record, _, _ in parse_batch(list(zip(links, pages)), base_url, get_extractor())]
+    assert records == expected
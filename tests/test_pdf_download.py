@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+
+import pytest
+import requests
+
+import crawler
+from transport import Transport
+from parsers import parse_paper_links, parse_paper
+from pdf_download import (download_file, record_failure, read_retry_queue, remove_from_retry_queue, part_path,
+                          DownloadError, DownloadStopped, FAILED_DIRNAME, RETRY_QUEUE)
+
+
+def pdf_urls(base_url, count):
+    year_page = requests.get(base_url + "/paper_files/paper/2020", timeout=10).text
+    return [parse_paper(requests.get(url, timeout=10).text, base_url)["pdf_url"]
+            for url in parse_paper_links(year_page, base_url)[:count]]
+
+
+def bytes_sent_since(faults, before):
+    """The simulator counts a body after its last write returns, which can be after the client has it all."""
+    deadline = time.monotonic() + 5
+    while faults.stats()["bytes"] == before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return faults.stats()["bytes"] - before
+
+
+def sha256_of(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+@pytest.fixture
+def transport():
+    client = Transport(pool_size=2)
+    yield client
+    client.close()
+
+
+def test_download_is_verified_and_renamed_into_place(site, transport, tmp_path):
+    base_url, _ = site
+    url = pdf_urls(base_url, 1)[0]
+    body = requests.get(url, timeout=10).content
+    path = str(tmp_path / "paper.pdf")
+    size, sha256 = download_file(transport, url, path, 10, threading.Event())
+    assert size == len(body)
+    assert sha256 == hashlib.sha256(body).hexdigest() == sha256_of(path)
+    assert not os.path.exists(part_path(path))
+
+
+def test_cut_off_download_resumes_with_a_range_request(make_site, transport, tmp_path):
+    base_url, faults = make_site("--pdf-kb", "512")
+    url = pdf_urls(base_url, 1)[0]
+    body = requests.get(url, timeout=10).content
+    path = str(tmp_path / "paper.pdf")
+
+    faults.drop_rate = 1.0
+    with pytest.raises((DownloadError, requests.RequestException)):
+        download_file(transport, url, path, 10, threading.Event())
+    kept = os.path.getsize(part_path(path))
+    assert 0 < kept <= len(body) // 2
+    assert not os.path.exists(path)
+
+    faults.drop_rate = 0.0
+    sent_before = faults.stats()["bytes"]
+    size, sha256 = download_file(transport, url, path, 10, threading.Event())
+    assert bytes_sent_since(faults, sent_before) == len(body) - kept
+    assert size == len(body)
+    assert sha256 == hashlib.sha256(body).hexdigest() == sha256_of(path)
+
+
+def test_part_file_restarts_when_the_server_ignores_range(site, transport, tmp_path):
+    base_url, faults = site
+    url = pdf_urls(base_url, 1)[0]
+    body = requests.get(url, timeout=10).content
+    path = str(tmp_path / "paper.pdf")
+    with open(part_path(path), "wb") as f:
+        f.write(b"stale bytes from another version of the file")
+
+    faults.ignore_range = True
+    keep = bytearray()
+    size, sha256 = download_file(transport, url, path, 10, threading.Event(), keep)
+    assert size == len(body)
+    assert bytes(keep) == body
+    assert sha256 == hashlib.sha256(body).hexdigest() == sha256_of(path)
+
+
+def test_resumed_checksum_covers_the_bytes_already_on_disk(site, transport, tmp_path):
+    base_url, _ = site
+    url = pdf_urls(base_url, 1)[0]
+    body = requests.get(url, timeout=10).content
+    path = str(tmp_path / "paper.pdf")
+    with open(part_path(path), "wb") as f:
+        f.write(body[:1000])
+    keep = bytearray()
+    size, sha256 = download_file(transport, url, path, 10, threading.Event(), keep)
+    assert (size, sha256) == (len(body), hashlib.sha256(body).hexdigest())
+    assert bytes(keep) == body
+
+
+def test_a_body_that_is_not_a_pdf_is_discarded(site, transport, tmp_path):
+    base_url, _ = site
+    path = str(tmp_path / "paper.pdf")
+    with pytest.raises(DownloadError, match="not a PDF"):
+        download_file(transport, base_url + "/paper_files/paper/2020", path, 10, threading.Event())
+    assert not os.path.exists(path)
+    assert not os.path.exists(part_path(path))
+
+
+def test_stop_keeps_the_part_file(site, transport, tmp_path):
+    base_url, _ = site
+    url = pdf_urls(base_url, 1)[0]
+    path = str(tmp_path / "paper.pdf")
+    stop_event = threading.Event()
+    stop_event.set()
+    with pytest.raises(DownloadStopped):
+        download_file(transport, url, path, 10, stop_event)
+    assert os.path.exists(part_path(path))
+    assert not os.path.exists(path)
+
+
+def test_retry_queue_keeps_entries_until_they_succeed(tmp_path):
+    output_dir = str(tmp_path)
+    for url in ["http://example.org/a.pdf", "http://example.org/b.pdf", "http://example.org/a.pdf"]:
+        record_failure(output_dir, url, os.path.basename(url), 2020, None, "timed out")
+    assert [entry["url"] for entry in read_retry_queue(output_dir)] == \
+        ["http://example.org/a.pdf", "http://example.org/b.pdf"]
+    assert len(read_retry_queue(output_dir)) == 2
+
+    remove_from_retry_queue(output_dir, ["http://example.org/a.pdf"])
+    assert [entry["url"] for entry in read_retry_queue(output_dir)] == ["http://example.org/b.pdf"]
+    with open(os.path.join(output_dir, FAILED_DIRNAME, RETRY_QUEUE), encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+
+
+def test_legacy_failures_are_moved_into_the_queue(tmp_path):
+    failed_dir = tmp_path / FAILED_DIRNAME
+    failed_dir.mkdir()
+    (failed_dir / "failed_pdfs.txt").write_text(
+        "Failed to download http://example.org/paper/2019/file/x-Paper.pdf: timed out\n", encoding="utf-8")
+    entries = read_retry_queue(str(tmp_path))
+    assert entries == [{"url": "http://example.org/paper/2019/file/x-Paper.pdf", "filename": "x-Paper",
+                        "year": "2019", "paper_url": None}]
+    assert read_retry_queue(str(tmp_path)) == entries
+
+
+def queued_urls(output_dir):
+    path = os.path.join(output_dir, FAILED_DIRNAME, RETRY_QUEUE)
+    with open(path, encoding="utf-8") as f:
+        return sorted(json.loads(line)["url"] for line in f)
+
+
+def test_a_stopped_retry_pass_loses_nothing(site, tmp_path):
+    base_url, _ = site
+    urls = pdf_urls(base_url, 3)
+    output_dir = str(tmp_path)
+    for url in urls:
+        record_failure(output_dir, url, os.path.basename(url), 2020, None, "timed out")
+    stop_event = threading.Event()
+    stop_event.set()
+    crawler.retry_failed_pdfs(output_dir, 2, 10, stop_event, lambda message: None,
+                              lambda year: None, lambda *args: None)
+    assert queued_urls(output_dir) == sorted(urls)
+
+
+def test_successful_retries_leave_the_queue(site, tmp_path):
+    base_url, faults = site
+    urls = pdf_urls(base_url, 3)
+    output_dir = str(tmp_path)
+    for url in urls:
+        record_failure(output_dir, url, os.path.basename(url), 2020, None, "timed out")
+    missing = urls[0].replace("-Paper.pdf", "0-Paper.pdf")
+    record_failure(output_dir, missing, "missing", 2020, None, "timed out")
+    crawler.retry_failed_pdfs(output_dir, 2, 10, threading.Event(), lambda message: None,
+                              lambda year: None, lambda *args: None)
+    assert queued_urls(output_dir) == [missing]
+    assert len(os.listdir(os.path.join(output_dir, "2020"))) >= 3
+
+
+def test_async_backoff_wait_ends_when_stopped():
+    async_engine = pytest.importorskip("async_engine")
+    stop_event = threading.Event()
+
+    async def main():
+        asyncio.get_running_loop().call_later(0.05, stop_event.set)
+        started = asyncio.get_running_loop().time()
+        stopped = await async_engine.wait_stopped(stop_event, 30)
+        return stopped, asyncio.get_running_loop().time() - started
+
+    stopped, elapsed = asyncio.run(main())
+    assert stopped
+    assert elapsed < 1
+    assert asyncio.run(async_engine.wait_stopped(threading.Event(), 0.05)) is False
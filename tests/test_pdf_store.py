@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+import threading
+
+import pytest
+
+import crawler
+from pdf_store import PdfStore, open_store, MANIFEST_FILENAME
+from test_pdf_download import pdf_urls
+
+PDF = b"%PDF-1.4\n% one paper\n%%EOF\n"
+OTHER_PDF = b"%PDF-1.4\n% another paper\n%%EOF\n"
+
+
+@pytest.fixture(autouse=True)
+def fresh_stores(monkeypatch):
+    """open_store keeps one store per directory for the whole process; each test starts without any."""
+    monkeypatch.setattr("pdf_store._stores", {})
+
+
+def stage(store, url, body):
+    """Writes body where a finished download of url would be; returns (staged path, sha256)."""
+    path = store.staging_path(url)
+    with open(path, "wb") as f:
+        f.write(body)
+    return path, hashlib.sha256(body).hexdigest()
+
+
+def add(store, paper_url, body, name, year=2020):
+    return store.add(year, paper_url, *stage(store, paper_url + ".pdf", body), name)
+
+
+def manifest_lines(output_dir, year=2020):
+    with open(os.path.join(output_dir, str(year), MANIFEST_FILENAME), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_title_clashes_get_numbered_names(tmp_path):
+    store = PdfStore(str(tmp_path))
+    first = add(store, "http://example.org/a", PDF, "Attention")
+    second = add(store, "http://example.org/b", OTHER_PDF, "attention")
+    third = add(store, "http://example.org/c", PDF + b"\n", "Attention")
+    assert [os.path.basename(path) for path in (first, second, third)] == \
+        ["Attention.pdf", "attention_2.pdf", "Attention_3.pdf"]
+    with open(first, "rb") as f:
+        assert f.read() == PDF
+    with open(second, "rb") as f:
+        assert f.read() == OTHER_PDF
+    assert store.stats()["renamed"] == 2
+
+
+def test_identical_pdfs_share_one_blob(tmp_path):
+    store = PdfStore(str(tmp_path))
+    first = add(store, "http://example.org/a", PDF, "First")
+    second = add(store, "http://example.org/b", PDF, "Second")
+    blob = store.blob_path(hashlib.sha256(PDF).hexdigest())
+    assert os.path.samefile(first, blob) and os.path.samefile(second, blob)
+    assert len(os.listdir(os.path.dirname(blob))) == 1
+    assert store.stats()["stored"] == 1 and store.stats()["deduplicated"] == 1
+    assert os.listdir(os.path.join(store.blob_dir, "incoming")) == []
+
+
+def test_a_paper_keeps_its_name_when_added_again(tmp_path):
+    store = PdfStore(str(tmp_path))
+    add(store, "http://example.org/a", PDF, "Attention")
+    add(store, "http://example.org/b", OTHER_PDF, "Attention")
+    again = add(store, "http://example.org/b", OTHER_PDF, "Attention")
+    assert os.path.basename(again) == "Attention_2.pdf"
+    assert len(manifest_lines(str(tmp_path))) == 2
+
+    changed = add(store, "http://example.org/b", OTHER_PDF + b"\n", "Attention")
+    assert os.path.basename(changed) == "Attention_2.pdf"
+    assert len(manifest_lines(str(tmp_path))) == 3
+    reopened = PdfStore(str(tmp_path))
+    assert reopened.lookup(2020, "http://example.org/b")[2] == hashlib.sha256(OTHER_PDF + b"\n").hexdigest()
+
+
+def test_names_and_lookups_survive_a_restart(tmp_path):
+    store = PdfStore(str(tmp_path))
+    path = add(store, "http://example.org/a", PDF, "Attention")
+    os.remove(path)
+
+    reopened = PdfStore(str(tmp_path))
+    assert reopened.lookup(2020, "http://example.org/a") == (path, len(PDF), hashlib.sha256(PDF).hexdigest())
+    assert os.path.exists(path)
+    assert reopened.lookup(2020, "http://example.org/unknown") is None
+    renamed = add(reopened, "http://example.org/b", OTHER_PDF, "ATTENTION")
+    assert os.path.basename(renamed) == "ATTENTION_2.pdf"
+
+    os.remove(reopened.blob_path(hashlib.sha256(PDF).hexdigest()))
+    assert PdfStore(str(tmp_path)).lookup(2020, "http://example.org/a") is None
+
+
+def test_years_keep_separate_names(tmp_path):
+    store = PdfStore(str(tmp_path))
+    assert os.path.basename(add(store, "http://example.org/a", PDF, "Attention", 2020)) == "Attention.pdf"
+    assert os.path.basename(add(store, "http://example.org/b", PDF, "Attention", 2021)) == "Attention.pdf"
+    assert store.stats()["deduplicated"] == 1
+
+
+def test_downloads_that_clash_or_repeat_are_stored_once(site, tmp_path):
+    base_url, _ = site
+    urls = pdf_urls(base_url, 2)
+    output_dir = str(tmp_path)
+    messages = []
+
+    def download(url, paper_url):
+        return crawler.download_pdf(url, "Same title", 2020, output_dir, 10, threading.Event(), messages.append,
+                                    lambda year: None, lambda *args: None, paper_url)
+
+    first = download(urls[0], "http://example.org/paper/1")
+    second = download(urls[1], "http://example.org/paper/2")
+    mirror = download(urls[0], "http://example.org/paper/3")
+    again = download(urls[0], "http://example.org/paper/1")
+    assert [os.path.basename(result[0]) for result in (first, second, mirror)] == \
+        ["Same title.pdf", "Same title_2.pdf", "Same title_3.pdf"]
+    assert again == first
+    assert mirror[2] == first[2] != second[2]
+    assert open_store(output_dir).stats() == {"stored": 2, "deduplicated": 1, "renamed": 2, "known": 1}
+    assert messages[-1] == "Already stored: Same title"
@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import crawler
+import shard_crawl
+from metadata_sink import MetadataSink, read_rows
+from shard_crawl import WorkQueue, enqueue_years, run_worker, merge_shards, queue_path
+
+URLS = [f"http://example.org/paper/{number}" for number in range(6)]
+
+
+class Clock:
+    """Stands in for the time module so tests decide when a lease runs out."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(shard_crawl, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def work(tmp_path):
+    queue = WorkQueue(str(tmp_path / "work_queue.sqlite3"))
+    queue.enqueue(2020, URLS)
+    yield queue
+    queue.close()
+
+
+def statuses(work):
+    return work.status()[0]
+
+
+def test_papers_are_leased_once_in_enqueue_order(work, clock):
+    assert work.enqueue(2020, URLS[:2] + ["http://example.org/paper/new"]) == 1
+    first, _ = work.claim("a", 4, lease_seconds=60)
+    second, _ = work.claim("b", 4, lease_seconds=60)
+    assert [url for url, _ in first] == URLS[:4]
+    assert [url for url, _ in second] == URLS[4:] + ["http://example.org/paper/new"]
+    assert work.claim("c", 4) == ([], 0)
+
+
+def test_an_expired_lease_goes_to_the_next_worker(work, clock):
+    work.claim("a", 2, lease_seconds=60)
+    clock.now += 59
+    assert work.claim("b", 0, lease_seconds=60) == ([], 0)
+    clock.now += 2
+    tasks, expired = work.claim("b", 2, lease_seconds=60)
+    assert expired == 2
+    assert [url for url, _ in tasks] == URLS[:2]
+
+    # The first worker finishing late still counts; its failure report no longer does.
+    work.complete("a", [URLS[0]])
+    work.fail("a", {URLS[1]: "timed out"})
+    assert statuses(work) == {"done": 1, "leased": 1, "pending": 4}
+
+
+def test_renewed_leases_do_not_expire(work, clock):
+    work.claim("a", 2, lease_seconds=60)
+    for _ in range(5):
+        clock.now += 45
+        work.renew("a", lease_seconds=60)
+        assert work.claim("b", 0) == ([], 0)
+    assert statuses(work)["leased"] == 2
+
+
+def test_papers_whose_leases_keep_expiring_are_given_up(work, clock):
+    for attempt in range(shard_crawl.MAX_ATTEMPTS):
+        tasks, _ = work.claim(f"worker-{attempt}", 1, lease_seconds=60)
+        assert [url for url, _ in tasks] == URLS[:1]
+        clock.now += 61
+    work.claim("last", 0)
+    assert statuses(work) == {"failed": 1, "pending": 5}
+
+
+def test_failures_are_retried_until_out_of_attempts(work, clock):
+    for attempt in range(shard_crawl.MAX_ATTEMPTS):
+        work.claim("a", 1)
+        work.fail("a", {URLS[0]: f"error {attempt}"})
+    assert statuses(work) == {"failed": 1, "pending": 5}
+
+
+def test_released_leases_do_not_use_up_attempts(work, clock):
+    for _ in range(shard_crawl.MAX_ATTEMPTS + 2):
+        work.claim("a", 1)
+        work.release("a")
+    tasks, _ = work.claim("b", 1)
+    assert [url for url, _ in tasks] == URLS[:1]
+
+
+def crawl_options(base_url, output_dir):
+    return {**crawler.default_options(), "base_url": base_url, "output_dir": output_dir, "scrape_type": "Both",
+            "thread_count": 4, "cache_mode": "off", "metadata_format": "csv", "search_index": False,
+            "identity_index": False}
+
+
+def crawl_shard(options, worker_id, papers):
+    """Runs a worker until `papers` more papers are done, then stops it."""
+    work = WorkQueue(queue_path(options["output_dir"]))
+    target = statuses(work).get("done", 0) + papers
+    stop_event = threading.Event()
+    worker = threading.Thread(target=run_worker, args=(options, worker_id, stop_event, lambda message: None),
+                              kwargs={"batch_size": 4}, daemon=True)
+    worker.start()
+    while worker.is_alive() and statuses(work).get("done", 0) < target:
+        worker.join(0.05)
+    stop_event.set()
+    worker.join(30)
+    assert not worker.is_alive()
+    assert statuses(work).get("done", 0) == target
+    work.close()
+
+
+def crawl_and_merge(base_url, output_dir, layout):
+    """Crawls with the given (worker, papers held back from it) layout and merges; returns the merged output."""
+    options = crawl_options(base_url, output_dir)
+    assert enqueue_years(options, lambda message: None) == 20
+    for worker_id, held_back in layout:
+        work = WorkQueue(queue_path(output_dir))
+        work.claim("held", held_back, lease_seconds=3600)
+        crawl_shard(options, worker_id, 20 - statuses(work).get("done", 0) - held_back)
+        work.release("held")
+        work.close()
+    merge_shards(output_dir, "csv", lambda message: None, False, False)
+    return merged_output(output_dir)
+
+
+def merged_output(output_dir):
+    with open(os.path.join(output_dir, "2020", "metadata.csv"), encoding="utf-8") as f:
+        metadata = f.read()
+    with open(os.path.join(output_dir, "2020", "manifest.jsonl"), encoding="utf-8") as f:
+        manifest = f.read()
+    conn = sqlite3.connect(os.path.join(output_dir, "crawl_state.sqlite3"))
+    state = conn.execute("SELECT paper_url, status, title, has_pdf, pdf_size, pdf_sha256, metadata_saved "
+                         "FROM papers ORDER BY rowid").fetchall()
+    conn.close()
+    return metadata, manifest, state
+
+
+def test_merge_does_not_depend_on_which_worker_crawled_what(site, tmp_path, monkeypatch):
+    base_url, _ = site
+    # Papers count as done once their metadata is checkpointed; do that at once rather than every few seconds.
+    monkeypatch.setattr(MetadataSink, "maybe_checkpoint", MetadataSink.checkpoint)
+    monkeypatch.setattr(shard_crawl, "POLL_SECONDS", 0.05)
+    alone = crawl_and_merge(base_url, str(tmp_path / "alone"), [("solo", 0)])
+    # Shard "a" crawls the later papers, so merging shards in name order alone would reorder them.
+    split = crawl_and_merge(base_url, str(tmp_path / "split"), [("a", 8), ("b", 0)])
+    assert split == alone
+    shards = tmp_path / "split" / "shards"
+    assert [len(read_rows(str(shards / worker_id), 2020, "csv")) for worker_id in ("a", "b")] == [12, 8]
+    assert alone[0].count("\n") == 21
+    assert len(alone[2]) == 20 and all(row[1] == "fetched" and row[5] and row[6] for row in alone[2])
+
+    merge_shards(str(tmp_path / "split"), "csv", lambda message: None, False, False)
+    assert merged_output(str(tmp_path / "split")) == alone
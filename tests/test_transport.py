@@ -0,0 +1,92 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import transport
+from transport import Transport
+from parsers import parse_paper_links, parse_paper
+from pdf_download import download_file
+
+
+def test_sequential_requests_reuse_one_connection(site):
+    base_url, _ = site
+    client = Transport(pool_size=4)
+    try:
+        for _ in range(10):
+            assert client.get(base_url + "/paper_files/paper/2020", timeout=10).status_code == 200
+        stats = client.snapshot()
+    finally:
+        client.close()
+    assert stats["requests"] == 10
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 9
+
+
+def test_concurrent_requests_stay_within_the_pool(site):
+    base_url, _ = site
+    client = Transport(pool_size=3)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            statuses = list(executor.map(lambda _: client.get(base_url + "/", timeout=10).status_code, range(40)))
+        stats = client.snapshot()
+    finally:
+        client.close()
+    assert statuses == [200] * 40
+    assert stats["requests"] == 40
+    assert 1 <= stats["connections_opened"] <= 3
+
+
+def test_streamed_pdf_downloads_hand_their_connection_back(site, tmp_path):
+    base_url, _ = site
+    client = Transport(pool_size=4)
+    try:
+        year_page = client.get(base_url + "/paper_files/paper/2020", timeout=10).text
+        for number, paper_url in enumerate(parse_paper_links(year_page, base_url)[:5]):
+            paper = parse_paper(client.get(paper_url, timeout=10).text, base_url)
+            size, _ = download_file(client, paper["pdf_url"], str(tmp_path / f"{number}.pdf"), 10, threading.Event())
+            assert size > 0
+        stats = client.snapshot()
+    finally:
+        client.close()
+    assert stats["requests"] == 11
+    assert stats["connections_opened"] == 1
+
+
+@pytest.mark.skipif(transport.httpx is None, reason="HTTP/2 needs httpx and h2")
+def test_http2_client_reuses_its_connection(site):
+    base_url, _ = site
+    client = Transport(pool_size=4, http2=True)
+    try:
+        for _ in range(10):
+            response = client.get(base_url + "/", timeout=10)
+            assert response.status_code == 200
+            response.close()
+        stats = client.snapshot()
+    finally:
+        client.close()
+    assert stats["requests"] == 10
+    assert stats["connections_opened"] == 1
+
+
+@pytest.mark.skipif(transport.httpx is None, reason="HTTP/2 needs httpx and h2")
+def test_http2_connections_are_told_apart_after_garbage_collection():
+    class Stream:
+        pass
+
+    class Response:
+        def __init__(self, stream):
+            self.extensions = {"network_stream": stream}
+
+    client = Transport(http2=True)
+    try:
+        kept = Stream()
+        for _ in range(3):
+            client._count_http2(Response(kept))
+        for _ in range(5):
+            client._count_http2(Response(Stream()))   # Each is freed at once, so CPython hands its id to the next
+        stats = client.snapshot()
+    finally:
+        client.close()
+    assert stats["requests"] == 8
+    assert stats["connections_opened"] == 6
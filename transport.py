@@ -0,0 +1,200 @@
+import weakref
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import httpx
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is installed)
+except ImportError:
+    httpx = None
+
+POOL_SIZE = 50       # Keep-alive connections kept per host
+POOL_HOSTS = 10      # Distinct hosts with their own pool
+
+
+class ConnectionStats:
+    """Thread-safe counters for requests sent and connections opened."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def add_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def add_connection(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": max(self.requests - self.connections_opened, 0),
+            }
+
+
+def _counting_pool_class(pool_cls, stats):
+    """Builds a urllib3 pool class that counts every request and every new TCP/TLS handshake."""
+    class CountingConnection(pool_cls.ConnectionCls):
+        def connect(self):
+            super().connect()
+            stats.add_connection()
+
+    class CountingPool(pool_cls):
+        ConnectionCls = CountingConnection
+
+        def urlopen(self, *args, **kwargs):
+            stats.add_request()
+            return super().urlopen(*args, **kwargs)
+
+    return CountingPool
+
+
+class CountingAdapter(HTTPAdapter):
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self.stats),
+            "https": _counting_pool_class(HTTPSConnectionPool, self.stats),
+        }
+
+
+class Http2Response:
+    """Gives an httpx response the parts of the requests.Response API the scraper uses."""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+
+    @property
+    def content(self):
+        return self._response.read()
+
+    @property
+    def text(self):
+        self._response.read()
+        return self._response.text
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            self.close()
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def iter_content(self, chunk_size=8192):
+        try:
+            yield from self._response.iter_bytes(chunk_size)
+        except httpx.HTTPError as e:
+            raise requests.ConnectionError(str(e))
+
+    def close(self):
+        self._response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Transport:
+    """Shared keep-alive HTTP client used by every worker thread.
+
+    Uses a pooled requests.Session, or an HTTP/2 httpx.Client when http2 is
+    requested and httpx/h2 are installed.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, http2=False, pool_hosts=POOL_HOSTS):
+        self.pool_size = pool_size
+        self.stats = ConnectionStats()
+        self.http2 = bool(http2 and httpx is not None)
+        if self.http2:
+            # Held weakly: an id() could be reused by a later connection once this one is collected.
+            self._seen_streams = weakref.WeakSet()
+            self._seen_lock = threading.Lock()
+            self._client = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_connections=pool_size * pool_hosts,
+                                    max_keepalive_connections=pool_size * pool_hosts),
+                follow_redirects=True,
+            )
+        else:
+            self._session = requests.Session()
+            adapter = CountingAdapter(self.stats, pool_connections=pool_hosts,
+                                      pool_maxsize=pool_size, pool_block=True)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+
+    def get(self, url, timeout, stream=False, headers=None):
+        """Sends a GET over a pooled connection; stream=True leaves the body unread."""
+        if not self.http2:
+            return self._session.get(url, timeout=timeout, stream=stream, headers=headers)
+        try:
+            request = self._client.build_request("GET", url, headers=headers, timeout=timeout)
+            response = self._client.send(request, stream=stream)
+        except httpx.HTTPError as e:
+            raise requests.ConnectionError(str(e))
+        self._count_http2(response)
+        return Http2Response(response)
+
+    def _count_http2(self, response):
+        self.stats.add_request()
+        stream = response.extensions.get("network_stream")
+        if stream is None:
+            return
+        with self._seen_lock:
+            if stream in self._seen_streams:
+                return
+            self._seen_streams.add(stream)
+        self.stats.add_connection()
+
+    def snapshot(self):
+        stats = self.stats.snapshot()
+        stats["http_version"] = "HTTP/2" if self.http2 else "HTTP/1.1"
+        stats["pool_size"] = self.pool_size
+        return stats
+
+    def close(self):
+        if self.http2:
+            self._client.close()
+        else:
+            self._session.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def configure_transport(pool_size=POOL_SIZE, http2=False):
+    """Replaces the shared transport, e.g. with a new per-host pool size."""
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.close()
+        _transport = Transport(pool_size=pool_size, http2=http2)
+        return _transport
+
+
+def get_transport():
+    """Returns the process-wide transport, creating it with defaults on first use."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport()
+        return _transport
+
+
+def format_stats(stats):
+    return (f"{stats['http_version']}: {stats['requests']} requests over "
+            f"{stats['connections_opened']} connections ({stats['connections_reused']} reused)")
@@ -0,0 +1,122 @@
+"""Coalesced updates from crawl workers to the Tk window.
+
+Workers report log lines, downloads and table rows to a UiEventBus, which
+only appends to bounded buffers under a lock: they never touch Tk, schedule
+callbacks or wait for the UI. The UI thread drains the bus once per frame and
+applies everything that arrived since the previous frame in one go, so the
+cost of a frame is bounded by the buffer sizes, not by how many papers were
+crawled in between. The table is a RowWindow: a ring buffer of rows of which
+only a screenful is ever handed to the Treeview.
+"""
+import threading
+from collections import deque
+
+FRAME_MS = 100             # UI frame interval
+LOG_LINES = 2000           # Lines kept in the log view; older ones are deleted
+FRAME_LOG_LINES = 500      # New lines drawn per frame; the oldest of a larger burst are skipped
+TABLE_ROWS = 50000         # Rows kept for the table view; older ones fall off
+VISIBLE_ROWS = 20
+
+
+class UiEventBus:
+    """Thread-safe, non-blocking mailbox between crawl workers and the UI thread."""
+
+    def __init__(self, frame_log_lines=FRAME_LOG_LINES, table_rows=TABLE_ROWS):
+        self.lock = threading.Lock()
+        self.lines = deque(maxlen=frame_log_lines)
+        self.rows = deque(maxlen=table_rows)
+        self.received = 0
+        self.total = 0
+        self.yearly = {}
+        self.dirty = False
+
+    def log(self, message, tag=None):
+        with self.lock:
+            self.lines.append((message, tag))
+            self.received += 1
+
+    def update_count(self, year):
+        with self.lock:
+            self.total += 1
+            self.yearly[year] = self.yearly.get(year, 0) + 1
+            self.dirty = True
+
+    def update_table(self, year, file_type, name):
+        with self.lock:
+            self.rows.append((year, file_type, name))
+
+    def reset(self):
+        with self.lock:
+            self.lines.clear()
+            self.rows.clear()
+            self.received = 0
+            self.total = 0
+            self.yearly = {}
+            self.dirty = True
+
+    def drain(self):
+        """Takes everything since the last drain: (lines, skipped line count, rows, totals or None if unchanged)."""
+        with self.lock:
+            lines, rows = list(self.lines), list(self.rows)
+            skipped = self.received - len(lines)
+            self.lines.clear()
+            self.rows.clear()
+            self.received = 0
+            totals = (self.total, dict(self.yearly)) if self.dirty else None
+            self.dirty = False
+        return lines, skipped, rows, totals
+
+
+class RowWindow:
+    """The rows of a table view kept in a ring buffer, of which only `visible` are shown at a time.
+
+    While scrolled to the end the window follows new rows; scrolled up, it
+    stays on the same rows (shifting only when old rows fall off the buffer).
+    """
+
+    def __init__(self, visible=VISIBLE_ROWS, capacity=TABLE_ROWS):
+        self.rows = deque(maxlen=capacity)
+        self.visible = visible
+        self.offset = 0
+        self.follow = True
+
+    def extend(self, rows):
+        dropped = max(0, len(self.rows) + len(rows) - self.rows.maxlen)
+        self.rows.extend(rows)
+        if self.follow:
+            self.offset = self._last_offset()
+        else:
+            self.offset = max(0, self.offset - dropped)
+
+    def clear(self):
+        self.rows.clear()
+        self.offset = 0
+        self.follow = True
+
+    def _last_offset(self):
+        return max(0, len(self.rows) - self.visible)
+
+    def scroll_to(self, offset):
+        self.offset = min(max(0, int(offset)), self._last_offset())
+        self.follow = self.offset == self._last_offset()
+
+    def scrollbar_command(self, action, *args):
+        """Handles the arguments a Tk scrollbar passes to its command: moveto / scroll n units|pages."""
+        if action == "moveto":
+            self.scroll_to(float(args[0]) * len(self.rows))
+        elif action == "scroll":
+            step = self.visible if args[1] == "pages" else 1
+            self.scroll_to(self.offset + int(args[0]) * step)
+
+    def view(self):
+        return [self.rows[i] for i in range(self.offset, min(len(self.rows), self.offset + self.visible))]
+
+    def fractions(self):
+        """(first, last) visible fractions, as a Tk scrollbar's set() expects."""
+        if not self.rows:
+            return 0.0, 1.0
+        return self.offset / len(self.rows), min(1.0, (self.offset + self.visible) / len(self.rows))
+
+
+def format_summary(total, yearly):
+    return f"Total Downloads: {total} | " + " | ".join(f"{year}: {count}" for year, count in sorted(yearly.items()))